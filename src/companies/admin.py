@@ -1,10 +1,22 @@
 from django.contrib import admin
 
 # Register your models here.
-from companies.models import Company
+from companies.models import Company, WorkCalendar, Holiday
 
 class CompanyAdmin(admin.ModelAdmin):
     pass
 
 
-admin.site.register(Company, CompanyAdmin)
\ No newline at end of file
+admin.site.register(Company, CompanyAdmin)
+
+
+class HolidayInline(admin.TabularInline):
+    model = Holiday
+    extra = 1
+
+
+class WorkCalendarAdmin(admin.ModelAdmin):
+    inlines = [HolidayInline]
+
+
+admin.site.register(WorkCalendar, WorkCalendarAdmin)
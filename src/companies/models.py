@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 # Create your models here.
 from core.models import Timestamped
@@ -34,4 +37,37 @@ class CompanyProfile(Timestamped):
         ]
 
 
+class WorkCalendar(Timestamped):
+    company = models.OneToOneField("Company", on_delete=models.CASCADE, related_name='work_calendar')
+    name = models.CharField(max_length=100)
+    weekmask = models.CharField(max_length=7, default='1111100', help_text="Working days Monday to Sunday, e.g. 1111100.")
 
+    class Meta:
+        verbose_name = 'work calendar'
+        verbose_name_plural = 'work calendars'
+
+    def __str__(self):
+        return self.name
+
+
+class Holiday(Timestamped):
+    calendar = models.ForeignKey("WorkCalendar", on_delete=models.CASCADE)
+    date = models.DateField()
+    name = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        default_related_name = 'holidays'
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['calendar', 'date'], name='%(app_label)s_%(class)s_unique_calendar_date')
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.name}"
+
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def touch_work_calendar(sender, instance, **kwargs):
+    # The cached holiday tables are keyed by the calendar's ``updated`` stamp.
+    WorkCalendar.objects.filter(pk=instance.calendar_id).update(updated=timezone.now())
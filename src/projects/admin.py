@@ -1,3 +1,18 @@
 from django.contrib import admin
 
 # Register your models here.
+from projects.models import Resource, Assignment
+
+
+class AssignmentInline(admin.TabularInline):
+    model = Assignment
+    extra = 1
+    raw_id_fields = ('task',)
+
+
+class ResourceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'company', 'capacity')
+    inlines = [AssignmentInline]
+
+
+admin.site.register(Resource, ResourceAdmin)
@@ -0,0 +1,243 @@
+"""
+Benchmarks for the scheduling pipeline.
+
+Synthetic DAG generators (chain, wide fan, layered random and a
+real-world-like work breakdown) and a runner that times every stage, from
+the legacy ``calculate_cpm``/``detect_cycle`` helpers through the engines to
+the database-backed schedule properties and report writing.  Each stage
+reports wall time (best of ``repeat``), peak traced memory and the number of
+SQL queries, as plain dicts ready for ``json.dump``.
+
+Used by the ``benchmark_schedule`` management command.
+"""
+import datetime
+import platform
+import random
+import time
+import tracemalloc
+
+import numpy as np
+import django
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from projects.calculate_critical_path import calculate_cpm, detect_cycle
+from projects.schedule_engine import ScheduleGraph, schedule, float_paths, FS, SS, FF, SF
+from projects.schedule_vectorized import schedule_vectorized
+
+
+SHAPES = ('chain', 'fan', 'layered', 'realistic')
+SIZES = (1000, 10000, 100000)
+
+
+# Generators -----------------------------------------------------------------
+#
+# Each returns ``(durations, edges)`` for tasks ``0..tasks - 1``; edges are
+# ``(pred, succ, link_type, lag)`` with pred < succ, so the graph is a DAG.
+
+def chain_graph(tasks, seed=42):
+    """One long dependency chain: the deepest possible graph."""
+    rng = random.Random(seed)
+    durations = [rng.randint(1, 20) for _ in range(tasks)]
+    return durations, [(v - 1, v, FS, 0) for v in range(1, tasks)]
+
+
+def fan_graph(tasks, seed=42):
+    """One start task fanning out to every other task, which all feed one end task."""
+    rng = random.Random(seed)
+    durations = [rng.randint(1, 20) for _ in range(tasks)]
+    if tasks < 3:
+        return chain_graph(tasks, seed)
+    end = tasks - 1
+    edges = [(0, v, FS, 0) for v in range(1, end)] + [(v, end, FS, 0) for v in range(1, end)]
+    return durations, edges
+
+
+def layered_graph(tasks, width=500, fan_in=3, seed=42):
+    """Random layered DAG: every task depends on up to ``fan_in`` tasks of the previous layer."""
+    rng = random.Random(seed)
+    durations = [rng.randint(1, 20) for _ in range(tasks)]
+    edges = []
+    for v in range(width, tasks):
+        layer_start = (v // width - 1) * width
+        for u in rng.sample(range(layer_start, layer_start + width), min(fan_in, width)):
+            edges.append((u, v, FS, 0))
+    return durations, edges
+
+
+def realistic_graph(tasks, seed=42):
+    """
+    Work-breakdown-like DAG: work packages of 5-40 tasks that are mostly
+    sequential with some parallel branches, linked to a few earlier
+    packages, with a mix of link types and lags as seen in real plans.
+    """
+    rng = random.Random(seed)
+    durations = [rng.choice((0, 1, 1, 2, 3, 5, 5, 8, 10, 15, 20)) for _ in range(tasks)]
+    edges = []
+    packages = []
+    v = 0
+    while v < tasks:
+        size = min(rng.randint(5, 40), tasks - v)
+        first, last = v, v + size - 1
+        for w in range(first + 1, last + 1):
+            preds = {w - 1} if rng.random() < 0.7 else {rng.randint(first, w - 1)}
+            if rng.random() < 0.2:
+                preds.add(rng.randint(first, w - 1))
+            for u in preds:
+                link = rng.choices((FS, SS, FF, SF), weights=(80, 10, 8, 2))[0]
+                edges.append((u, w, link, rng.choice((0, 0, 0, 1, 2, -1))))
+        for earlier_first, earlier_last in rng.sample(packages[-20:], min(len(packages[-20:]), rng.randint(0, 3))):
+            edges.append((earlier_last, first, FS, 0))
+        packages.append((first, last))
+        v += size
+    return durations, edges
+
+
+GENERATORS = {
+    'chain': chain_graph,
+    'fan': fan_graph,
+    'layered': layered_graph,
+    'realistic': realistic_graph,
+}
+
+
+def legacy_activities(durations, edges):
+    """The same graph as ``calculate_cpm`` activity dicts."""
+    data = [
+        {'activity': str(v), 'duration': d, 'predecessors': [], 'links': {}}
+        for v, d in enumerate(durations)
+    ]
+    for u, v, link, lag in edges:
+        data[v]['predecessors'].append(str(u))
+        data[v]['links'][str(u)] = (link, lag)
+    return data
+
+
+# Measuring --------------------------------------------------------------------
+
+def measure(stage, func, repeat=1, memory=True):
+    """
+    Run ``func`` ``repeat`` times for the best wall time, then once more
+    under tracemalloc for the peak memory and query count.
+    """
+    wall = None
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        wall = elapsed if wall is None else min(wall, elapsed)
+
+    row = {'stage': stage, 'wall_s': round(wall, 6), 'peak_kb': None, 'queries': None}
+    with CaptureQueriesContext(connection) as queries:
+        if memory:
+            tracemalloc.start()
+            try:
+                func()
+                row['peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+            finally:
+                tracemalloc.stop()
+        else:
+            func()
+    row['queries'] = len(queries.captured_queries)
+    return row
+
+
+def engine_stages(durations, edges, repeat=1, memory=True):
+    """Stages that need no database."""
+    data = legacy_activities(durations, edges)
+    graph = ScheduleGraph(range(len(durations)), durations, edges)
+    result = schedule(graph)
+    project_start = timezone.now()
+    return [
+        measure('detect_cycle', lambda: detect_cycle(data), repeat, memory),
+        measure('calculate_cpm', lambda: calculate_cpm(data, project_start=project_start), repeat, memory),
+        measure('graph_build', lambda: ScheduleGraph(range(len(durations)), durations, edges), repeat, memory),
+        measure('schedule', lambda: schedule(graph), repeat, memory),
+        measure('schedule_vectorized', lambda: schedule_vectorized(graph), repeat, memory),
+        measure('float_paths_top10', lambda: float_paths(result, k=10), repeat, memory),
+    ]
+
+
+class _Rollback(Exception):
+    pass
+
+
+def database_stages(durations, edges, company, charts=False, repeat=1, memory=True):
+    """
+    Stages against a throw-away project: schedule properties, report rows
+    and, with ``charts``, the full ``build_report``.
+    Everything is rolled back afterwards (chart files of the full report
+    stay in MEDIA_ROOT).
+    """
+    from projects.models import Category, Project, Task, Predecessor, CPMReport, get_project_schedule
+    from projects.reporting import build_report
+
+    rows = []
+    try:
+        with transaction.atomic():
+            category = Category.objects.create(company=company, name='benchmark')
+            project = Project.objects.create(category=category, name='benchmark')
+            start = timezone.now()
+            day = datetime.timedelta(days=1)
+            tasks = Task.objects.bulk_create(
+                (Task(project=project, name=f"task {v}", start_date=start, end_date=start + d * day)
+                 for v, d in enumerate(durations)),
+                batch_size=2000,
+            )
+            Predecessor.objects.bulk_create(
+                (Predecessor(from_task=tasks[u], to_task=tasks[v], start_type=link, lag=lag)
+                 for u, v, link, lag in edges),
+                batch_size=2000,
+            )
+
+            def task_properties():
+                get_project_schedule(project.pk, refresh=True)
+                for task in Task.objects.filter(project=project).only('id', 'project_id'):
+                    task.early_start, task.late_finish, task.slack
+
+            def report_rows():
+                values = get_project_schedule(project.pk, refresh=True)
+                cpmreport = CPMReport.objects.create(name='benchmark', project=project)
+                cpmreport.store_rows(
+                    (pk, v['early_start'], v['early_finish'], v['late_start'], v['late_finish'], v['total_float'])
+                    for pk, v in values.items()
+                )
+
+            rows.append(measure('task_schedule_properties', task_properties, repeat, memory))
+            rows.append(measure('report_rows', report_rows, repeat, memory))
+            if charts:
+                cpmreport = CPMReport.objects.create(name='benchmark', project=project, status=CPMReport.PENDING)
+                rows.append(measure('build_report', lambda: build_report(cpmreport.pk), 1, memory))
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return rows
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+def run(shapes=SHAPES, sizes=SIZES, repeat=1, memory=True, company=None, charts=False, seed=42, progress=None):
+    """Benchmark every shape and size; returns ``{'environment': ..., 'results': [...]}``."""
+    results = []
+    for shape in shapes:
+        for tasks in sizes:
+            durations, edges = GENERATORS[shape](tasks, seed=seed)
+            stages = engine_stages(durations, edges, repeat, memory)
+            if company is not None:
+                stages += database_stages(durations, edges, company, charts, repeat, memory)
+            for row in stages:
+                row.update(shape=shape, tasks=tasks, edges=len(edges))
+                results.append(row)
+                if progress:
+                    progress(row)
+    return {'environment': environment(), 'results': results}
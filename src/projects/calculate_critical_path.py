@@ -1,13 +1,24 @@
-import json
-import datetime
 import os
-from PIL import Image
+from threading import local
 from django.utils import timezone
 import matplotlib
 matplotlib.use('Agg')  # <- This line fixes the Tkinter / RuntimeError
 import matplotlib.pyplot as plt
-import networkx as nx
+import matplotlib.dates as mdates
 import matplotlib.patches as mpatches
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+
+from projects.layout import cached_layout
+from projects.pdf_assembly import write_image_pdf
+from projects.schedule_engine import ScheduleGraph, schedule
+from projects.schedule_vectorized import csr_arrays, schedule_vectorized
+from projects.calendars import from_workdays
+
+
+NETWORK_LABEL_LIMIT = 300
 
 data = [
     {
@@ -57,262 +68,304 @@ def detect_cycle(data):
     """
     Detects a cycle in the activities data.
     Raises an exception if a cycle is found.
+
+    Iterative depth-first search with an explicit stack, so long dependency
+    chains cannot hit Python's recursion limit.
     """
     activity_lookup = {activity['activity']: activity for activity in data}
     visited = set()
     visiting = set()
 
-    def dfs(activity_name):
-        if activity_name in visiting:
-            raise ValueError(f"Cycle detected at activity: {activity_name}")
-        if activity_name in visited:
-            return
-        visiting.add(activity_name)
-        for neighbor in activity_lookup[activity_name]['predecessors']:
-            dfs(neighbor)
-        visiting.remove(activity_name)
-        visited.add(activity_name)
-
     for activity in data:
-        if activity['activity'] not in visited:
-            dfs(activity['activity'])
+        root = activity['activity']
+        if root in visited:
+            continue
+        visiting.add(root)
+        stack = [(root, iter(activity_lookup[root]['predecessors']))]
+        while stack:
+            activity_name, neighbors = stack[-1]
+            for neighbor in neighbors:
+                if neighbor in visiting:
+                    raise ValueError(f"Cycle detected at activity: {neighbor}")
+                if neighbor not in visited:
+                    visiting.add(neighbor)
+                    stack.append((neighbor, iter(activity_lookup[neighbor]['predecessors'])))
+                    break
+            else:
+                stack.pop()
+                visiting.remove(activity_name)
+                visited.add(activity_name)
 
 
-def draw_critical_path_graph(data, critical_path, save_path=None):
+def activity_network(data):
     """
-    Draws a simplified activity graph showing only the Critical Path.
-    Much cleaner for large projects.
+    ScheduleGraph over the positions of ``data``; predecessors are matched
+    by name (the first activity of that name, names need not be unique).
     """
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import networkx as nx
-    import matplotlib.patches as mpatches
-
-    G = nx.DiGraph()
-    label_mapping = {}
-
-    # Only critical activities
-    critical_set = set(critical_path)
-
-    for activity in data:
-        if activity['activity'] not in critical_set:
-            continue  # Skip non-critical activities
-        node_label = f"{activity['activity']} ({activity['duration']}d)"
-        G.add_node(activity['activity'])
-        label_mapping[activity['activity']] = node_label
-        for pred in activity['predecessors']:
-            if pred in critical_set:
-                G.add_edge(pred, activity['activity'])
+    index = {}
+    for v, activity in enumerate(data):
+        index.setdefault(activity['activity'], v)
+    return ScheduleGraph(
+        range(len(data)),
+        [activity['duration'] for activity in data],
+        [(index[pred], v) for v, activity in enumerate(data) for pred in activity['predecessors'] if pred in index],
+    )
 
-    pos = nx.spring_layout(G, seed=42)
 
-    plt.figure(figsize=(12, 8))
-    nx.draw(G, pos, with_labels=False, node_size=1500, font_size=10, arrowsize=20, edge_color='red', width=2)
-    nx.draw_networkx_labels(G, pos, labels=label_mapping, font_size=9)
+def save_figure(figure, save_path, **kwargs):
+    """
+    Save ``figure`` in the format of ``save_path``'s extension (PNG, or SVG
+    for vector output).  SVG text is kept as text rather than glyph paths
+    and its ids do not depend on the run, so it can be inlined in HTML and
+    the same chart always gives the same markup.
+    """
+    if str(save_path).endswith('.svg'):
+        kwargs.setdefault('metadata', {'Date': None})
+    with matplotlib.rc_context({'svg.fonttype': 'none', 'svg.hashsalt': 'projects'}):
+        figure.savefig(save_path, **kwargs)
 
-    red_patch = mpatches.Patch(color='red', label='Critical Path Only')
-    plt.legend(handles=[red_patch], loc='upper left')
 
-    plt.title("Critical Path Graph (Simplified)", fontsize=14)
+def draw_network(data, graph, edge_colors, title, legend, save_path=None, font_size=10):
+    """
+    Draws ``data`` (with ``graph``, its ``activity_network``) on the layered
+    layout: one arrow collection for the links (``edge_colors`` per link, in
+    ``link_pairs`` order) and one scatter for the activities.
+    """
+    x, y = cached_layout(graph)
+    fig, ax = plt.subplots(figsize=(12, 8))
+    src, dst = link_pairs(graph)
+    if len(src):
+        # Stop the arrows short of the successor's marker.
+        dx = (x[dst] - x[src]) * 0.85
+        dy = (y[dst] - y[src]) * 0.85
+        ax.quiver(x[src], y[src], dx, dy, angles='xy', scale_units='xy', scale=1,
+                  color=edge_colors, width=0.002, headwidth=6, zorder=1)
+    # Past NETWORK_LABEL_LIMIT activities labels would only overlap; drawing
+    # them would also cost more than the rest of the chart.
+    labelled = len(data) <= NETWORK_LABEL_LIMIT
+    ax.scatter(x, y, s=600 if labelled else 20, color='lightsteelblue', edgecolors='black', zorder=2)
+    if labelled:
+        for activity, label_x, label_y in zip(data, x, y):
+            ax.text(label_x, label_y, f"{activity['activity']} ({activity['duration']}d)",
+                    ha='center', va='center', fontsize=font_size, zorder=3)
+    ax.set_axis_off()
+    ax.margins(0.1)
+    ax.legend(handles=[legend], loc='upper left')
+    ax.set_title(title, fontsize=14)
 
     if save_path:
-        plt.savefig(save_path, bbox_inches='tight')
+        save_figure(fig, save_path, bbox_inches='tight')
     else:
         plt.show()
+    plt.close(fig)
 
-    plt.close()
 
+def link_pairs(graph):
+    """``(src, dst)`` id arrays of every link, in successor CSR order."""
+    _, _, succ_ptr, succ_idx = csr_arrays(graph)
+    return np.repeat(np.arange(len(graph)), np.diff(succ_ptr)), succ_idx
 
 
+def draw_critical_path_graph(data, critical_path, save_path=None):
+    """
+    Draws a simplified activity graph showing only the Critical Path.
+    Much cleaner for large projects.
+    """
+    critical_set = set(critical_path)
+    critical = [
+        dict(activity, predecessors=[pred for pred in activity['predecessors'] if pred in critical_set])
+        for activity in data if activity['activity'] in critical_set
+    ]
+    draw_network(critical, activity_network(critical), 'red', "Critical Path Graph (Simplified)",
+                 mpatches.Patch(color='red', label='Critical Path Only'), save_path=save_path, font_size=9)
 
-def draw_activity_graph(data, critical_path, save_path=None):
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import networkx as nx
-    import matplotlib.patches as mpatches
-
-    G = nx.DiGraph()
-    label_mapping = {}
-    for activity in data:
-        node_label = f"{activity['activity']} ({activity['duration']}d)"
-        G.add_node(activity['activity'])
-        label_mapping[activity['activity']] = node_label
-        for pred in activity['predecessors']:
-            G.add_edge(pred, activity['activity'])
-
-    pos = nx.spring_layout(G, seed=42)
-
-    edge_colors = []
-    for u, v in G.edges():
-        if u in critical_path and v in critical_path:
-            u_index = critical_path.index(u)
-            if u_index + 1 < len(critical_path) and critical_path[u_index + 1] == v:
-                edge_colors.append('red')
-            else:
-                edge_colors.append('gray')
-        else:
-            edge_colors.append('gray')
 
-    nx.draw(G, pos, with_labels=False, node_size=1500, font_size=12, arrowsize=20, edge_color=edge_colors, width=2)
-    nx.draw_networkx_labels(G, pos, labels=label_mapping, font_size=10)
+def draw_activity_graph(data, critical_chains, save_path=None):
+    """
+    Draws the activity network; links between consecutive activities of a
+    critical chain (ordered lists of activity names) are drawn in red.
+    """
+    critical_edges = {edge for chain in critical_chains for edge in zip(chain, chain[1:])}
+    graph = activity_network(data)
+    src, dst = link_pairs(graph)
+    edge_colors = [
+        'red' if (data[u]['activity'], data[v]['activity']) in critical_edges else 'gray'
+        for u, v in zip(src.tolist(), dst.tolist())
+    ]
+    draw_network(data, graph, edge_colors, "Project Activity Graph with Durations",
+                 mpatches.Patch(color='red', label='Critical Path'), save_path=save_path)
+
+
+class GanttRenderer:
+    """
+    One Agg Figure and Axes reused for Gantt charts, outside of pyplot.
 
-    red_patch = mpatches.Patch(color='red', label='Critical Path')
-    plt.legend(handles=[red_patch])
-    plt.title("Project Activity Graph with Durations")
+    Every ``draw`` replaces the bars of a single PolyCollection and updates
+    the ticks, limits and title in place, so rendering hundreds of pages
+    keeps one figure alive instead of registering one per page with pyplot.
+    """
 
-    if save_path:
-        plt.savefig(save_path, bbox_inches='tight')
-    else:
-        plt.show()
+    def __init__(self, figsize=(12, 8), figure=None):
+        """``figure`` draws on an existing (e.g. pyplot) figure instead of a new Agg one."""
+        if figure is None:
+            figure = Figure(figsize=figsize)
+            FigureCanvasAgg(figure)
+        self.figure = figure
+        self.ax = self.figure.add_subplot()
+        self.bars = PolyCollection([], zorder=2)
+        self.ax.add_collection(self.bars)
+        locator = mdates.AutoDateLocator()
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        self.ax.set_xlabel("Time")
+        self.ax.grid(True, axis='x')
+        self.ax.legend(handles=[
+            mpatches.Patch(color='red', label='Critical Path'),
+            mpatches.Patch(color='blue', label='Non-Critical Activities'),
+        ])
+
+    def draw(self, activities, title, save_path, bbox_inches='tight'):
+        """Render ``activities`` and save the chart to ``save_path``."""
+        self.render(activities, title)
+        save_figure(self.figure, save_path, bbox_inches=bbox_inches)
+
+    def render(self, activities, title):
+        """Draw ``activities`` (dicts with 'activity', 'es', 'duration', 'slack') on the figure."""
+        n = len(activities)
+        rows = np.arange(n)
+        start = np.asarray(mdates.date2num([activity['es'] for activity in activities]), dtype=float).reshape(n)
+        finish = start + np.array([activity['duration'] for activity in activities], dtype=float)
+        critical = np.array([activity['slack'] == 0 for activity in activities], dtype=bool)
+
+        verts = np.empty((n, 4, 2))
+        verts[:, 0, 0] = verts[:, 1, 0] = start
+        verts[:, 2, 0] = verts[:, 3, 0] = finish
+        verts[:, 0, 1] = verts[:, 3, 1] = rows - 0.2
+        verts[:, 1, 1] = verts[:, 2, 1] = rows + 0.2
+        self.bars.set_verts(verts)
+        self.bars.set_facecolor(np.where(critical, 'red', 'blue'))
+
+        self.ax.set_yticks(rows, labels=[activity['activity'] for activity in activities])
+        self.ax.set_ylim(-0.6, max(n, 1) - 0.4)
+        if n:
+            margin = max((finish.max() - start.min()) * 0.02, 0.5)
+            self.ax.set_xlim(start.min() - margin, finish.max() + margin)
+        self.ax.set_title(title)
+
+
+_gantt_renderers = local()
+
+
+def gantt_renderer(figsize=(12, 8)):
+    """The GanttRenderer of this thread for ``figsize``."""
+    renderers = _gantt_renderers.__dict__
+    if figsize not in renderers:
+        renderers[figsize] = GanttRenderer(figsize)
+    return renderers[figsize]
 
-    plt.close()
 
 def draw_gantt_chart(data,critical_path, save_path=None):
     """
     Draws a Gantt chart based on Early Start (ES) and Duration.
-    Critical path activities are highlighted in red.
+    Critical path activities are highlighted in red.  Without ``save_path``
+    the chart is shown with pyplot.
     """
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    yticks = []
-    ylabels = []
-    for i, activity in enumerate(data):
-        start = activity['es']
-        duration = activity['duration']
-        color = 'red' if activity['slack'] == 0 else 'blue'
-        ax.barh(i, duration, left=start, height=0.4, align='center', color=color)
-        yticks.append(i)
-        ylabels.append(activity['activity'])
-
-    ax.set_yticks(yticks)
-    ax.set_yticklabels(ylabels)
-    ax.set_xlabel("Time")
-    ax.set_title("Gantt Chart (CPM Scheduling)")
-    red_patch = mpatches.Patch(color='red', label='Critical Path')
-    blue_patch = mpatches.Patch(color='blue', label='Non-Critical Activities')
-    plt.legend(handles=[red_patch, blue_patch])
-    plt.grid(True, axis='x')
-    plt.tight_layout()
+    title = "Gantt Chart (CPM Scheduling)"
     if save_path:
-        plt.savefig(save_path)
+        gantt_renderer((10, 6)).draw(data, title, save_path)
     else:
+        fig = plt.figure(figsize=(10, 6))
+        GanttRenderer(figure=fig).render(data, title)
         plt.show()
-    plt.close()
+        plt.close(fig)
 
 
-def draw_paginated_gantt_chart(data, save_folder, page_size=100):
-    from django.conf import settings
-    import os
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import matplotlib.patches as mpatches
+def gantt_page_path(save_folder, page):
+    """File of Gantt page ``page`` (0-based); zero padded so the pages sort in order."""
+    return os.path.join(save_folder, f"gantt_page_{page + 1:04d}.png")
+
+
+def draw_gantt_page(page_tasks, page, save_path):
+    """Draws one page of the paginated Gantt chart."""
+    gantt_renderer().draw(page_tasks, f"Gantt Chart (Page {page + 1})", save_path)
+
 
+def draw_paginated_gantt_chart(data, save_folder, page_size=100):
     total_tasks = len(data)
     pages = (total_tasks + page_size - 1) // page_size
 
     for page in range(pages):
         start_index = page * page_size
         end_index = min(start_index + page_size, total_tasks)
-        page_tasks = data[start_index:end_index]
-
-        fig, ax = plt.subplots(figsize=(12, 8))
-        yticks = []
-        ylabels = []
-        for i, activity in enumerate(page_tasks):
-            start = activity['es']
-            duration = activity['duration']
-            color = 'red' if activity['slack'] == 0 else 'blue'
-            ax.barh(i, duration, left=start, height=0.4, align='center', color=color)
-            yticks.append(i)
-            ylabels.append(activity['activity'])
-
-        ax.set_yticks(yticks)
-        ax.set_yticklabels(ylabels)
-        ax.set_xlabel("Time")
-        ax.set_title(f"Gantt Chart (Page {page + 1})")
-        red_patch = mpatches.Patch(color='red', label='Critical Path')
-        blue_patch = mpatches.Patch(color='blue', label='Non-Critical Activities')
-        plt.legend(handles=[red_patch, blue_patch])
-        plt.grid(True, axis='x')
-        plt.tight_layout()
-
-        page_file = os.path.join(save_folder, f"gantt_page_{page + 1}.png")
-        plt.savefig(page_file, bbox_inches='tight')
-        plt.close()
-
-
-def calculate_cpm(data, draw_graph=False, draw_gantt=False):
-    activity_lookup = {activity['activity']: activity for activity in data}
-    
-    project_start = data[0]['es']
+        draw_gantt_page(data[start_index:end_index], page, gantt_page_path(save_folder, page))
 
-    # Forward Pass
-    for activity in data:
-        if not activity['predecessors']:
-            es = project_start
-        else:
-            pred_efs = [activity_lookup[pred]['ef'] for pred in activity['predecessors']]
-            es = max(pred_efs)
-        
-        activity['es'] = es
-        activity['ef'] = es + datetime.timedelta(days=activity['duration'])
 
-    # Build successors
-    successors = {activity['activity']: [] for activity in data}
-    for activity in data:
-        for pred in activity['predecessors']:
-            successors[pred].append(activity['activity'])
+def calculate_cpm(data, draw_graph=False, draw_gantt=False, project_start=None, vectorized=False, calendar=None):
+    """
+    Compatibility wrapper around ``projects.schedule_engine``.
 
-    # Backward Pass
-    project_finish = max(activity['ef'] for activity in data)
+    ``data`` is a list of activity dicts with 'activity', 'duration',
+    'predecessors' and optionally 'links' ({predecessor: (link_type, lag)});
+    it does not need to be in topological order.  Each dict
+    is enriched in place with 'es', 'ef', 'ls', 'lf' (datetimes) and 'slack'
+    (days).  The project start defaults to the earliest 'es' already present
+    in ``data``, or now.
 
-    for activity in reversed(data):
-        if not successors[activity['activity']]:
-            lf = project_finish
-        else:
-            succ_ls = [activity_lookup[succ]['ls'] for succ in successors[activity['activity']]]
-            lf = min(succ_ls)
+    With ``vectorized=True`` the passes run level by level in NumPy
+    (``projects.schedule_vectorized``), which pays off on very large schedules.
 
+    With a ``calendar`` (a ``numpy.busdaycalendar``, see
+    ``projects.calendars``) durations are working days and the dates skip
+    weekends and holidays; 'slack' is then in working days too.
+    """
+    if not data:
+        return data
+    if project_start is None:
+        starts = [activity['es'] for activity in data if activity.get('es')]
+        project_start = min(starts) if starts else timezone.now()
+
+    graph = ScheduleGraph.from_activities(data)
+    result = schedule_vectorized(graph) if vectorized else schedule(graph)
+    if calendar is None:
+        dates = result.to_datetimes(project_start)
+    else:
+        columns = [from_workdays(project_start, offsets, calendar)
+                   for offsets in (result.es, result.ef, result.ls, result.lf)]
+        dates = dict(zip(graph.keys, zip(*columns)))
+
+    # Graph ids follow the order of ``data``.
+    slack = [int(late - early) for late, early in zip(result.ls, result.es)]
+    for v, activity in enumerate(data):
+        es, ef, ls, lf = dates[activity['activity']]
+        activity['es'] = es
+        activity['ef'] = ef
+        activity['ls'] = ls
         activity['lf'] = lf
-        activity['ls'] = lf - datetime.timedelta(days=activity['duration'])
+        activity['slack'] = max(slack[v], 0)
 
-        slack = (activity['ls'] - activity['es']).days
-        activity['slack'] = max(slack, 0)
+    return data
 
-    # Critical Path
-    critical_path = [activity['activity'] for activity in data if activity['slack'] == 0]
-    print(f"Critical Path: {critical_path}")
 
-    return data
+def merge_images_to_pdf(image_paths, output_pdf_path, compress=True, dpi=None):
+    """
+    Merges the given images, in order, into a single PDF file, one page at
+    a time (see ``projects.pdf_assembly``).
+    """
+    write_image_pdf(image_paths, output_pdf_path, compress=compress, dpi=dpi)
 
 
 def merge_gantt_images_to_pdf(image_folder, output_pdf_path):
     """
     Merges all PNG images in a folder into a single PDF file.
     """
-    from PIL import Image
-    import os
-
-    images = []
-
-    for file_name in sorted(os.listdir(image_folder)):
-        if file_name.endswith(".png"):
-            img_path = os.path.join(image_folder, file_name)
-            try:
-                with Image.open(img_path) as img:
-                    img_rgb = img.convert('RGB').copy()  # Fully load and copy the image
-                    images.append(img_rgb)
-            except:
-                pass
-    if images:
-        first_image = images[0]
-        rest_images = images[1:]
-        first_image.save(output_pdf_path, save_all=True, append_images=rest_images)
-    else:
+    paths = [
+        os.path.join(image_folder, file_name)
+        for file_name in sorted(os.listdir(image_folder))
+        if file_name.endswith(".png")
+    ]
+    if not paths:
         raise ValueError("No images found in the folder!")
+    merge_images_to_pdf(paths, output_pdf_path)
 
 
 # def calculate_cpm(data, draw_graph=False, draw_gantt=False):
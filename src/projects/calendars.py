@@ -0,0 +1,67 @@
+"""
+Working-day scheduling on top of ``companies.WorkCalendar``.
+
+The schedule engine works in integer time units.  In working-day mode those
+units are working days of the company's calendar: task dates are turned
+into working-day offsets with ``numpy.busday_count`` and the computed
+offsets back into dates with ``numpy.busday_offset``, each as one call over
+the whole array.  The ``numpy.busdaycalendar`` (weekmask and holiday table)
+is built once per calendar and kept per process, keyed by the calendar's
+``updated`` stamp, which every holiday change bumps.
+"""
+import datetime
+from collections import OrderedDict
+
+import numpy as np
+
+
+CALENDAR_CACHE_SIZE = 64
+
+_calendars = OrderedDict()
+
+
+def get_busdaycalendar(company_id):
+    """The company's ``numpy.busdaycalendar``, or None without a work calendar."""
+    from companies.models import WorkCalendar, Holiday
+
+    row = WorkCalendar.objects.filter(company_id=company_id).values_list('id', 'weekmask', 'updated').first()
+    if row is None:
+        return None
+    key = row
+    calendar = _calendars.get(key)
+    if calendar is None:
+        holidays = list(Holiday.objects.filter(calendar_id=row[0]).values_list('date', flat=True))
+        calendar = np.busdaycalendar(weekmask=row[1], holidays=np.array(holidays, dtype='datetime64[D]'))
+        _calendars[key] = calendar
+    _calendars.move_to_end(key)
+    while len(_calendars) > CALENDAR_CACHE_SIZE:
+        _calendars.popitem(last=False)
+    return calendar
+
+
+def _days(values):
+    return np.array([value.date() if isinstance(value, datetime.datetime) else value for value in values],
+                    dtype='datetime64[D]')
+
+
+def to_workdays(epoch, starts, ends, calendar):
+    """
+    Working-day ``(release, durations, finish)`` of tasks running from
+    ``starts`` to ``ends``, counted from ``epoch``: release and duration per
+    task and the offset of the last end.
+    """
+    origin = np.datetime64(epoch.date(), 'D')
+    start_days = _days(starts)
+    end_days = _days(ends)
+    release = np.busday_count(origin, start_days, busdaycal=calendar)
+    durations = np.maximum(np.busday_count(start_days, end_days, busdaycal=calendar), 0)
+    finish = int(np.busday_count(origin, end_days, busdaycal=calendar).max()) if len(end_days) else 0
+    return release.tolist(), durations.tolist(), finish
+
+
+def from_workdays(epoch, offsets, calendar):
+    """Datetimes of working-day ``offsets`` from ``epoch``, keeping its time of day."""
+    origin = np.datetime64(epoch.date(), 'D')
+    days = np.busday_offset(origin, np.asarray(offsets, dtype=np.int64), roll='forward', busdaycal=calendar)
+    day = datetime.timedelta(days=1)
+    return [epoch + shift * day for shift in (days - origin).astype(np.int64).tolist()]
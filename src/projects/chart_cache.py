@@ -0,0 +1,136 @@
+"""
+Content-addressed cache of rendered charts.
+
+A chart is stored under the hash of everything it is drawn from: its kind,
+the render options, ``RENDER_VERSION`` and the schedule data it shows.  The
+same inputs always map to the same file, so an unchanged chart is served
+from the cache and a changed schedule simply hashes to new entries.
+
+Keys end with the file format, ``png`` or ``svg``; files live under
+``MEDIA_ROOT/chart_cache`` so reports can link to them.
+Reading an entry refreshes its modification time; ``evict`` drops entries
+unused for ``MAX_AGE`` and then the least recently used ones until the
+cache fits in ``MAX_BYTES``.  Entries used within ``MIN_AGE`` are always
+kept, so a report that found its charts cached still has them when it
+assembles.  Eviction runs in the periodic ``evict_chart_cache`` task only,
+scheduled daily by ``CELERY_BEAT_SCHEDULE``.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+
+# Bump when the drawing code changes, so old renders are not served again.
+RENDER_VERSION = 1
+
+MAX_BYTES = 512 * 1024 * 1024
+MAX_AGE = 30 * 24 * 60 * 60
+# Longer than any report run, from looking up its charts to assembling them.
+MIN_AGE = 6 * 60 * 60
+
+FOLDER = 'chart_cache'
+
+FORMATS = ('png', 'svg')
+
+
+def chart_key(kind, payload, options=None, format='png'):
+    """Hash of a chart's kind, render options and input data, with the file format as extension."""
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    content = json.dumps(
+        {'kind': kind, 'version': RENDER_VERSION, 'options': options or {}, 'payload': payload},
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return f"{hashlib.sha256(content.encode()).hexdigest()}.{format}"
+
+
+def root():
+    return os.path.join(settings.MEDIA_ROOT, FOLDER)
+
+
+def chart_name(key):
+    """Path of an entry relative to MEDIA_ROOT."""
+    return f"{FOLDER}/{key[:2]}/{key}"
+
+
+def chart_path(key):
+    return os.path.join(settings.MEDIA_ROOT, chart_name(key))
+
+
+def chart_url(key):
+    return settings.MEDIA_URL + chart_name(key)
+
+
+def lookup(key):
+    """The path of a cached chart, refreshing its age, or None."""
+    path = chart_path(key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def render(key, draw):
+    """
+    The path of chart ``key``, calling ``draw(path)`` to render it when it
+    is not cached.  Renders go to a temporary file that is moved into place,
+    so concurrent renders of the same chart never expose a partial file.
+    """
+    path = lookup(key)
+    if path is not None:
+        return path
+    path = chart_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temporary = tempfile.mkstemp(suffix=os.path.splitext(key)[1], dir=os.path.dirname(path))
+    os.close(handle)
+    try:
+        draw(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return path
+
+
+def evict(max_bytes=MAX_BYTES, max_age=MAX_AGE, min_age=MIN_AGE):
+    """
+    Drop stale and least recently used entries, never one used within
+    ``min_age`` seconds; returns how many were removed.
+    """
+    entries = []
+    for folder, _, files in os.walk(root()):
+        for name in files:
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+
+    now = time.time()
+    cutoff = now - max_age
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total <= max_bytes or mtime > now - min_age:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def inline_svg(key):
+    """The markup of a cached SVG chart, without its XML prolog, to embed in HTML."""
+    with open(chart_path(key), encoding='utf-8') as handle:
+        markup = handle.read()
+    return markup[markup.index('<svg'):]
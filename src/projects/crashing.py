@@ -0,0 +1,175 @@
+"""
+Time-cost trade-off ("crashing").
+
+The project is shortened one day at a time.  Each step looks at the
+critical subgraph (zero-float tasks and the links that drive them) and
+crashes the cheapest set of tasks that cuts every critical path, found as a
+minimum vertex cut with a max-flow.  Every crashed task has its duration
+cut by one day through ``IncrementalSchedule.set_duration``, which updates
+only the affected cone instead of rerunning the whole CPM.  This repeats
+until the target is reached or no critical path can be shortened further.
+
+The result is the cost curve: the finish and total cost after every step.
+"""
+import math
+from collections import deque, namedtuple
+from decimal import Decimal
+
+from projects.incremental import IncrementalSchedule
+from projects.schedule_engine import FS, SS, FF, SF
+
+
+CrashStep = namedtuple('CrashStep', ['finish', 'cost', 'crashed'])
+
+
+def _max_flow_cut(count, arcs, source, sink):
+    """
+    Dinic's max-flow over ``count`` nodes and ``(u, v, capacity)`` arcs.
+    Returns ``(flow, reachable)``, with ``reachable`` the source side of a minimum cut.
+    """
+    head = [[] for _ in range(count)]
+    to, cap = [], []
+    for u, v, c in arcs:
+        head[u].append(len(to))
+        to.append(v)
+        cap.append(c)
+        head[v].append(len(to))
+        to.append(u)
+        cap.append(0)
+
+    flow = 0
+    while True:
+        level = [-1] * count
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for e in head[u]:
+                if cap[e] > 0 and level[to[e]] < 0:
+                    level[to[e]] = level[u] + 1
+                    queue.append(to[e])
+        if level[sink] < 0:
+            return flow, [lv >= 0 for lv in level]
+
+        # Blocking flow along level-increasing arcs, with an explicit path
+        # stack so long critical chains cannot hit the recursion limit.
+        cursor = [0] * count
+        while True:
+            path = []
+            u = source
+            while u != sink:
+                while cursor[u] < len(head[u]):
+                    e = head[u][cursor[u]]
+                    if cap[e] > 0 and level[to[e]] == level[u] + 1:
+                        break
+                    cursor[u] += 1
+                else:
+                    if u == source:
+                        break
+                    level[u] = -1
+                    u = to[path.pop() ^ 1]
+                    cursor[u] += 1
+                    continue
+                path.append(e)
+                u = to[e]
+            if u != sink:
+                break
+            pushed = min(cap[e] for e in path)
+            if pushed == math.inf:
+                return math.inf, None
+            for e in path:
+                cap[e] -= pushed
+                cap[e ^ 1] += pushed
+            flow += pushed
+
+
+def cheapest_cut(state, costs, min_durations):
+    """
+    Cheapest set of task ids whose crashing by one day shortens every
+    critical path of ``state``, or None if some critical path cannot be
+    shortened.
+    """
+    es, ef, ls, lf = state.es, state.ef, state.ls, state.lf
+    critical = [v for v in state.order if state.alive[v] and es[v] == ls[v]]
+    slot = {v: i for i, v in enumerate(critical)}
+
+    # Node v is split into its start 2i and its finish 2i + 1, the arc
+    # between them weighted with its crash cost.  A driving link joins the
+    # ends it constrains: FS finish -> start, SS start -> start,
+    # FF finish -> finish and SF start -> finish.
+    source, sink = 2 * len(critical), 2 * len(critical) + 1
+    arcs = []
+    for i, v in enumerate(critical):
+        key = state.keys[v]
+        crashable = costs.get(key) is not None and state.dur[v] > min_durations.get(key, state.dur[v])
+        arcs.append((2 * i, 2 * i + 1, float(costs[key]) if crashable else math.inf))
+        for u, (link, lag) in state.preds[v].items():
+            if u not in slot:
+                continue
+            bound = (ef[u] if link == FS or link == FF else es[u]) + lag
+            if link == FF or link == SF:
+                bound -= state.dur[v]
+            if bound == es[v]:
+                tail = 2 * slot[u] + (1 if link == FS or link == FF else 0)
+                arcs.append((tail, 2 * i + (1 if link == FF or link == SF else 0), math.inf))
+        if es[v] == state.release[v]:
+            arcs.append((source, 2 * i, math.inf))
+        if ef[v] == state.project_duration:
+            arcs.append((2 * i + 1, sink, math.inf))
+
+    flow, reachable = _max_flow_cut(2 * len(critical) + 2, arcs, source, sink)
+    if flow == math.inf or reachable is None:
+        return None
+    return [state.keys[v] for i, v in enumerate(critical) if reachable[2 * i] and not reachable[2 * i + 1]]
+
+
+def crash(state, costs, min_durations, days=None):
+    """
+    Shorten ``state`` (an ``IncrementalSchedule``, modified in place) one
+    day per step, by at most ``days`` days.
+
+    costs         : {task_id: crash cost per day}, None for tasks that cannot be crashed
+    min_durations : {task_id: shortest duration}
+
+    Returns the ``CrashStep`` list; ``cost`` is the cumulative crash cost.
+    """
+    steps = []
+    total = Decimal(0)
+    start = state.project_duration
+    while days is None or start - state.project_duration < days:
+        cut = cheapest_cut(state, costs, min_durations)
+        if not cut:
+            break
+        before = state.project_duration
+        for key in cut:
+            state.set_duration(key, state.dur[state.index[key]] - 1)
+        if state.project_duration >= before:
+            # The finish is held by SS/SF links or a planned end date, which
+            # shorter durations do not move: undo the step and stop.
+            for key in cut:
+                state.set_duration(key, state.dur[state.index[key]] + 1)
+            break
+        total += sum(Decimal(costs[key]) for key in cut)
+        steps.append(CrashStep(state.project_duration, total, cut))
+    return steps
+
+
+def crash_project(project_id, days=None):
+    """
+    Crash a project's schedule by up to ``days`` days.
+
+    Returns ``(state, normal_cost, steps)``; tasks without a ``crash_cost``
+    keep their duration and ``min_duration`` defaults to 0 days.
+    """
+    from projects.models import Task
+
+    state = IncrementalSchedule.from_project(project_id)
+    costs = {}
+    min_durations = {}
+    normal_cost = Decimal(0)
+    for pk, budget, crash_cost, min_duration in Task.objects.filter(project_id=project_id).values_list(
+            'id', 'budget', 'crash_cost', 'min_duration'):
+        normal_cost += budget or 0
+        costs[pk] = crash_cost
+        min_durations[pk] = min_duration or 0
+    return state, normal_cost, crash(state, costs, min_durations, days=days)
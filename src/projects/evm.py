@@ -0,0 +1,132 @@
+"""
+Earned value management.
+
+Planned value, earned value and actual cost of a set of tasks are summed in
+one aggregate query per status date:
+
+    PV = budget * share of the planned duration elapsed at the status date
+    EV = budget * percent_complete / 100
+    AC = actual_cost
+
+The schedule and cost performance indices and the variances are derived
+from those sums.  Project figures are cached per schedule version, which
+moves on every task change; a company's figures per project or per category
+come from a single GROUP BY query.
+"""
+import datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Func, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from projects.incremental import current_version
+
+
+CACHE_TIMEOUT = 60 * 60
+
+CENTS = Decimal('0.01')
+
+GROUPS = {
+    'project': ('project_id', 'project__name'),
+    'category': ('project__category_id', 'project__category__name'),
+}
+
+
+class EpochSeconds(Func):
+    """A datetime as seconds, for dividing spans of time in SQL."""
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='(julianday(%(expressions)s) * 86400.0)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def status_cutoff(status_date):
+    """The end of ``status_date`` (a date, default today) as an aware datetime."""
+    if status_date is None:
+        status_date = timezone.localdate()
+    return timezone.make_aware(datetime.datetime.combine(status_date + datetime.timedelta(days=1), datetime.time()))
+
+
+def _aggregates(cutoff):
+    at = Value(cutoff)
+    planned_share = Case(
+        When(end_date__lte=cutoff, then=Value(1.0)),
+        When(start_date__gte=cutoff, then=Value(0.0)),
+        default=(EpochSeconds(at) - EpochSeconds('start_date')) / (EpochSeconds('end_date') - EpochSeconds('start_date')),
+        output_field=FloatField(),
+    )
+    money = DecimalField(max_digits=18, decimal_places=2)
+    budget = Coalesce(F('budget'), Value(Decimal(0)), output_field=money)
+    return {
+        'bac': Sum(budget),
+        'pv': Sum(ExpressionWrapper(budget * planned_share, output_field=FloatField())),
+        'ev': Sum(ExpressionWrapper(budget * F('percent_complete') / Value(Decimal(100)), output_field=money)),
+        'ac': Sum(Coalesce(F('actual_cost'), Value(Decimal(0)), output_field=money)),
+    }
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(CENTS)
+
+
+def _ratio(numerator, denominator):
+    return (numerator / denominator).quantize(Decimal('0.0001')) if denominator else None
+
+
+def metrics(row, status_date):
+    """The EVM figures of an aggregate row with ``bac``, ``pv``, ``ev`` and ``ac``."""
+    bac, pv, ev, ac = (_money(row[name]) for name in ('bac', 'pv', 'ev', 'ac'))
+    cpi = _ratio(ev, ac)
+    return {
+        'status_date': status_date.isoformat(),
+        'bac': bac,
+        'pv': pv,
+        'ev': ev,
+        'ac': ac,
+        'sv': ev - pv,
+        'cv': ev - ac,
+        'spi': _ratio(ev, pv),
+        'cpi': cpi,
+        'eac': (bac / cpi).quantize(CENTS) if cpi else None,
+        'percent_complete': _ratio(ev * 100, bac),
+    }
+
+
+def project_evm(project_id, status_date=None):
+    """EVM figures of one project at ``status_date`` (default today)."""
+    from projects.models import Task
+
+    status_date = status_date or timezone.localdate()
+    key = f"projects:evm:{project_id}:{current_version(project_id)}:{status_date.isoformat()}"
+    result = cache.get(key)
+    if result is None:
+        row = Task.objects.filter(project_id=project_id).aggregate(**_aggregates(status_cutoff(status_date)))
+        result = metrics(row, status_date)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+
+def company_evm(company_id, status_date=None, by='project'):
+    """
+    EVM figures of every project (or category, ``by='category'``) of a
+    company at ``status_date``, as ``[{'id', 'name', ...figures}]``.
+    """
+    from projects.models import Task
+
+    if by not in GROUPS:
+        raise ValueError(f"by must be one of: {', '.join(GROUPS)}")
+    status_date = status_date or timezone.localdate()
+    group_id, group_name = GROUPS[by]
+    rows = (
+        Task.objects.filter(project__category__company_id=company_id)
+        .values(group_id, group_name)
+        .annotate(**_aggregates(status_cutoff(status_date)))
+        .order_by(group_name, group_id)
+    )
+    return [{'id': row[group_id], 'name': row[group_name], **metrics(row, status_date)} for row in rows]
@@ -20,7 +20,7 @@ class CategoryForm(BootstrapForm, forms.ModelForm):
 class ProjectForm(BootstrapForm, forms.ModelForm):
     class Meta:
         model = Project
-        fields = ('category','parent','name','budget')
+        fields = ('category','parent','name','budget','working_days')
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop("request")
@@ -31,7 +31,9 @@ class ProjectForm(BootstrapForm, forms.ModelForm):
 class TaskForm(BootstrapForm, forms.ModelForm):
     class Meta:
         model = Task
-        fields = ('project', 'name', 'start_date', 'end_date', 'budget')
+        fields = ('project', 'name', 'start_date', 'end_date', 'budget',
+                  'optimistic_duration', 'likely_duration', 'pessimistic_duration',
+                  'crash_cost', 'min_duration', 'percent_complete', 'actual_cost')
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop("request")
@@ -42,7 +44,7 @@ class TaskForm(BootstrapForm, forms.ModelForm):
 class PredecessorForm(BootstrapForm, forms.ModelForm):
     class Meta:
         model = Predecessor
-        fields = ('from_task', 'to_task','start_type')
+        fields = ('from_task', 'to_task','start_type', 'lag')
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('request', None)
@@ -51,7 +53,7 @@ class PredecessorForm(BootstrapForm, forms.ModelForm):
 class PredecessorForm(BootstrapForm, forms.ModelForm):
     class Meta:
         model = Predecessor
-        fields = ('from_task', 'to_task', 'start_type')
+        fields = ('from_task', 'to_task', 'start_type', 'lag')
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('request', None)
@@ -172,3 +174,10 @@ class GanttFilterForm(forms.Form):
         self.request = kwargs.pop("request")
         super().__init__(*args, **kwargs)
 
+
+
+class RiskSimulationForm(forms.Form):
+    iterations = forms.IntegerField(min_value=1, max_value=100000, required=False)
+
+    def clean_iterations(self):
+        return self.cleaned_data['iterations'] or 1000
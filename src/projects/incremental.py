@@ -0,0 +1,445 @@
+"""
+Incremental CPM recomputation.
+
+``IncrementalSchedule`` keeps the last computed schedule of one project in
+memory together with a mutable adjacency and a topological order.  An edit
+(task dates, new/changed/removed link) re-runs the forward pass only over the
+downstream cone of the change and the backward pass only over the upstream
+cone, visiting nodes in topological order and stopping wherever the values
+come out unchanged.  ``UpdateStats`` reports how many nodes each pass touched.
+
+Edges added against the current order are absorbed with the Pearce-Kelly
+dynamic topological sort, which only reorders the affected region.
+
+States are kept per process in a small LRU registry.  A version counter in
+the Django cache is bumped on every change so that a process which missed a
+change (it happened in another worker) rebuilds from the database instead of
+serving a stale schedule.  Changes are applied once their transaction
+commits; until then the thread that made them reads the project from the
+database, so it sees its own uncommitted edits.
+
+The registry and the kept states are shared by the threads of a process:
+``registry_lock`` guards the registry and every change applied to a kept
+state, and is held by readers for as long as they need a consistent view.
+"""
+import datetime
+import heapq
+from array import array
+from collections import OrderedDict, namedtuple
+from threading import RLock, local
+
+from django.core.cache import cache
+from django.db import transaction
+
+from projects.schedule_engine import CycleError, FS, SS, FF, SF, ScheduleGraph, ScheduleResult
+
+
+UpdateStats = namedtuple('UpdateStats', ['forward', 'backward'])
+
+REGISTRY_SIZE = 32
+
+_registry = OrderedDict()
+
+registry_lock = RLock()
+
+# Projects with changes waiting for the current transaction to commit, per thread.
+_pending = local()
+
+
+class IncrementalSchedule:
+    """
+    Schedule of one project keyed by task primary key.
+
+    Times are day offsets from ``epoch``; ``release`` holds every task's own
+    start (activities never start before it) and the project finishes on the
+    later of the last ``end`` and the last early finish, as in
+    ``Project.compute_schedule``.
+    """
+
+    def __init__(self, epoch, tasks, links, version=0):
+        """
+        tasks : iterable of (key, start_date, end_date)
+        links : iterable of (pred_key, succ_key, link_type, lag)
+        """
+        self.epoch = epoch
+        self.version = version
+        self.keys = []
+        self.index = {}
+        self.alive = []
+        self.dur = []
+        self.release = []
+        self.end = []
+        self.preds = []
+        self.succs = []
+        for key, start, end in tasks:
+            self._append(key, start, end)
+        for pred, succ, link_type, lag in links:
+            u, v = self.index[pred], self.index[succ]
+            self.succs[u][v] = (link_type, lag or 0)
+            self.preds[v][u] = (link_type, lag or 0)
+
+        self.order = self._kahn()
+        self.pos = [0] * len(self.keys)
+        for p, v in enumerate(self.order):
+            self.pos[v] = p
+
+        n = len(self.keys)
+        self.es = [0] * n
+        self.ef = [0] * n
+        self.ls = [0] * n
+        self.lf = [0] * n
+        self.project_duration = 0
+        self.last_update = self._full()
+
+    @classmethod
+    def from_project(cls, project_id, version=0):
+        from projects.models import Task, Predecessor
+
+        tasks = list(Task.objects.filter(project_id=project_id).values_list('id', 'start_date', 'end_date'))
+        links = Predecessor.objects.filter(
+            to_task__project_id=project_id, from_task__project_id=project_id
+        ).values_list('from_task_id', 'to_task_id', 'start_type', 'lag')
+        epoch = min((start for _, start, _ in tasks), default=None)
+        return cls(epoch, tasks, links, version=version)
+
+    # Structure ---------------------------------------------------------
+
+    def _append(self, key, start, end):
+        v = len(self.keys)
+        self.keys.append(key)
+        self.index[key] = v
+        self.alive.append(True)
+        self.dur.append((end - start).days)
+        self.release.append((start - self.epoch).days)
+        self.end.append((end - self.epoch).days)
+        self.preds.append({})
+        self.succs.append({})
+        return v
+
+    def _kahn(self):
+        n = len(self.keys)
+        indegree = [len(p) for p in self.preds]
+        order = [v for v in range(n) if indegree[v] == 0]
+        head = 0
+        while head < len(order):
+            u = order[head]
+            head += 1
+            for w in self.succs[u]:
+                indegree[w] -= 1
+                if indegree[w] == 0:
+                    order.append(w)
+        if len(order) != n:
+            stuck = next(self.keys[v] for v in range(n) if indegree[v] > 0)
+            raise CycleError(f"Cycle detected at activity: {stuck}")
+        return order
+
+    def _reorder(self, u, v):
+        """Pearce-Kelly: restore the topological order after adding u -> v."""
+        pos = self.pos
+        lower, upper = pos[v], pos[u]
+
+        forward, stack, seen = [], [v], {v}
+        while stack:
+            w = stack.pop()
+            forward.append(w)
+            for x in self.succs[w]:
+                if x == u:
+                    raise CycleError(f"Cycle detected at activity: {self.keys[u]}")
+                if x not in seen and pos[x] <= upper:
+                    seen.add(x)
+                    stack.append(x)
+
+        backward, stack, seen = [], [u], {u}
+        while stack:
+            w = stack.pop()
+            backward.append(w)
+            for x in self.preds[w]:
+                if x not in seen and pos[x] >= lower:
+                    seen.add(x)
+                    stack.append(x)
+
+        forward.sort(key=pos.__getitem__)
+        backward.sort(key=pos.__getitem__)
+        nodes = backward + forward
+        slots = sorted(pos[w] for w in nodes)
+        for w, p in zip(nodes, slots):
+            pos[w] = p
+            self.order[p] = w
+
+    # Passes -------------------------------------------------------------
+
+    def _early_start(self, v):
+        start = self.release[v]
+        d = self.dur[v]
+        es, ef = self.es, self.ef
+        for u, (t, lag) in self.preds[v].items():
+            bound = (ef[u] if t == FS or t == FF else es[u]) + lag
+            if t == FF or t == SF:
+                bound -= d
+            if bound > start:
+                start = bound
+        return start
+
+    def _late_finish(self, v):
+        finish = self.project_duration
+        d = self.dur[v]
+        ls, lf = self.ls, self.lf
+        for w, (t, lag) in self.succs[v].items():
+            bound = (lf[w] if t == FF or t == SF else ls[w]) - lag
+            if t == SS or t == SF:
+                bound += d
+            if bound < finish:
+                finish = bound
+        return finish
+
+    def _project_duration(self):
+        return max(max(self.ef, default=0), max(self.end, default=0))
+
+    def _full(self):
+        for v in self.order:
+            self.es[v] = self._early_start(v)
+            self.ef[v] = self.es[v] + self.dur[v]
+        self.project_duration = self._project_duration()
+        for v in reversed(self.order):
+            self.lf[v] = self._late_finish(v)
+            self.ls[v] = self.lf[v] - self.dur[v]
+        n = sum(self.alive)
+        return UpdateStats(n, n)
+
+    def _propagate(self, forward_seeds, backward_seeds):
+        pos = self.pos
+
+        touched_forward = 0
+        heap = [(pos[v], v) for v in set(forward_seeds)]
+        heapq.heapify(heap)
+        queued = {v for _, v in heap}
+        while heap:
+            _, v = heapq.heappop(heap)
+            queued.discard(v)
+            touched_forward += 1
+            es = self._early_start(v)
+            ef = es + self.dur[v]
+            if es == self.es[v] and ef == self.ef[v]:
+                continue
+            self.es[v] = es
+            self.ef[v] = ef
+            for w in self.succs[v]:
+                if w not in queued:
+                    queued.add(w)
+                    heapq.heappush(heap, (pos[w], w))
+
+        # A new project finish moves every late finish that sits on the finish
+        # line: the sinks, and anything clamped there by SS/SF links.
+        project_duration = self._project_duration()
+        backward_seeds = set(backward_seeds)
+        if project_duration != self.project_duration:
+            line = min(project_duration, self.project_duration)
+            self.project_duration = project_duration
+            backward_seeds.update(
+                v for v in range(len(self.keys))
+                if self.alive[v] and (not self.succs[v] or self.lf[v] >= line)
+            )
+
+        touched_backward = 0
+        heap = [(-pos[v], v) for v in backward_seeds]
+        heapq.heapify(heap)
+        queued = set(backward_seeds)
+        while heap:
+            _, v = heapq.heappop(heap)
+            queued.discard(v)
+            touched_backward += 1
+            lf = self._late_finish(v)
+            ls = lf - self.dur[v]
+            if lf == self.lf[v] and ls == self.ls[v]:
+                continue
+            self.lf[v] = lf
+            self.ls[v] = ls
+            for u in self.preds[v]:
+                if u not in queued:
+                    queued.add(u)
+                    heapq.heappush(heap, (-pos[u], u))
+
+        self.last_update = UpdateStats(touched_forward, touched_backward)
+        return self.last_update
+
+    # Edits ----------------------------------------------------------------
+
+    def set_task(self, key, start, end):
+        """Insert or update a task's dates."""
+        if self.epoch is None or start < self.epoch:
+            raise _Rebuild()
+        v = self.index.get(key)
+        if v is None:
+            v = self._append(key, start, end)
+            self.order.append(v)
+            self.pos.append(len(self.order) - 1)
+            for values in (self.es, self.ef, self.ls, self.lf):
+                values.append(0)
+            return self._propagate([v], [v])
+        self.dur[v] = (end - start).days
+        self.release[v] = (start - self.epoch).days
+        self.end[v] = (end - self.epoch).days
+        return self._propagate([v], [v])
+
+    def set_duration(self, key, days):
+        """Change a task's duration, keeping its start."""
+        v = self.index[key]
+        self.dur[v] = days
+        self.end[v] = self.release[v] + days
+        return self._propagate([v], [v])
+
+    def remove_task(self, key):
+        v = self.index.pop(key, None)
+        if v is None:
+            return UpdateStats(0, 0)
+        forward = list(self.succs[v])
+        backward = list(self.preds[v])
+        for w in forward:
+            del self.preds[w][v]
+        for u in backward:
+            del self.succs[u][v]
+        self.succs[v] = {}
+        self.preds[v] = {}
+        self.alive[v] = False
+        self.dur[v] = self.release[v] = self.end[v] = 0
+        return self._propagate(forward + [v], backward + [v])
+
+    def set_link(self, pred, succ, link_type, lag=0):
+        """Insert or update a link; raises CycleError if it would close a cycle."""
+        u, v = self.index[pred], self.index[succ]
+        if u == v:
+            raise CycleError(f"Cycle detected at activity: {pred}")
+        if self.pos[u] > self.pos[v]:
+            self._reorder(u, v)
+        self.succs[u][v] = (link_type, lag or 0)
+        self.preds[v][u] = (link_type, lag or 0)
+        return self._propagate([v], [u])
+
+    def remove_link(self, pred, succ):
+        u, v = self.index.get(pred), self.index.get(succ)
+        if u is None or v is None or v not in self.succs[u]:
+            return UpdateStats(0, 0)
+        del self.succs[u][v]
+        del self.preds[v][u]
+        return self._propagate([v], [u])
+
+    # Output -------------------------------------------------------------------
+
+    def values(self, key):
+        v = self.index[key]
+        day = datetime.timedelta(days=1)
+        return {
+            'early_start': self.epoch + self.es[v] * day,
+            'early_finish': self.epoch + self.ef[v] * day,
+            'late_start': self.epoch + self.ls[v] * day,
+            'late_finish': self.epoch + self.lf[v] * day,
+            'slack': (self.ls[v] - self.es[v]) * day,
+        }
+
+    def as_dict(self):
+        return {key: self.values(key) for key in self.index}
+
+    def to_result(self):
+        """The kept schedule as a ``ScheduleResult``, keys in ``index`` order."""
+        slots = list(self.index.values())
+        edges = [
+            (self.keys[u], self.keys[v], link_type, lag)
+            for u in slots for v, (link_type, lag) in self.succs[u].items()
+        ]
+        graph = ScheduleGraph(self.index, [self.dur[v] for v in slots], edges)
+        return ScheduleResult(
+            graph, *(array('q', (values[v] for v in slots)) for values in (self.es, self.ef, self.ls, self.lf)),
+            self.project_duration,
+        )
+
+
+class _Rebuild(Exception):
+    """The change cannot be applied in place; the state has to be reloaded."""
+
+
+def _version_key(project_id):
+    return f"projects:schedule_version:{project_id}"
+
+
+def bump_version(project_id):
+    key = _version_key(project_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def current_version(project_id):
+    """Schedule version of a project; changes whenever a task or link does."""
+    version = cache.get(_version_key(project_id))
+    if version is None:
+        cache.add(_version_key(project_id), 0, timeout=None)
+        version = 0
+    return version
+
+
+def _pending_projects():
+    if not transaction.get_connection().in_atomic_block:
+        _pending.__dict__.clear()
+    return _pending.__dict__.setdefault('projects', set())
+
+
+def get_incremental_schedule(project_id, refresh=False):
+    """
+    Return the kept schedule of a project, (re)building it when stale or
+    with ``refresh``.  While the current transaction has uncommitted changes
+    of the project, a schedule of the database state is returned and not kept.
+    """
+    if project_id in _pending_projects():
+        return IncrementalSchedule.from_project(project_id)
+    version = current_version(project_id)
+    with registry_lock:
+        state = _registry.get(project_id)
+        if not refresh and state is not None and state.version == version:
+            _registry.move_to_end(project_id)
+            return state
+    # Loaded outside the lock, so one project's rebuild does not hold up the others.
+    state = IncrementalSchedule.from_project(project_id, version=version)
+    with registry_lock:
+        _registry[project_id] = state
+        _registry.move_to_end(project_id)
+        while len(_registry) > REGISTRY_SIZE:
+            _registry.popitem(last=False)
+    return state
+
+
+def last_update(project_id):
+    """``UpdateStats`` of the last change applied to a kept schedule, or None."""
+    with registry_lock:
+        state = _registry.get(project_id)
+        return state.last_update if state is not None else None
+
+
+def apply_change(project_id, change, *args):
+    """
+    Apply ``change`` (an IncrementalSchedule method name) to the kept schedule
+    of ``project_id`` once the current transaction commits.
+    """
+    def apply():
+        _pending_projects().discard(project_id)
+        version = bump_version(project_id)
+        with registry_lock:
+            state = _registry.get(project_id)
+            if state is None:
+                return
+            if state.version != version - 1:
+                _registry.pop(project_id, None)
+                return
+            try:
+                getattr(state, change)(*args)
+            except (_Rebuild, KeyError, CycleError):
+                # The state may be half changed: drop it and mark it stale.
+                _registry.pop(project_id, None)
+                state.version = None
+                return
+            state.version = version
+
+    _pending_projects().add(project_id)
+    transaction.on_commit(apply)
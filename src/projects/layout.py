@@ -0,0 +1,135 @@
+"""
+Layered (Sugiyama-style) layout of activity networks.
+
+Activities are placed left to right on their topological level (see
+``schedule_vectorized.topological_levels``), so every link points right.
+Within a level the order comes from barycentric crossing reduction: a
+bounded number of sweeps, each sorting every level by the mean position of
+its neighbours in the level before (downward) or after (upward).  Every
+level sweep is a couple of ``bincount`` calls over that level's links.
+
+Long links are not split into dummy nodes; they pull on the barycenters of
+both ends like any other link.  Layouts are cached per graph hash.
+"""
+import hashlib
+
+import numpy as np
+from django.core.cache import cache
+
+from projects.schedule_vectorized import csr_arrays, topological_levels
+
+
+SWEEPS = 4
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def graph_hash(graph):
+    """Hash of a ScheduleGraph's keys and links."""
+    digest = hashlib.sha1()
+    digest.update(repr(graph.keys).encode())
+    digest.update(bytes(graph.pred_ptr))
+    digest.update(bytes(graph.pred_idx))
+    return digest.hexdigest()
+
+
+def _sort_level(nodes, owner, neighbour, pos, local):
+    """Reorder ``nodes`` by the barycenter of their links ``owner -> neighbour``."""
+    count = np.bincount(local[owner], minlength=len(nodes))
+    total = np.bincount(local[owner], weights=pos[neighbour], minlength=len(nodes))
+    current = pos[nodes]
+    barycenter = np.where(count > 0, total / np.maximum(count, 1), current)
+    # Ties keep the current order, so a sweep never undoes the previous one for nothing.
+    order = np.lexsort((current, barycenter))
+    nodes = nodes[order]
+    pos[nodes] = np.arange(len(nodes)) - (len(nodes) - 1) / 2
+    local[nodes] = np.arange(len(nodes))
+    return nodes
+
+
+def _inversions(values):
+    """Number of pairs i < j with values[i] > values[j], for values in [0, len)."""
+    n = len(values)
+    span = max(n, 1)
+    ids = np.arange(n)
+    total = 0
+    width = 1
+    while width < n:
+        # ``values`` is made of sorted runs of ``width``; count the inversions
+        # between each pair of runs, then merge the pairs.
+        block = ids // (2 * width)
+        right = (ids // width) % 2 == 1
+        keys = values + block * span
+        left_keys = keys[~right]
+        left_end = np.searchsorted(left_keys, (block[right] + 1) * span)
+        total += int((left_end - np.searchsorted(left_keys, keys[right], side='right')).sum())
+        values = np.sort(keys) % span
+        width *= 2
+    return total
+
+
+def count_crossings(x, y, src, dst):
+    """Crossings between links of neighbouring levels."""
+    order = np.lexsort((y[dst], y[src], x[src]))
+    heads = np.lexsort((y[src], y[dst], x[dst]))
+    rank = np.empty(len(heads), dtype=np.int64)
+    rank[heads] = np.arange(len(heads))
+    return _inversions(rank[order])
+
+
+def layered_layout(graph, sweeps=SWEEPS):
+    """
+    ``(x, y)`` float arrays aligned with the graph ids: ``x`` is the
+    topological level, ``y`` the centred position within the level.
+    """
+    n = len(graph)
+    levels = [np.sort(nodes) for nodes in topological_levels(graph)]
+    _, _, succ_ptr, succ_idx = csr_arrays(graph)
+    src = np.repeat(np.arange(n, dtype=np.int64), np.diff(succ_ptr))
+    dst = succ_idx
+
+    x = np.zeros(n)
+    pos = np.zeros(n)
+    local = np.zeros(n, dtype=np.int64)
+    for level, nodes in enumerate(levels):
+        x[nodes] = level
+        pos[nodes] = np.arange(len(nodes)) - (len(nodes) - 1) / 2
+        local[nodes] = np.arange(len(nodes))
+
+    # Only links between neighbouring levels take part: the end of a long
+    # link is not where its barycenter pull would be drawn.
+    short = x[dst] - x[src] == 1
+    src, dst = src[short], dst[short]
+
+    # Links grouped by the level of their head (downward) and tail (upward).
+    by_head = np.argsort(x[dst], kind='stable')
+    head_split = np.searchsorted(x[dst][by_head], np.arange(len(levels) + 1))
+    by_tail = np.argsort(x[src], kind='stable')
+    tail_split = np.searchsorted(x[src][by_tail], np.arange(len(levels) + 1))
+
+    # Sweeps can make things worse on graphs that start out well ordered,
+    # so the order with the fewest crossings seen is kept.
+    best, fewest = pos.copy(), count_crossings(x, pos, src, dst)
+    for _ in range(sweeps):
+        if not fewest:
+            break
+        for level in range(1, len(levels)):
+            links = by_head[head_split[level]:head_split[level + 1]]
+            levels[level] = _sort_level(levels[level], dst[links], src[links], pos, local)
+        for level in range(len(levels) - 2, -1, -1):
+            links = by_tail[tail_split[level]:tail_split[level + 1]]
+            levels[level] = _sort_level(levels[level], src[links], dst[links], pos, local)
+        crossings = count_crossings(x, pos, src, dst)
+        if crossings < fewest:
+            best, fewest = pos.copy(), crossings
+    return x, best
+
+
+def cached_layout(graph, sweeps=SWEEPS):
+    """``layered_layout`` through the cache, keyed by the graph hash."""
+    key = f"projects:layout:{graph_hash(graph)}:{sweeps}"
+    layout = cache.get(key)
+    if layout is None:
+        layout = layered_layout(graph, sweeps=sweeps)
+        cache.set(key, layout, CACHE_TIMEOUT)
+    return layout
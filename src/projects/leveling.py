@@ -0,0 +1,168 @@
+"""
+Resource-constrained scheduling (resource leveling).
+
+A serial schedule-generation scheme: activities become eligible once all
+their predecessors are placed, and a heap hands out the eligible activity
+with the smallest priority, by default its CPM late start.  Each activity
+starts at the earliest day that satisfies its links and keeps every
+assigned resource within capacity for its whole duration.
+
+Resource usage is a (resources x days) profile array that grows on demand.
+The earliest fitting start is found with one cumulative sum over a window
+of the profile instead of probing day by day.
+"""
+import heapq
+
+import numpy as np
+
+from django.db import transaction
+
+from projects.schedule_engine import CycleError, schedule, FS, SS, FF, SF
+
+
+class LevelingError(ValueError):
+    """An activity needs more units of a resource than it has."""
+
+
+class ResourceProfile:
+    """Units in use per resource and day."""
+
+    def __init__(self, capacities, horizon=256):
+        self.capacities = np.asarray(capacities, dtype=np.int64)
+        self.usage = np.zeros((len(self.capacities), max(horizon, 1)), dtype=np.int64)
+
+    def _reserve(self, end):
+        if end > self.usage.shape[1]:
+            grown = np.zeros((self.usage.shape[0], max(end, 2 * self.usage.shape[1])), dtype=np.int64)
+            grown[:, :self.usage.shape[1]] = self.usage
+            self.usage = grown
+
+    def earliest_fit(self, demand, start, duration):
+        """First day >= ``start`` from which ``demand`` fits for ``duration`` days."""
+        span = max(4 * duration, 64)
+        while True:
+            end = start + span + duration
+            self._reserve(end)
+            blocked = np.zeros(span + duration, dtype=bool)
+            for r, units in demand:
+                blocked |= self.usage[r, start:end] > self.capacities[r] - units
+            if not blocked.any():
+                return start
+            blocked_days = np.concatenate(([0], np.cumsum(blocked)))
+            free = np.flatnonzero(blocked_days[duration:] - blocked_days[:span + 1] == 0)
+            if free.size:
+                return start + int(free[0])
+            start += span + 1
+            span *= 2
+
+    def book(self, demand, start, duration):
+        self._reserve(start + duration)
+        for r, units in demand:
+            self.usage[r, start:start + duration] += units
+
+
+def level(graph, demands, capacities, priority=None, release=None):
+    """
+    Serial schedule generation over ``graph``.
+
+    demands    : per id, a list of ``(resource_index, units)``
+    capacities : units available per resource index
+    priority   : per id sort key, lower goes first (default: the id)
+    release    : optional per id earliest start offsets
+
+    Returns the start offset of every id.
+    """
+    graph.topological_order()
+    n = len(graph)
+    dur = graph.durations
+    pred_ptr, pred_idx, pred_type, pred_lag = graph.pred_ptr, graph.pred_idx, graph.pred_type, graph.pred_lag
+    succ_ptr, succ_idx = graph.succ_ptr, graph.succ_idx
+    profile = ResourceProfile(capacities)
+    for v in range(n):
+        for r, units in demands[v]:
+            if units > profile.capacities[r]:
+                raise LevelingError(f"{graph.keys[v]} needs {units} units of a resource with capacity {profile.capacities[r]}.")
+
+    rank = list(range(n)) if priority is None else priority
+    remaining = [pred_ptr[v + 1] - pred_ptr[v] for v in range(n)]
+    heap = [(rank[v], v) for v in range(n) if remaining[v] == 0]
+    heapq.heapify(heap)
+    start = [0] * n
+    finish = [0] * n
+    placed = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        d = dur[v]
+        t = 0 if release is None else release[v]
+        for k in range(pred_ptr[v], pred_ptr[v + 1]):
+            u = pred_idx[k]
+            link = pred_type[k]
+            bound = (finish[u] if link == FS or link == FF else start[u]) + pred_lag[k]
+            if link == FF or link == SF:
+                bound -= d
+            if bound > t:
+                t = bound
+        if demands[v] and d > 0:
+            t = profile.earliest_fit(demands[v], t, d)
+            profile.book(demands[v], t, d)
+        start[v] = t
+        finish[v] = t + d
+        placed += 1
+        for k in range(succ_ptr[v], succ_ptr[v + 1]):
+            w = succ_idx[k]
+            remaining[w] -= 1
+            if remaining[w] == 0:
+                heapq.heappush(heap, (rank[w], w))
+    if placed != n:
+        raise CycleError("Cycle detected while leveling.")
+    return start
+
+
+def level_project(project_id):
+    """
+    Level a project's CPM schedule against its resource assignments.
+
+    Returns ``(inputs, result)``: the project's ``ScheduleInputs`` and a
+    schedule whose early dates are the leveled dates.  Its late dates come
+    from a precedence-only backward pass against the leveled finish.
+    """
+    from projects.models import Assignment, load_schedule_inputs
+
+    inputs = load_schedule_inputs(project_id)
+    if inputs is None:
+        return None, None
+    graph = inputs.graph
+    cpm = schedule(graph, release=inputs.release, project_finish=inputs.finish)
+
+    assignments = Assignment.objects.filter(task__project_id=project_id).values_list(
+        'task_id', 'resource_id', 'units', 'resource__capacity')
+    resources = {}
+    capacities = []
+    demands = [[] for _ in range(len(graph))]
+    for task_id, resource_id, units, capacity in assignments:
+        if resource_id not in resources:
+            resources[resource_id] = len(capacities)
+            capacities.append(capacity)
+        demands[graph.index[task_id]].append((resources[resource_id], units))
+
+    priority = list(zip(cpm.ls, cpm.es, range(len(graph))))
+    starts = level(graph, demands, capacities, priority=priority, release=inputs.release)
+    result = schedule(graph, release=starts, project_finish=inputs.finish)
+    return inputs, result
+
+
+def store_leveled_schedule(project_id):
+    """Level a project and write the result as a new CPMReport."""
+    from projects.models import Project, CPMReport
+
+    inputs, result = level_project(project_id)
+    project = Project.objects.get(pk=project_id)
+    with transaction.atomic():
+        cpmreport = CPMReport.objects.create(name=f"Resource-leveled schedule ({project.name})", project=project)
+        if result is not None:
+            dates = inputs.to_datetimes(result)
+            cpmreport.store_rows(
+                (key, *dates[key], max(result.ls[v] - result.es[v], 0))
+                for v, key in enumerate(result.graph.keys)
+            )
+    return cpmreport
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.schedule_engine import ScheduleGraph, schedule
+from projects.schedule_vectorized import schedule_vectorized, topological_levels
+from projects.benchmarks import layered_graph
+
+
+class Command(BaseCommand):
+    help = "Compares the per-activity CPM loop against the vectorized level-synchronous passes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100000)
+        parser.add_argument('--width', type=int, default=500, help="Tasks per layer")
+        parser.add_argument('--fan-in', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['tasks'] < 1 or options['width'] < 1:
+            raise CommandError("--tasks and --width must be positive")
+
+        started = time.perf_counter()
+        durations, edges = layered_graph(options['tasks'], options['width'], options['fan_in'], options['seed'])
+        graph = ScheduleGraph(range(options['tasks']), durations, edges)
+        graph.topological_order()
+        levels = topological_levels(graph)
+        self.stdout.write(
+            f"Built {len(graph)} tasks / {graph.edge_count} edges / {len(levels)} levels "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+
+        loop_time, loop_result = self._best_of(options['repeat'], lambda: schedule(graph))
+        vector_time, vector_result = self._best_of(options['repeat'], lambda: schedule_vectorized(graph, levels))
+
+        if list(loop_result.es) != vector_result.es.tolist() or list(loop_result.ls) != vector_result.ls.tolist():
+            raise CommandError("Vectorized schedule differs from the loop schedule")
+
+        self.stdout.write(f"loop:       {loop_time:.3f}s")
+        self.stdout.write(f"vectorized: {vector_time:.3f}s")
+        self.stdout.write(
+            self.style.SUCCESS(f"Speed-up x{loop_time / vector_time:.1f} (project duration {loop_result.project_duration} days)")
+        )
+
+    def _best_of(self, repeat, func):
+        best = None
+        result = None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
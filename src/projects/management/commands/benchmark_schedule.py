@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from companies.models import Company
+from projects import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmarks every scheduling stage on synthetic DAGs and writes the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shapes', default=','.join(benchmarks.SHAPES),
+                            help="Comma separated, from: " + ', '.join(benchmarks.SHAPES))
+        parser.add_argument('--sizes', default=','.join(str(size) for size in benchmarks.SIZES))
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc run")
+        parser.add_argument('--company', type=int, help="Also run the database stages in a rolled back project of this company")
+        parser.add_argument('--charts', action='store_true', help="With --company, also time the full build_report")
+        parser.add_argument('--output', help="Write the JSON here instead of stdout")
+
+    def handle(self, *args, **options):
+        shapes = [shape.strip() for shape in options['shapes'].split(',') if shape.strip()]
+        unknown = set(shapes) - set(benchmarks.SHAPES)
+        if unknown:
+            raise CommandError(f"Unknown shapes: {', '.join(sorted(unknown))}")
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of integers")
+
+        company = None
+        if options['company']:
+            company = Company.objects.get(pk=options['company'])
+        if options['charts'] and company is None:
+            raise CommandError("--charts needs --company")
+
+        def progress(row):
+            self.stderr.write(
+                f"{row['shape']:>9} {row['tasks']:>7} {row['stage']:<26} "
+                f"{row['wall_s']:>10.4f}s {row['peak_kb'] or 0:>9} KiB {row['queries']:>4} queries"
+            )
+
+        report = benchmarks.run(
+            shapes, sizes, repeat=options['repeat'], memory=not options['no_memory'],
+            company=company, charts=options['charts'], seed=options['seed'], progress=progress,
+        )
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output)
+            self.stderr.write(self.style.SUCCESS(f"Wrote {len(report['results'])} results to {options['output']}"))
+        else:
+            self.stdout.write(output)
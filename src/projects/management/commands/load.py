@@ -81,7 +81,8 @@ class Command(BaseCommand):
                     Predecessor.objects.get_or_create(to_task=task,from_task=d,start_type=Predecessor.SF)
 
         data = []
-        tasks = Task.objects.prefetch_related('project__category__company__profiles','predecessors').filter(project__category__company__profiles=user.profile.pk,project_id=project.pk)
+        tasks = Task.objects.prefetch_related('successor_tasks__from_task').filter(project__category__company__profiles=user.profile.pk,project_id=project.pk)
+        project.compute_schedule(refresh=True)
         for task in tasks:
             activity = {}
             activity['activity'] = task.name
@@ -1,10 +1,267 @@
 import datetime
-from django.db import models
-
-from django.db.models import Min, Max
+from threading import local
+from django.db import models, connection, transaction
+
+from django.db.models import Min, Max, Q
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.core.signals import request_started
+from celery.signals import task_prerun
 # Create your models here.
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+from django.core.cache import cache
 from core.models import Timestamped
+from companies.models import WorkCalendar, Holiday
+from projects.schedule_engine import ScheduleGraph, schedule, float_paths, free_float
+from projects import incremental, calendars
+
+
+# First key of the pg_advisory_xact_lock taken while a link is checked and saved.
+PREDECESSOR_LOCK_NAMESPACE = 7301
+
+# CPM report rows are written with bulk_create in batches of REPORT_BATCH_SIZE,
+# or streamed with COPY on PostgreSQL from REPORT_COPY_ROWS rows upwards.
+REPORT_BATCH_SIZE = 2000
+REPORT_COPY_ROWS = 20000
+
+# The stored Task schedule columns are refreshed at most once per
+# TASK_SCHEDULE_DELAY seconds per project, in batches of TASK_SCHEDULE_BATCH_SIZE.
+TASK_SCHEDULE_DELAY = 5
+TASK_SCHEDULE_BATCH_SIZE = 1000
+
+
+# Per-request memo of computed schedules: {project_id: {task_id: values}}.
+# Cleared when a request or a Celery task starts and whenever tasks or links change.
+_schedule_memo = local()
+
+
+def _working_calendar(project_id):
+    """The busday calendar of a project scheduled in working days, else None."""
+    row = Project.objects.filter(pk=project_id).values_list('working_days', 'category__company_id').first()
+    if not row or not row[0]:
+        return None
+    return calendars.get_busdaycalendar(row[1])
+
+
+class ScheduleInputs:
+    """
+    Engine inputs of one project: the dependency graph keyed by task id, the
+    per-task release offsets (every ``start_date``, see
+    ``get_project_schedule``) and the finish offset of the last ``end_date``,
+    all counted from ``epoch`` in days (working days with a ``calendar``).
+    """
+    __slots__ = ('epoch', 'graph', 'release', 'finish', 'calendar')
+
+    def __init__(self, epoch, graph, release, finish, calendar=None):
+        self.epoch = epoch
+        self.graph = graph
+        self.release = release
+        self.finish = finish
+        self.calendar = calendar
+
+    def to_datetimes(self, result):
+        """``{task_id: (es, ef, ls, lf)}`` of an engine result as datetimes."""
+        if self.calendar is None:
+            return result.to_datetimes(self.epoch)
+        columns = [calendars.from_workdays(self.epoch, offsets, self.calendar)
+                   for offsets in (result.es, result.ef, result.ls, result.lf)]
+        return dict(zip(self.graph.keys, zip(*columns)))
+
+
+def load_schedule_inputs(project_id):
+    """
+    Load a project's tasks and predecessor links in two queries (plus the
+    work calendar lookup) as ``ScheduleInputs``; None without tasks.
+    """
+    tasks = list(Task.objects.filter(project_id=project_id).values_list('id', 'start_date', 'end_date'))
+    if not tasks:
+        return None
+    edges = Predecessor.objects.filter(
+        to_task__project_id=project_id, from_task__project_id=project_id
+    ).values_list('from_task_id', 'to_task_id', 'start_type', 'lag')
+
+    epoch = min(start for _, start, _ in tasks)
+    calendar = _working_calendar(project_id)
+    if calendar is None:
+        durations = [(end - start).days for _, start, end in tasks]
+        release = [(start - epoch).days for _, start, _ in tasks]
+        finish = max((end - epoch).days for _, _, end in tasks)
+    else:
+        release, durations, finish = calendars.to_workdays(
+            epoch, [start for _, start, _ in tasks], [end for _, _, end in tasks], calendar)
+    graph = ScheduleGraph([pk for pk, _, _ in tasks], durations, edges)
+    return ScheduleInputs(epoch, graph, release, finish, calendar)
+
+
+def get_project_schedule(project_id, refresh=False):
+    """
+    Compute ES/EF/LS/LF/slack for every task of a project in one pass.
+
+    Projects in calendar days are served from the kept incremental schedule
+    (see ``incremental.get_incremental_schedule``), which follows task and
+    link changes without a reload; ``refresh`` rebuilds it from the
+    database.  The values are memoized for the rest of the request.
+
+    Every task's ``start_date`` is a start-no-earlier-than constraint: tasks
+    without predecessors start on it, and linked tasks start on the later
+    of it and the dates their links allow, so a task planned after its
+    predecessors finish keeps its planned start and the gap shows up as
+    float upstream.  The project finishes on the later of the last
+    ``end_date`` and the last early finish.
+
+    Projects with ``working_days`` set are scheduled in working days of their
+    company's ``WorkCalendar`` by a full pass; ``work_duration`` and
+    ``total_float`` are in those units, ``slack`` stays a calendar timedelta.
+    """
+    memo = _schedule_memo.__dict__
+    if not refresh and project_id in memo:
+        return memo[project_id]
+    memo.pop(('result', project_id), None)
+    memo.pop(('state', project_id), None)
+
+    if _working_calendar(project_id) is not None:
+        return _calendar_schedule(project_id)
+
+    state = incremental.get_incremental_schedule(project_id, refresh=refresh)
+    values = {}
+    with incremental.registry_lock:
+        for pk, v in state.index.items():
+            row = state.values(pk)
+            row['work_duration'] = state.dur[v]
+            row['total_float'] = state.ls[v] - state.es[v]
+            values[pk] = row
+        version = state.version
+    memo[project_id] = values
+    memo[('state', project_id)] = (state, version)
+    return values
+
+
+def _calendar_schedule(project_id):
+    memo = _schedule_memo.__dict__
+    inputs = load_schedule_inputs(project_id)
+    if inputs is None:
+        memo[project_id] = {}
+        return memo[project_id]
+    graph = inputs.graph
+    result = schedule(graph, release=inputs.release, project_finish=inputs.finish)
+
+    values = {}
+    for v, (pk, (es, ef, ls, lf)) in enumerate(inputs.to_datetimes(result).items()):
+        values[pk] = {
+            'early_start': es,
+            'early_finish': ef,
+            'late_start': ls,
+            'late_finish': lf,
+            'slack': ls - es,
+            'work_duration': graph.durations[v],
+            'total_float': result.ls[v] - result.es[v],
+        }
+    memo[project_id] = values
+    memo[('result', project_id)] = result
+    return values
+
+
+def _schedule_result(project_id, refresh=False):
+    """The engine result behind ``get_project_schedule``, ids in the same order; None without tasks."""
+    memo = _schedule_memo.__dict__
+    while True:
+        get_project_schedule(project_id, refresh=refresh)
+        if ('result', project_id) in memo or ('state', project_id) not in memo:
+            return memo.get(('result', project_id))
+        state, version = memo[('state', project_id)]
+        with incremental.registry_lock:
+            # Another thread may have applied a change since the values were read.
+            if state.version == version:
+                memo[('result', project_id)] = state.to_result() if state.index else None
+                return memo[('result', project_id)]
+        memo.pop(project_id)
+        refresh = False
+
+
+def get_project_paths(project_id, k=None, max_float=None, refresh=False):
+    """
+    Dependency paths of a project ranked by total float, as
+    ``[(float_days, [task_id, ...]), ...]``; see ``float_paths``.
+    """
+    result = _schedule_result(project_id, refresh=refresh)
+    if result is None:
+        return []
+    return [
+        (slack, [result.graph.keys[v] for v in path])
+        for slack, path in float_paths(result, k=k, max_float=max_float)
+    ]
+
+
+def persist_task_schedule(project_id, refresh=True):
+    """
+    Store the computed schedule on the project's tasks, one UPDATE per
+    batch, tagged with the schedule version it was computed for.
+    """
+    version = incremental.current_version(project_id)
+    result = _schedule_result(project_id, refresh=refresh)
+    values = get_project_schedule(project_id)
+    if result is None:
+        return 0
+    free = free_float(result)
+    tasks = [
+        Task(
+            pk=pk, es=row['early_start'], ef=row['early_finish'], ls=row['late_start'], lf=row['late_finish'],
+            total_float=int(row['total_float']), free_float=int(free[v]), is_critical=row['total_float'] <= 0,
+            schedule_version=version,
+        )
+        for v, (pk, row) in enumerate(values.items())
+    ]
+    with transaction.atomic():
+        Task.objects.bulk_update(
+            tasks,
+            ['es', 'ef', 'ls', 'lf', 'total_float', 'free_float', 'is_critical', 'schedule_version'],
+            batch_size=TASK_SCHEDULE_BATCH_SIZE,
+        )
+    return len(tasks)
+
+
+def schedule_inputs_changed(project_ids):
+    """
+    Move the schedule version of ``project_ids`` once the transaction
+    commits and queue the refresh of their stored Task schedule, for changes
+    the task and link receivers do not see: work calendars and ``working_days``.
+    """
+    project_ids = list(project_ids)
+
+    def bump():
+        for project_id in project_ids:
+            incremental.bump_version(project_id)
+
+    _schedule_memo.__dict__.clear()
+    transaction.on_commit(bump)
+    for project_id in project_ids:
+        request_task_schedule_refresh(project_id)
+
+
+def request_task_schedule_refresh(project_id):
+    """Queue one refresh of the stored Task schedule once the transaction commits."""
+    def queue():
+        if cache.add(f"projects:task_schedule_refresh:{project_id}", True, timeout=TASK_SCHEDULE_DELAY * 4):
+            from projects.tasks import refresh_task_schedule
+            refresh_task_schedule.apply_async((project_id,), countdown=TASK_SCHEDULE_DELAY)
+
+    transaction.on_commit(queue, robust=True)
+
+
+def critical_tasks(company_id, start, end):
+    """Critical tasks of a company whose early start falls in ``[start, end)``."""
+    return Task.objects.filter(
+        project__category__company_id=company_id, is_critical=True, es__gte=start, es__lt=end,
+    )
+
+
+@receiver(request_started)
+@receiver(task_prerun)
+def clear_schedule_memo(sender, **kwargs):
+    _schedule_memo.__dict__.clear()
+
 
 class Category(Timestamped):
     company = models.ForeignKey("companies.Company", on_delete=models.CASCADE)
@@ -24,6 +281,7 @@ class Project(Timestamped):
     parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     budget = models.DecimalField(max_digits=18, decimal_places=2,blank=True, null=True)
     name = models.CharField(max_length=100)
+    working_days = models.BooleanField(default=False, help_text="Schedule in working days of the company's work calendar.")
 
     class Meta:
         default_related_name = 'projects'
@@ -33,6 +291,18 @@ class Project(Timestamped):
     def __str__(self):
         return self.name
 
+    def compute_schedule(self, refresh=False):
+        """Return ``{task_id: {'early_start': ..., 'slack': ...}}`` for all tasks."""
+        return get_project_schedule(self.pk, refresh=refresh)
+
+    def critical_chains(self, refresh=False):
+        """Critical chains as ordered lists of task ids."""
+        return [path for _, path in get_project_paths(self.pk, max_float=0, refresh=refresh)]
+
+    def near_critical_paths(self, k=5, refresh=False):
+        """The ``k`` paths with the least total float, as ``(days, [task_id, ...])``."""
+        return get_project_paths(self.pk, k=k, refresh=refresh)
+
 
 class Task(Timestamped):
     project = models.ForeignKey("projects.Project", on_delete=models.CASCADE)
@@ -41,6 +311,24 @@ class Task(Timestamped):
     budget = models.DecimalField(max_digits=18, decimal_places=2,blank=True, null=True)
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
+    optimistic_duration = models.PositiveIntegerField(null=True, blank=True, help_text="PERT optimistic duration in days.")
+    likely_duration = models.PositiveIntegerField(null=True, blank=True, help_text="PERT most likely duration in days.")
+    pessimistic_duration = models.PositiveIntegerField(null=True, blank=True, help_text="PERT pessimistic duration in days.")
+    crash_cost = models.DecimalField(max_digits=18, decimal_places=2, blank=True, null=True, help_text="Extra cost per day the task is shortened.")
+    min_duration = models.PositiveIntegerField(null=True, blank=True, help_text="Shortest possible duration in days when crashed.")
+    percent_complete = models.DecimalField(
+        max_digits=5, decimal_places=2, default=0,
+        validators=[MinValueValidator(0), MaxValueValidator(100)], help_text="Work done, 0-100.")
+    actual_cost = models.DecimalField(max_digits=18, decimal_places=2, blank=True, null=True, help_text="Cost incurred so far.")
+    # Stored copy of the computed schedule, see persist_task_schedule.
+    es = models.DateTimeField(null=True, blank=True, editable=False)
+    ef = models.DateTimeField(null=True, blank=True, editable=False)
+    ls = models.DateTimeField(null=True, blank=True, editable=False)
+    lf = models.DateTimeField(null=True, blank=True, editable=False)
+    total_float = models.IntegerField(null=True, blank=True, editable=False)
+    free_float = models.IntegerField(null=True, blank=True, editable=False)
+    is_critical = models.BooleanField(default=False, editable=False)
+    schedule_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         default_related_name = 'tasks'
@@ -49,6 +337,9 @@ class Task(Timestamped):
         indexes = [
             models.Index(fields=['start_date']),
             models.Index(fields=['end_date']),
+            models.Index(fields=['project', 'is_critical', 'es']),
+            models.Index(fields=['project', 'total_float']),
+            models.Index(fields=['es'], condition=Q(is_critical=True), name='projects_task_critical_es_idx'),
         ]
 
     def __str__(self):
@@ -59,32 +350,33 @@ class Task(Timestamped):
         delta = self.end_date - self.start_date
         return delta.days
 
+    @property
+    def work_duration(self):
+        """Duration in the project's scheduling unit (working days in working-day mode)."""
+        return self._schedule_value('work_duration')
+
+    def _schedule_value(self, name):
+        return get_project_schedule(self.project_id)[self.pk][name]
+
     @property
     def early_start(self):
-        # Compute ES based on predecessors
-        if self.predecessors.exists():
-            return max(predecessor.to_task.early_finish for predecessor in self.predecessor_tasks.all())
-        return self.start_date
+        return self._schedule_value('early_start')
 
     @property
     def early_finish(self):
-        return self.early_start + datetime.timedelta(days=self.duration)
+        return self._schedule_value('early_finish')
 
     @property
     def late_finish(self):
-        # Compute LF based on successors
-        if self.successor_tasks.exists():
-            return min(successor.from_task.late_start for successor in self.successor_tasks.all())
-        return self.project.tasks.aggregate(Max('end_date'))['end_date__max']
+        return self._schedule_value('late_finish')
 
     @property
     def late_start(self):
-        delta = self.late_finish - datetime.timedelta(days=self.duration)
-        return delta
+        return self._schedule_value('late_start')
 
     @property
     def slack(self):
-        return self.late_start - self.early_start
+        return self._schedule_value('slack')
 
 
 class Predecessor(Timestamped):
@@ -98,6 +390,7 @@ class Predecessor(Timestamped):
     from_task = models.ForeignKey("projects.Task", on_delete=models.CASCADE, related_name='predecessor_tasks')
     to_task = models.ForeignKey("projects.Task", on_delete=models.CASCADE, related_name='successor_tasks')
     start_type = models.IntegerField(choices=PREDECESSOR_CHOICES)
+    lag = models.IntegerField(default=0, help_text="Lag in days; negative values are leads.")
 
     class Meta:
         constraints = [
@@ -112,34 +405,167 @@ class Predecessor(Timestamped):
         # Ensure tasks are not the same
         if self.from_task == self.to_task:
             raise ValidationError("A task cannot be its own predecessor.")
+        if self.creates_cycle():
+            raise ValidationError(f"Linking {self.from_task} to {self.to_task} would create a dependency cycle.")
 
-        # Validate based on start_type
+        # Validate based on start_type, shifted by the lag (negative = lead)
+        lag = datetime.timedelta(days=self.lag or 0)
         if self.start_type == self.FS:
             # Finish-to-Start: `to_task` start_date must be after `from_task` end_date
-            if self.to_task.start_date <= self.from_task.end_date:
+            if self.to_task.start_date <= self.from_task.end_date + lag:
                 raise ValidationError("For Finish-to-Start, the successor task must start after the predecessor task finishes.")
         elif self.start_type == self.SS:
             # Start-to-Start: `to_task` start_date must be after or equal to `from_task` start_date
-            if self.to_task.start_date < self.from_task.start_date:
+            if self.to_task.start_date < self.from_task.start_date + lag:
                 raise ValidationError("For Start-to-Start, the successor task must start on or after the predecessor task starts.")
         elif self.start_type == self.FF:
             # Finish-to-Finish: `to_task` end_date must be after or equal to `from_task` end_date
-            if self.to_task.end_date < self.from_task.end_date:
+            if self.to_task.end_date < self.from_task.end_date + lag:
                 raise ValidationError("For Finish-to-Finish, the successor task must finish on or after the predecessor task finishes.")
         elif self.start_type == self.SF:
             # Start-to-Finish: `to_task` end_date must be after `from_task` start_date
-            if self.to_task.end_date <= self.from_task.start_date:
+            if self.to_task.end_date <= self.from_task.start_date + lag:
                 raise ValidationError("For Start-to-Finish, the successor task must finish after the predecessor task starts.")
 
+    def creates_cycle(self):
+        """
+        True if ``to_task`` already reaches ``from_task``, i.e. this link would
+        close a cycle.  One recursive CTE walks the successor links; UNION
+        keeps every task at most once, which bounds the walk by the size of
+        the reachable set.  The row being updated is left out of the walk.
+        """
+        if not self.from_task_id or not self.to_task_id:
+            return False
+        table = connection.ops.quote_name(self._meta.db_table)
+        sql = f"""
+            WITH RECURSIVE reachable(task_id) AS (
+                SELECT to_task_id FROM {table}
+                WHERE from_task_id = %s AND id <> %s
+                UNION
+                SELECT link.to_task_id FROM {table} link
+                JOIN reachable ON link.from_task_id = reachable.task_id
+                WHERE link.id <> %s
+            )
+            SELECT 1 FROM reachable WHERE task_id = %s LIMIT 1
+        """
+        exclude = self.pk or 0
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.to_task_id, exclude, exclude, self.from_task_id])
+            return cursor.fetchone() is not None
+
+    def lock_projects(self):
+        """
+        Serialize link changes per project for the current transaction, so
+        two concurrent inserts cannot each miss the cycle the other closes.
+        """
+        if connection.vendor != 'postgresql':
+            return
+        project_ids = sorted(set(
+            Task.objects.filter(pk__in=[self.from_task_id, self.to_task_id]).values_list('project_id', flat=True)
+        ))
+        with connection.cursor() as cursor:
+            for project_id in project_ids:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [PREDECESSOR_LOCK_NAMESPACE, project_id])
+
     def save(self, *args, **kwargs):
-        self.full_clean()  # Ensures `clean()` is called before saving
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            self.lock_projects()
+            self.full_clean()  # Ensures `clean()` is called before saving
+            super().save(*args, **kwargs)
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Predecessor)
+@receiver(post_delete, sender=Predecessor)
+def invalidate_schedule_memo(sender, instance, **kwargs):
+    _schedule_memo.__dict__.clear()
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def refresh_saved_task_schedule(sender, instance, **kwargs):
+    request_task_schedule_refresh(instance.project_id)
+
+
+@receiver(post_save, sender=Predecessor)
+@receiver(post_delete, sender=Predecessor)
+def refresh_linked_task_schedule(sender, instance, **kwargs):
+    request_task_schedule_refresh(instance.to_task.project_id)
+
+
+@receiver(post_save, sender=Task)
+def schedule_task_saved(sender, instance, **kwargs):
+    incremental.apply_change(instance.project_id, 'set_task', instance.pk, instance.start_date, instance.end_date)
+
+
+@receiver(post_delete, sender=Task)
+def schedule_task_deleted(sender, instance, **kwargs):
+    incremental.apply_change(instance.project_id, 'remove_task', instance.pk)
+
+
+@receiver(post_save, sender=Predecessor)
+def schedule_link_saved(sender, instance, **kwargs):
+    incremental.apply_change(
+        instance.to_task.project_id, 'set_link',
+        instance.from_task_id, instance.to_task_id, instance.start_type, instance.lag,
+    )
+
+
+@receiver(post_delete, sender=Predecessor)
+def schedule_link_deleted(sender, instance, **kwargs):
+    incremental.apply_change(instance.to_task.project_id, 'remove_link', instance.from_task_id, instance.to_task_id)
+
+
+@receiver(pre_save, sender=Project)
+def note_working_days_change(sender, instance, **kwargs):
+    instance._working_days_changed = bool(instance.pk) and not Project.objects.filter(
+        pk=instance.pk, working_days=instance.working_days).exists()
+
+
+@receiver(post_save, sender=Project)
+def schedule_working_days_changed(sender, instance, **kwargs):
+    if getattr(instance, '_working_days_changed', False):
+        schedule_inputs_changed([instance.pk])
+
+
+def _working_day_projects(company_id):
+    return Project.objects.filter(category__company_id=company_id, working_days=True).values_list('pk', flat=True)
+
+
+@receiver(post_save, sender=WorkCalendar)
+@receiver(post_delete, sender=WorkCalendar)
+def schedule_work_calendar_changed(sender, instance, **kwargs):
+    schedule_inputs_changed(_working_day_projects(instance.company_id))
+
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def schedule_holiday_changed(sender, instance, **kwargs):
+    company_id = WorkCalendar.objects.filter(pk=instance.calendar_id).values_list('company_id', flat=True).first()
+    if company_id is not None:
+        schedule_inputs_changed(_working_day_projects(company_id))
+
 
 class CPMReport(Timestamped):
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
     name = models.CharField(max_length=255)
     project = models.ForeignKey("projects.Project", on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DONE)
+    job_id = models.CharField(max_length=255, blank=True, help_text="Celery task id of the job that builds the report.")
+    error = models.TextField(blank=True)
     cpm_graph = models.ImageField(upload_to='cpm_reports/graphs/', null=True, blank=True)
     gantt_chart = models.ImageField(upload_to='cpm_reports/gantts/', null=True, blank=True)
+    pdf = models.FileField(upload_to='cpm_reports/pdfs/', null=True, blank=True)
+    risk_iterations = models.PositiveIntegerField(null=True, blank=True)
+    p50_finish = models.DateTimeField(null=True, blank=True)
+    p80_finish = models.DateTimeField(null=True, blank=True)
+    p95_finish = models.DateTimeField(null=True, blank=True)
 
 
     class Meta:
@@ -148,6 +574,40 @@ class CPMReport(Timestamped):
     def __str__(self):
         return self.name
 
+    def store_rows(self, rows):
+        """
+        Write ``(task_id, es, ef, ls, lf, slack)`` rows for this report in
+        one transaction: batched ``bulk_create``, or a single COPY on
+        PostgreSQL for very large reports.
+        """
+        rows = list(rows)
+        with transaction.atomic():
+            if connection.vendor == 'postgresql' and len(rows) >= REPORT_COPY_ROWS:
+                self._copy_rows(rows)
+            else:
+                CPMReportData.objects.bulk_create(
+                    (
+                        CPMReportData(
+                            cpmreport=self, task_id=task_id,
+                            es=es, ef=ef, ls=ls, lf=lf, slack=slack,
+                        )
+                        for task_id, es, ef, ls, lf, slack in rows
+                    ),
+                    batch_size=REPORT_BATCH_SIZE,
+                )
+        return len(rows)
+
+    def _copy_rows(self, rows):
+        # COPY bypasses auto_now(_add), so the timestamps are filled in here.
+        now = timezone.now()
+        quote = connection.ops.quote_name
+        columns = ['created', 'updated', 'cpmreport_id', 'task_id', 'es', 'ef', 'ls', 'lf', 'slack']
+        sql = "COPY {} ({}) FROM STDIN".format(
+            quote(CPMReportData._meta.db_table), ", ".join(quote(c) for c in columns))
+        with connection.cursor() as cursor, cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row((now, now, self.pk, *row))
+
 
 class CPMReportData(Timestamped):
     cpmreport = models.ForeignKey("projects.CPMReport", on_delete=models.CASCADE)
@@ -157,8 +617,38 @@ class CPMReportData(Timestamped):
     ls = models.DateTimeField()
     lf = models.DateTimeField()
     slack = models.IntegerField(default=0)
+    criticality = models.FloatField(null=True, blank=True, help_text="Share of risk simulation iterations in which the task was critical.")
+
 
 
+class Resource(Timestamped):
+    company = models.ForeignKey("companies.Company", on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+    capacity = models.PositiveIntegerField(default=1, help_text="Units available per day.")
+
+    class Meta:
+        default_related_name = 'resources'
+        verbose_name = 'resource'
+        verbose_name_plural = 'resources'
+
+    def __str__(self):
+        return self.name
+
+
+class Assignment(Timestamped):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    resource = models.ForeignKey("projects.Resource", on_delete=models.CASCADE)
+    units = models.PositiveIntegerField(default=1, help_text="Units of the resource used per day.")
+
+    class Meta:
+        default_related_name = 'assignments'
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'resource'], name='%(app_label)s_%(class)s_unique_task_resource')
+        ]
+
+    def __str__(self):
+        return f"{self.resource} on {self.task}"
+
 
 class Report(Timestamped):
     project = models.ForeignKey("projects.Project", on_delete=models.CASCADE)
@@ -0,0 +1,154 @@
+"""
+Streaming assembly of page images into a PDF.
+
+``ImagePdfWriter`` writes one page per image straight to the output file:
+each image is opened, converted, optionally downsampled and written as an
+image XObject before the next one is opened, so memory stays bounded by the
+largest page whatever the page count.  The page tree, catalog and
+cross-reference table are written at the end, from the object offsets kept
+along the way.
+
+Images are stored losslessly, either raw or Flate compressed (zlib, read by
+every PDF viewer).  With ``dpi`` set, pages whose images have a higher
+resolution are downsampled to it; the page keeps its physical size.
+"""
+import os
+import zlib
+
+from PIL import Image
+
+
+# The resolution assumed for images that do not record one; matplotlib's default.
+DEFAULT_DPI = 100
+
+COMPRESSION_LEVEL = 6
+
+# Pixel rows written per chunk of an image stream.
+CHUNK_ROWS = 256
+
+
+class ImagePdfWriter:
+    """
+    Writes images, one page each, to a binary file object::
+
+        with open(path, 'wb') as handle:
+            writer = ImagePdfWriter(handle, dpi=150)
+            for image_path in image_paths:
+                writer.add_page(image_path)
+            writer.close()
+    """
+
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self, handle, compress=True, dpi=None):
+        self.handle = handle
+        self.compress = compress
+        self.dpi = dpi
+        self.offsets = {}
+        self.pages = []
+        self.next_id = self.PAGES + 1
+        self.handle.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _new_id(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _begin(self, obj_id):
+        self.offsets[obj_id] = self.handle.tell()
+        self.handle.write(b'%d 0 obj\n' % obj_id)
+
+    def _object(self, obj_id, body):
+        self._begin(obj_id)
+        self.handle.write(body + b'\nendobj\n')
+
+    def _stream(self, obj_id, header, chunks):
+        """Write a stream object from byte chunks, its length as a separate object."""
+        length_id = self._new_id()
+        self._begin(obj_id)
+        self.handle.write(b'<< %s /Length %d 0 R >>\nstream\n' % (header, length_id))
+        length = 0
+        for chunk in chunks:
+            self.handle.write(chunk)
+            length += len(chunk)
+        self.handle.write(b'\nendstream\nendobj\n')
+        self._object(length_id, b'%d' % length)
+
+    def _image_chunks(self, image):
+        compressor = zlib.compressobj(COMPRESSION_LEVEL) if self.compress else None
+        for top in range(0, image.height, CHUNK_ROWS):
+            data = image.crop((0, top, image.width, min(top + CHUNK_ROWS, image.height))).tobytes()
+            yield compressor.compress(data) if compressor else data
+        if compressor:
+            yield compressor.flush()
+
+    def add_page(self, image_path):
+        """Add a page showing the image at ``image_path``, sized from its resolution."""
+        with Image.open(image_path) as source:
+            x_dpi, y_dpi = (float(value) or DEFAULT_DPI for value in source.info.get('dpi', (DEFAULT_DPI,) * 2))
+            width, height = source.width * 72 / x_dpi, source.height * 72 / y_dpi
+            if source.mode in ('1', 'L'):
+                image = source.convert('L')
+            elif source.mode in ('RGBA', 'LA', 'PA') or 'transparency' in source.info:
+                # PDF images carry no alpha here: flatten onto white paper.
+                rgba = source.convert('RGBA')
+                image = Image.new('RGB', source.size, 'white')
+                image.paste(rgba, mask=rgba)
+                rgba.close()
+            else:
+                image = source.convert('RGB')
+        if self.dpi and max(x_dpi, y_dpi) > self.dpi:
+            scale = self.dpi / max(x_dpi, y_dpi)
+            image = image.resize(
+                (max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS,
+            )
+
+        image_id, content_id, page_id = self._new_id(), self._new_id(), self._new_id()
+        color_space = b'/DeviceGray' if image.mode == 'L' else b'/DeviceRGB'
+        self._stream(
+            image_id,
+            b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8%s' % (
+                image.width, image.height, color_space, b' /Filter /FlateDecode' if self.compress else b'',
+            ),
+            self._image_chunks(image),
+        )
+        image.close()
+        self._stream(content_id, b'', [b'q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q' % (width, height)])
+        self._object(page_id, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] '
+            b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>'
+        ) % (self.PAGES, width, height, image_id, content_id))
+        self.pages.append(page_id)
+
+    def close(self):
+        """Write the page tree and trailer; the file object is left open."""
+        if not self.pages:
+            raise ValueError("No images to merge!")
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.pages)
+        self._object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        self._object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        xref = self.handle.tell()
+        self.handle.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for obj_id in range(1, self.next_id):
+            self.handle.write(b'%010d 00000 n \n' % self.offsets[obj_id])
+        self.handle.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            self.next_id, self.CATALOG, xref,
+        ))
+
+
+def write_image_pdf(image_paths, output_pdf_path, compress=True, dpi=None):
+    """
+    Write the images at ``image_paths``, in order, as the pages of a PDF.
+    An image that cannot be read fails the whole file, which is then removed.
+    """
+    try:
+        with open(output_pdf_path, 'wb') as handle:
+            writer = ImagePdfWriter(handle, compress=compress, dpi=dpi)
+            for image_path in image_paths:
+                writer.add_page(image_path)
+            writer.close()
+    except BaseException:
+        if os.path.exists(output_pdf_path):
+            os.unlink(output_pdf_path)
+        raise
+    return len(writer.pages)
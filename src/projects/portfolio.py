@@ -0,0 +1,188 @@
+"""
+Portfolio-wide scheduling across the ``Project.parent`` hierarchy.
+
+All projects under a root are loaded into one dependency graph, including
+``Predecessor`` links that cross project boundaries.  The graph is split into
+weakly connected components, which are scheduled independently, and the
+results are written back as one ``CPMReport`` per project.
+
+Large portfolios are packed into bundles of components that the Celery job
+schedules as a chord of subtasks, spread over the workers (see
+``tasks.schedule_project_portfolio``); a process pool inside the job would
+not do, as Celery's prefork workers are daemonic and may not fork children.
+
+Within a component, activities never start before their own ``start_date``
+and the component finishes on the later of its last ``end_date`` and its
+last early finish, as in ``Project.compute_schedule``.
+"""
+import datetime
+
+from django.db import transaction
+
+from projects.schedule_engine import ScheduleGraph, schedule
+from projects.schedule_vectorized import schedule_vectorized
+
+
+# Components at least this large use the NumPy passes; portfolios with at
+# least PARALLEL_TASKS tasks are scheduled in up to BUNDLES subtasks.
+VECTORIZE_TASKS = 5000
+PARALLEL_TASKS = 20000
+BUNDLES = 16
+
+
+def portfolio_project_ids(root_id):
+    """Ids of the root project and all its descendants, level by level."""
+    from projects.models import Project
+
+    ids = [root_id]
+    frontier = [root_id]
+    while frontier:
+        frontier = list(Project.objects.filter(parent_id__in=frontier).values_list('id', flat=True))
+        ids.extend(frontier)
+    return ids
+
+
+def connected_components(keys, edges):
+    """Weakly connected components as lists of positions into ``keys``."""
+    index = {key: i for i, key in enumerate(keys)}
+    parent = list(range(len(keys)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for edge in edges:
+        a, b = find(index[edge[0]]), find(index[edge[1]])
+        if a != b:
+            parent[a] = b
+
+    components = {}
+    for i in range(len(keys)):
+        components.setdefault(find(i), []).append(i)
+    return list(components.values())
+
+
+def schedule_bundle(bundle):
+    """
+    Schedule a list of ``(keys, durations, release, finish, edges)``
+    components; returns ``[(keys, [(es, ef, ls, lf)])]``.
+    """
+    out = []
+    for keys, durations, release, finish, edges in bundle:
+        graph = ScheduleGraph(keys, durations, edges)
+        if len(graph) >= VECTORIZE_TASKS:
+            result = schedule_vectorized(graph, release=release, project_finish=finish)
+            rows = zip(result.es.tolist(), result.ef.tolist(), result.ls.tolist(), result.lf.tolist())
+        else:
+            result = schedule(graph, release=release, project_finish=finish)
+            rows = zip(result.es, result.ef, result.ls, result.lf)
+        out.append((keys, list(rows)))
+    return out
+
+
+def bundles(components, count):
+    """Greedily pack components into ``count`` bundles of similar size."""
+    packed = [[] for _ in range(count)]
+    sizes = [0] * count
+    for component in sorted(components, key=lambda c: len(c[0]), reverse=True):
+        i = sizes.index(min(sizes))
+        packed[i].append(component)
+        sizes[i] += len(component[0])
+    return [bundle for bundle in packed if bundle]
+
+
+def _portfolio_tasks(project_ids):
+    from projects.models import Task
+
+    return list(Task.objects.filter(project_id__in=project_ids).values_list(
+        'id', 'project_id', 'start_date', 'end_date'))
+
+
+def portfolio_components(root_id):
+    """
+    The portfolio's tasks and their components, as ``(tasks, components)``;
+    a component is ``(keys, durations, release, finish, edges)`` with day
+    offsets from the earliest task start.
+    """
+    from projects.models import Predecessor
+
+    project_ids = portfolio_project_ids(root_id)
+    tasks = _portfolio_tasks(project_ids)
+    if not tasks:
+        return tasks, []
+    links = list(Predecessor.objects.filter(
+        from_task__project_id__in=project_ids, to_task__project_id__in=project_ids,
+    ).values_list('from_task_id', 'to_task_id', 'start_type', 'lag'))
+
+    epoch = min(task[2] for task in tasks)
+    keys = [task[0] for task in tasks]
+    component_of = {}
+    components = []
+    for c, members in enumerate(connected_components(keys, links)):
+        for i in members:
+            component_of[keys[i]] = c
+        components.append((
+            [keys[i] for i in members],
+            [(tasks[i][3] - tasks[i][2]).days for i in members],
+            [(tasks[i][2] - epoch).days for i in members],
+            max((tasks[i][3] - epoch).days for i in members),
+            [],
+        ))
+    for link in links:
+        components[component_of[link[0]]][4].append(link)
+    return tasks, components
+
+
+def _values(tasks, results):
+    project_of = {task[0]: task[1] for task in tasks}
+    values = {}
+    for component_keys, rows in results:
+        for key, row in zip(component_keys, rows):
+            values[key] = (project_of[key],) + tuple(row)
+    return values
+
+
+def schedule_portfolio(root_id):
+    """
+    Schedule every project under ``root_id`` as one graph, in this process.
+
+    Returns ``(epoch, {task_id: (project_id, es, ef, ls, lf)})`` with day
+    offsets from ``epoch``.
+    """
+    tasks, components = portfolio_components(root_id)
+    if not tasks:
+        return None, {}
+    return min(task[2] for task in tasks), _values(tasks, schedule_bundle(components))
+
+
+def store_portfolio_schedule(root_id, results=None):
+    """
+    Write one CPMReport per project of the portfolio, from the
+    ``schedule_bundle`` results of all its components, or scheduled here
+    when ``results`` is None.
+    """
+    from projects.models import Project, CPMReport
+
+    if results is None:
+        epoch, values = schedule_portfolio(root_id)
+    else:
+        tasks = _portfolio_tasks(portfolio_project_ids(root_id))
+        epoch = min((task[2] for task in tasks), default=None)
+        values = _values(tasks, results)
+    day = datetime.timedelta(days=1)
+    by_project = {}
+    for task_id, (project_id, es, ef, ls, lf) in values.items():
+        by_project.setdefault(project_id, []).append((task_id, es, ef, ls, lf))
+
+    names = dict(Project.objects.filter(id__in=by_project).values_list('id', 'name'))
+    with transaction.atomic():
+        for project_id, rows in by_project.items():
+            cpmreport = CPMReport.objects.create(
+                name=f"Portfolio schedule ({names[project_id]})", project_id=project_id)
+            cpmreport.store_rows(
+                (task_id, epoch + es * day, epoch + ef * day, epoch + ls * day, epoch + lf * day, ls - es)
+                for task_id, es, ef, ls, lf in rows
+            )
+    return len(by_project), len(values)
@@ -0,0 +1,307 @@
+"""
+CPM report building in independent units of work.
+
+``prepare_report`` computes the schedule, stores the report rows and writes
+the chart input to the report's work folder.  Every chart (activity graph,
+Gantt chart, critical path graph) and every Gantt page is then rendered by
+``render_chart`` on its own, so the units can run in parallel: the Celery
+job fans them out as a chord.  ``assemble_report`` merges the rendered
+files into the report PDF and attaches them to the CPMReport.
+
+Charts are kept in ``projects.chart_cache`` under the hash of the data they
+show, so only the units whose input changed are rendered again; a report of
+an unchanged project renders nothing.
+
+``build_report`` runs the same steps one after another in this process.
+
+Progress is kept in the cache, per report, as the current stage and its
+percent; while charts render, the percent follows the rendered units.
+"""
+import datetime
+import json
+import os
+import shutil
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+from projects import chart_cache
+from projects.calculate_critical_path import (
+    draw_activity_graph, draw_critical_path_graph, draw_gantt_chart, draw_gantt_page, merge_images_to_pdf,
+)
+
+
+GANTT_PAGE_SIZE = 100
+
+PROGRESS_TIMEOUT = 24 * 60 * 60
+
+# Stage -> percent of the job done when it starts; charts fill up to 'pdf'.
+STAGES = {
+    'schedule': 0,
+    'rows': 20,
+    'charts': 30,
+    'pdf': 90,
+    'done': 100,
+}
+
+# Charts drawn from the whole schedule.
+CHARTS = ('activity_graph', 'gantt_chart', 'critical_path')
+
+# The parts of the chart input each chart is drawn from, for its cache key.
+CHART_INPUT = {
+    'activity_graph': itemgetter('critical_chains'),
+    'gantt_chart': itemgetter('critical_path'),
+    'critical_path': itemgetter('critical_path'),
+}
+
+
+def _progress_key(cpmreport_id):
+    return f"projects:report_progress:{cpmreport_id}"
+
+
+def _rendered_key(cpmreport_id):
+    return f"projects:report_rendered:{cpmreport_id}"
+
+
+def set_progress(cpmreport_id, stage, units=None):
+    cache.set(_progress_key(cpmreport_id), {'stage': stage, 'units': units}, PROGRESS_TIMEOUT)
+    if units is not None:
+        cache.set(_rendered_key(cpmreport_id), 0, PROGRESS_TIMEOUT)
+
+
+def get_progress(cpmreport_id):
+    """``{'stage', 'percent'}`` of a report being built, or None."""
+    progress = cache.get(_progress_key(cpmreport_id))
+    if progress is None:
+        return None
+    percent = STAGES[progress['stage']]
+    if progress['stage'] == 'charts' and progress['units']:
+        rendered = cache.get(_rendered_key(cpmreport_id)) or 0
+        percent += (STAGES['pdf'] - percent) * min(rendered, progress['units']) // progress['units']
+    return {'stage': progress['stage'], 'percent': percent}
+
+
+def work_folder(cpmreport_id):
+    return os.path.join(settings.MEDIA_ROOT, 'tmp', f"cpm_report_{cpmreport_id}")
+
+
+def _load_input(cpmreport_id):
+    with open(os.path.join(work_folder(cpmreport_id), 'input.json')) as handle:
+        return json.load(handle)
+
+
+def _activities(chart_input):
+    """The activities of a chart input with their early start as a datetime, for drawing."""
+    return [
+        {**activity, 'es': datetime.datetime.fromisoformat(activity['es'])}
+        for activity in chart_input['activities']
+    ]
+
+
+def schedule_data(project):
+    """The schedule of a project's tasks, one dict per task."""
+    from projects.models import Task
+
+    tasks = Task.objects.prefetch_related('successor_tasks__from_task').filter(project_id=project.pk)
+    task_schedule = project.compute_schedule()
+    data = []
+    for task in tasks:
+        values = task_schedule[task.pk]
+        data.append({
+            'task_id': task.pk,
+            'activity': task.name,
+            'es': values['early_start'],
+            'ef': values['early_finish'],
+            'ls': values['late_start'],
+            'lf': values['late_finish'],
+            'slack': max(values['total_float'], 0),
+            'duration': task.duration,
+            'predecessors': [pr.from_task.name for pr in task.successor_tasks.all()],
+        })
+    return data
+
+
+def chart_input(project, data):
+    """What the charts of a project are drawn from, as JSON-serializable data."""
+    names = {activity['task_id']: activity['activity'] for activity in data}
+    return {
+        'project_id': project.pk,
+        'activities': [
+            {
+                'activity': item['activity'], 'duration': item['duration'], 'predecessors': item['predecessors'],
+                'es': item['es'].isoformat(), 'slack': item['slack'],
+            }
+            for item in data
+        ],
+        'critical_path': [item['activity'] for item in data if item['slack'] == 0],
+        'critical_chains': [
+            [names[task_id] for task_id in chain if task_id in names]
+            for chain in project.critical_chains()
+        ],
+    }
+
+
+def gantt_units(chart_input, format='png'):
+    """The ``(kind, page, key)`` units of the Gantt pages."""
+    activities = chart_input['activities']
+    pages = (len(activities) + GANTT_PAGE_SIZE - 1) // GANTT_PAGE_SIZE
+    return [
+        ('gantt_page', page, chart_cache.chart_key(
+            'gantt_page', activities[page * GANTT_PAGE_SIZE:(page + 1) * GANTT_PAGE_SIZE],
+            {'page': page, 'page_size': GANTT_PAGE_SIZE}, format=format,
+        ))
+        for page in range(pages)
+    ]
+
+
+def chart_unit(chart_input, kind, format='png'):
+    """The ``(kind, None, key)`` unit of a chart drawn from the whole schedule."""
+    payload = [chart_input['activities'], CHART_INPUT[kind](chart_input)]
+    return kind, None, chart_cache.chart_key(kind, payload, format=format)
+
+
+def chart_units(chart_input, format='png'):
+    """
+    The ``(kind, page, key)`` units of a report, ``page`` being None except
+    for Gantt pages and ``key`` the chart's cache key.
+    """
+    return [chart_unit(chart_input, kind, format) for kind in CHARTS] + gantt_units(chart_input, format)
+
+
+def missing_units(units):
+    """The units whose chart is not cached."""
+    return [unit for unit in units if chart_cache.lookup(unit[2]) is None]
+
+
+def draw_chart(chart_input, activities, kind, page, path):
+    if kind == 'activity_graph':
+        draw_activity_graph(activities, chart_input['critical_chains'], save_path=path)
+    elif kind == 'gantt_chart':
+        draw_gantt_chart(activities, chart_input['critical_path'], save_path=path)
+    elif kind == 'critical_path':
+        draw_critical_path_graph(activities, chart_input['critical_path'], save_path=path)
+    elif kind == 'gantt_page':
+        draw_gantt_page(activities[page * GANTT_PAGE_SIZE:(page + 1) * GANTT_PAGE_SIZE], page, path)
+    else:
+        raise ValueError(f"Unknown chart: {kind}")
+
+
+def render_units(chart_input, units):
+    """The cached file of every unit, rendering the missing ones here."""
+    activities = None
+    paths = []
+    for kind, page, key in units:
+        path = chart_cache.lookup(key)
+        if path is None:
+            if activities is None:
+                activities = _activities(chart_input)
+            path = chart_cache.render(key, lambda path: draw_chart(chart_input, activities, kind, page, path))
+        paths.append(path)
+    return paths
+
+
+def embedded_charts(chart_input, units):
+    """
+    The charts of ``units`` for an HTML report, rendering the missing ones:
+    ``{'svg': markup}`` to inline SVG charts, ``{'url': url}`` for images.
+    """
+    render_units(chart_input, units)
+    return [
+        {'svg': mark_safe(chart_cache.inline_svg(key))} if key.endswith('.svg') else {'url': chart_cache.chart_url(key)}
+        for kind, page, key in units
+    ]
+
+
+def prepare_report(cpmreport_id):
+    """
+    Store the report rows and the chart input.  Returns the chart units,
+    see ``chart_units``.
+    """
+    from projects.models import CPMReport, persist_task_schedule
+
+    set_progress(cpmreport_id, 'schedule')
+    cpmreport = CPMReport.objects.select_related('project').get(id=cpmreport_id)
+    project = cpmreport.project
+    data = schedule_data(project)
+
+    set_progress(cpmreport_id, 'rows')
+    with transaction.atomic():
+        cpmreport.cpmreportdata_set.all().delete()
+        cpmreport.store_rows(
+            (item['task_id'], item['es'], item['ef'], item['ls'], item['lf'], item['slack'])
+            for item in data
+        )
+        persist_task_schedule(project.pk, refresh=False)
+
+    report_input = chart_input(project, data)
+    folder = work_folder(cpmreport_id)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    with open(os.path.join(folder, 'input.json'), 'w') as handle:
+        json.dump(report_input, handle)
+
+    units = chart_units(report_input)
+    set_progress(cpmreport_id, 'charts', units=len(missing_units(units)))
+    return units
+
+
+def render_chart(cpmreport_id, kind, page, key):
+    """Render one chart unit of a prepared report into the chart cache; returns its file."""
+    report_input = _load_input(cpmreport_id)
+    activities = _activities(report_input)
+    path = chart_cache.render(key, lambda path: draw_chart(report_input, activities, kind, page, path))
+    try:
+        cache.incr(_rendered_key(cpmreport_id))
+    except ValueError:
+        pass
+    return path
+
+
+def assemble_report(cpmreport_id, units):
+    """
+    Merge the cached charts, in unit order, into the report PDF and attach
+    the files to the CPMReport, which is then done.
+    """
+    from projects.models import CPMReport
+
+    set_progress(cpmreport_id, 'pdf')
+    cpmreport = CPMReport.objects.get(id=cpmreport_id)
+    folder = work_folder(cpmreport_id)
+    os.makedirs(folder, exist_ok=True)
+    paths = {kind: chart_cache.chart_path(key) for kind, page, key in units if page is None}
+    pdf_path = os.path.join(folder, 'full_gantt_report.pdf')
+    merge_images_to_pdf([chart_cache.chart_path(key) for kind, page, key in units], pdf_path)
+
+    files = (
+        (cpmreport.cpm_graph, paths['activity_graph'], f"cpm_graph_{cpmreport.id}.png"),
+        (cpmreport.gantt_chart, paths['gantt_chart'], f"gantt_chart_{cpmreport.id}.png"),
+        (cpmreport.pdf, pdf_path, f"cpm_report_{cpmreport.id}.pdf"),
+    )
+    for field, path, name in files:
+        with open(path, 'rb') as handle:
+            field.save(name, File(handle), save=False)
+    cpmreport.status = CPMReport.DONE
+    cpmreport.error = ''
+    cpmreport.save()
+    shutil.rmtree(folder, ignore_errors=True)
+    set_progress(cpmreport_id, 'done')
+    return cpmreport
+
+
+def fail_report(cpmreport_id, error):
+    from projects.models import CPMReport
+
+    CPMReport.objects.filter(id=cpmreport_id).update(status=CPMReport.FAILED, error=error)
+    cache.delete_many([_progress_key(cpmreport_id), _rendered_key(cpmreport_id)])
+
+
+def build_report(cpmreport_id):
+    """Prepare, render and assemble a report in this process."""
+    units = prepare_report(cpmreport_id)
+    for kind, page, key in missing_units(units):
+        render_chart(cpmreport_id, kind, page, key)
+    return assemble_report(cpmreport_id, units)
@@ -0,0 +1,402 @@
+"""
+Integer-indexed Critical Path Method engine.
+
+Activities are mapped to dense integer ids and the dependency graph is kept
+in CSR (compressed sparse row) form, one adjacency for predecessors and one
+for successors.  All per-activity values live in flat ``array`` buffers, so
+a pass over the schedule is a walk over contiguous integers instead of a
+chain of string-keyed dict lookups.
+
+The input does not need to be topologically ordered: the graph is sorted
+with Kahn's algorithm and a ``CycleError`` is raised if it is not a DAG.
+
+All times are integer day offsets from the project start; converting to
+``datetime`` happens only in ``ScheduleResult.to_datetimes``.
+
+Every link carries a type (FS/SS/FF/SF, same values as
+``Predecessor.start_type``) and a signed lag in days, and both passes honour
+them while staying linear in the number of links:
+
+    FS: ES(succ) >= EF(pred) + lag      SS: ES(succ) >= ES(pred) + lag
+    FF: EF(succ) >= EF(pred) + lag      SF: EF(succ) >= ES(pred) + lag
+
+``float_paths`` turns a result into ordered paths ranked by total float:
+the critical chains first, then the near-critical paths.
+"""
+import datetime
+from array import array
+
+
+FS, SS, FF, SF = range(0, 4)
+
+
+class CycleError(ValueError):
+    """Raised when the dependency graph contains a cycle."""
+
+
+class ScheduleGraph:
+    """
+    Dependency graph in CSR form.
+
+    ``pred_idx[pred_ptr[v]:pred_ptr[v + 1]]`` are the predecessors of ``v``
+    and ``succ_idx[succ_ptr[v]:succ_ptr[v + 1]]`` are its successors.
+    """
+    __slots__ = (
+        'keys', 'index', 'durations',
+        'pred_ptr', 'pred_idx', 'pred_type', 'pred_lag',
+        'succ_ptr', 'succ_idx', 'succ_type', 'succ_lag',
+        '_order',
+    )
+
+    def __init__(self, keys, durations, edges):
+        """
+        keys      : sequence of hashable activity keys (names or primary keys)
+        durations : sequence of integer durations in days, aligned with keys
+        edges     : iterable of (predecessor_key, successor_key) pairs, or of
+                    (predecessor_key, successor_key, link_type, lag) tuples
+        """
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        if len(self.index) != len(self.keys):
+            raise ValueError("Activity keys must be unique.")
+        self.durations = array('q', (int(d) for d in durations))
+        n = len(self.keys)
+
+        src = array('q')
+        dst = array('q')
+        types = array('b')
+        lags = array('q')
+        seen = set()
+        index = self.index
+        for edge in edges:
+            pred, succ = edge[0], edge[1]
+            try:
+                u = index[pred]
+                v = index[succ]
+            except KeyError as exc:
+                raise ValueError(f"Unknown activity in dependency: {exc.args[0]}")
+            if (u, v) in seen:
+                continue
+            seen.add((u, v))
+            src.append(u)
+            dst.append(v)
+            if len(edge) > 2:
+                if edge[2] not in (FS, SS, FF, SF):
+                    raise ValueError(f"Unknown link type {edge[2]!r} for {pred} -> {succ}")
+                types.append(edge[2])
+                lags.append(int(edge[3] or 0))
+            else:
+                types.append(FS)
+                lags.append(0)
+
+        self.pred_ptr, self.pred_idx, perm = _build_csr(n, dst, src)
+        self.pred_type = array('b', (types[e] for e in perm))
+        self.pred_lag = array('q', (lags[e] for e in perm))
+        self.succ_ptr, self.succ_idx, perm = _build_csr(n, src, dst)
+        self.succ_type = array('b', (types[e] for e in perm))
+        self.succ_lag = array('q', (lags[e] for e in perm))
+        self._order = None
+
+    @classmethod
+    def from_activities(cls, data):
+        """
+        Build a graph from the legacy ``calculate_cpm`` activity dicts.
+
+        Links are finish-to-start with no lag unless the activity carries a
+        ``'links'`` dict mapping a predecessor name to ``(link_type, lag)``.
+        """
+        keys = [activity['activity'] for activity in data]
+        durations = [activity['duration'] for activity in data]
+        edges = (
+            (pred, activity['activity'], *activity.get('links', {}).get(pred, (FS, 0)))
+            for activity in data
+            for pred in activity['predecessors']
+        )
+        return cls(keys, durations, edges)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def edge_count(self):
+        return len(self.succ_idx)
+
+    def predecessors(self, v):
+        return self.pred_idx[self.pred_ptr[v]:self.pred_ptr[v + 1]]
+
+    def successors(self, v):
+        return self.succ_idx[self.succ_ptr[v]:self.succ_ptr[v + 1]]
+
+    def topological_order(self):
+        """Kahn's algorithm. Cached; raises CycleError on cyclic graphs."""
+        if self._order is not None:
+            return self._order
+        n = len(self.keys)
+        pred_ptr = self.pred_ptr
+        succ_ptr = self.succ_ptr
+        succ_idx = self.succ_idx
+        indegree = array('q', (pred_ptr[v + 1] - pred_ptr[v] for v in range(n)))
+        order = array('q', (v for v in range(n) if indegree[v] == 0))
+        head = 0
+        while head < len(order):
+            u = order[head]
+            head += 1
+            for k in range(succ_ptr[u], succ_ptr[u + 1]):
+                w = succ_idx[k]
+                indegree[w] -= 1
+                if indegree[w] == 0:
+                    order.append(w)
+        if len(order) != n:
+            stuck = next(self.keys[v] for v in range(n) if indegree[v] > 0)
+            raise CycleError(f"Cycle detected at activity: {stuck}")
+        self._order = order
+        return order
+
+
+def _build_csr(n, rows, cols):
+    """
+    Counting sort of (row, col) pairs into CSR ``(ptr, idx, perm)`` arrays,
+    where ``perm[k]`` is the input position of the pair stored in slot ``k``.
+    """
+    ptr = array('q', bytes(8 * (n + 1)))
+    for r in rows:
+        ptr[r + 1] += 1
+    for i in range(n):
+        ptr[i + 1] += ptr[i]
+    fill = array('q', ptr)
+    idx = array('q', bytes(8 * len(cols)))
+    perm = array('q', bytes(8 * len(cols)))
+    for e, (r, c) in enumerate(zip(rows, cols)):
+        idx[fill[r]] = c
+        perm[fill[r]] = e
+        fill[r] += 1
+    return ptr, idx, perm
+
+
+class ScheduleNode:
+    """Read-only view of one activity in a ``ScheduleResult``."""
+    __slots__ = ('key', 'duration', 'es', 'ef', 'ls', 'lf', 'slack')
+
+    def __init__(self, key, duration, es, ef, ls, lf, slack):
+        self.key = key
+        self.duration = duration
+        self.es = es
+        self.ef = ef
+        self.ls = ls
+        self.lf = lf
+        self.slack = slack
+
+    def __repr__(self):
+        return f"<ScheduleNode {self.key} es={self.es} lf={self.lf} slack={self.slack}>"
+
+
+class ScheduleResult:
+    """ES/EF/LS/LF as day offsets from the project start, one slot per id."""
+    __slots__ = ('graph', 'es', 'ef', 'ls', 'lf', 'project_duration')
+
+    def __init__(self, graph, es, ef, ls, lf, project_duration):
+        self.graph = graph
+        self.es = es
+        self.ef = ef
+        self.ls = ls
+        self.lf = lf
+        self.project_duration = project_duration
+
+    def __len__(self):
+        return len(self.graph)
+
+    def slack(self, v):
+        return self.ls[v] - self.es[v]
+
+    def node(self, key):
+        v = self.graph.index[key]
+        return ScheduleNode(
+            key, self.graph.durations[v],
+            self.es[v], self.ef[v], self.ls[v], self.lf[v], self.slack(v),
+        )
+
+    def __iter__(self):
+        for key in self.graph.keys:
+            yield self.node(key)
+
+    def critical(self):
+        """Ids of activities with zero total float, in topological order."""
+        return [v for v in self.graph.topological_order() if self.ls[v] == self.es[v]]
+
+    def to_datetimes(self, project_start):
+        """Return ``{key: (es, ef, ls, lf)}`` as datetimes from ``project_start``."""
+        day = datetime.timedelta(days=1)
+        out = {}
+        for v, key in enumerate(self.graph.keys):
+            out[key] = (
+                project_start + self.es[v] * day,
+                project_start + self.ef[v] * day,
+                project_start + self.ls[v] * day,
+                project_start + self.lf[v] * day,
+            )
+        return out
+
+
+def schedule(graph, release=None, project_finish=None):
+    """
+    Run the forward and backward passes over ``graph``.
+
+    release        : optional per-id earliest start offsets (start-no-earlier-than)
+    project_finish : optional finish offset for activities without successors;
+                     the later of it and the latest early finish is used
+    """
+    order = graph.topological_order()
+    n = len(graph)
+    dur = graph.durations
+    pred_ptr, pred_idx, pred_type, pred_lag = graph.pred_ptr, graph.pred_idx, graph.pred_type, graph.pred_lag
+    succ_ptr, succ_idx, succ_type, succ_lag = graph.succ_ptr, graph.succ_idx, graph.succ_type, graph.succ_lag
+
+    es = array('q', bytes(8 * n)) if release is None else array('q', release)
+    ef = array('q', bytes(8 * n))
+
+    # Forward pass. FS/FF links key off the predecessor's finish, SS/SF off
+    # its start; FF/SF constrain the successor's finish, hence the -duration.
+    for v in order:
+        start = es[v]
+        d = dur[v]
+        for k in range(pred_ptr[v], pred_ptr[v + 1]):
+            u = pred_idx[k]
+            t = pred_type[k]
+            bound = (ef[u] if t == FS or t == FF else es[u]) + pred_lag[k]
+            if t == FF or t == SF:
+                bound -= d
+            if bound > start:
+                start = bound
+        es[v] = start
+        ef[v] = start + d
+
+    project_duration = max(ef) if n else 0
+    if project_finish is not None and project_finish > project_duration:
+        project_duration = project_finish
+    ls = array('q', bytes(8 * n))
+    lf = array('q', bytes(8 * n))
+
+    # Backward pass, the mirror image: FF/SF links key off the successor's
+    # finish, and SS/SF constrain this activity's start, hence the +duration.
+    for i in range(n - 1, -1, -1):
+        v = order[i]
+        finish = project_duration
+        d = dur[v]
+        for k in range(succ_ptr[v], succ_ptr[v + 1]):
+            w = succ_idx[k]
+            t = succ_type[k]
+            bound = (lf[w] if t == FF or t == SF else ls[w]) - succ_lag[k]
+            if t == SS or t == SF:
+                bound += d
+            if bound < finish:
+                finish = bound
+        lf[v] = finish
+        ls[v] = finish - d
+
+    return ScheduleResult(graph, es, ef, ls, lf, project_duration)
+
+
+def _driving_predecessor(graph, es, ef, slack, v):
+    """The predecessor whose link sets ``es[v]``, preferring the least float."""
+    best = None
+    d = graph.durations[v]
+    for k in range(graph.pred_ptr[v], graph.pred_ptr[v + 1]):
+        u = graph.pred_idx[k]
+        t = graph.pred_type[k]
+        bound = (ef[u] if t == FS or t == FF else es[u]) + graph.pred_lag[k]
+        if t == FF or t == SF:
+            bound -= d
+        if bound == es[v] and (best is None or slack[u] < slack[best]):
+            best = u
+    return best
+
+
+def _driving_successor(graph, ls, lf, slack, v):
+    """The successor whose link sets ``lf[v]``, preferring the least float."""
+    best = None
+    d = graph.durations[v]
+    for k in range(graph.succ_ptr[v], graph.succ_ptr[v + 1]):
+        w = graph.succ_idx[k]
+        t = graph.succ_type[k]
+        bound = (lf[w] if t == FF or t == SF else ls[w]) - graph.succ_lag[k]
+        if t == SS or t == SF:
+            bound += d
+        if bound == lf[v] and (best is None or slack[w] < slack[best]):
+            best = w
+    return best
+
+
+def float_paths(result, k=None, max_float=None):
+    """
+    Rank dependency paths by total float.
+
+    Activities are taken in order of increasing float; every activity not
+    yet on a returned path seeds the longest path through it, found by
+    following the links that set its early start back to a path start and
+    the links that set its late finish forward to a path end.  Every
+    activity on that path has at most the seed's float, so the seed's float
+    is the float of the path.  Each path costs O(V + E) at most, and no
+    path enumeration happens.
+
+    Returns up to ``k`` ``(float, [ids])`` pairs with ids in path order,
+    stopping early once the float exceeds ``max_float``.  The zero-float
+    paths are the critical chains.  ``result`` may be a ``ScheduleResult``
+    or a ``VectorSchedule``.
+    """
+    graph = result.graph
+    es, ef, ls, lf = result.es.tolist(), result.ef.tolist(), result.ls.tolist(), result.lf.tolist()
+    slack = [late - early for late, early in zip(ls, es)]
+    order = graph.topological_order()
+    rank = {v: i for i, v in enumerate(order)}
+    covered = bytearray(len(graph))
+    paths = []
+    for v in sorted(order, key=lambda v: (slack[v], rank[v])):
+        if k is not None and len(paths) >= k:
+            break
+        if max_float is not None and slack[v] > max_float:
+            break
+        if covered[v]:
+            continue
+        head = []
+        u = _driving_predecessor(graph, es, ef, slack, v)
+        while u is not None:
+            head.append(u)
+            u = _driving_predecessor(graph, es, ef, slack, u)
+        path = head[::-1] + [v]
+        w = _driving_successor(graph, ls, lf, slack, v)
+        while w is not None:
+            path.append(w)
+            w = _driving_successor(graph, ls, lf, slack, w)
+        for u in path:
+            covered[u] = 1
+        paths.append((slack[v], path))
+    return paths
+
+
+def critical_chains(result):
+    """The critical chains of ``result`` as ordered lists of ids."""
+    return [path for _, path in float_paths(result, max_float=0)]
+
+
+def free_float(result):
+    """
+    Free float per id: how far an activity can slip without delaying the
+    early dates of any successor (or the project finish, without successors).
+    """
+    graph = result.graph
+    es, ef = result.es.tolist(), result.ef.tolist()
+    finish = int(result.project_duration)
+    dur = graph.durations
+    out = []
+    for v in range(len(graph)):
+        slack = finish - ef[v] if graph.succ_ptr[v] == graph.succ_ptr[v + 1] else None
+        for k in range(graph.succ_ptr[v], graph.succ_ptr[v + 1]):
+            w = graph.succ_idx[k]
+            t = graph.succ_type[k]
+            bound = (ef[v] if t == FS or t == FF else es[v]) + graph.succ_lag[k]
+            if t == FF or t == SF:
+                bound -= dur[w]
+            if slack is None or es[w] - bound < slack:
+                slack = es[w] - bound
+        out.append(slack)
+    return out
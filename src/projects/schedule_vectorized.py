@@ -0,0 +1,189 @@
+"""
+NumPy level-synchronous CPM passes for very large schedules.
+
+The graph from ``projects.schedule_engine`` is split into topological levels
+(every predecessor of a level-``L`` activity lives in a level below ``L``).
+Each level is then computed with one ``np.maximum.reduceat`` over the
+concatenated predecessor edges on the forward pass, and one
+``np.minimum.reduceat`` over the successor edges on the backward pass.
+
+ES/EF/LS/LF stay int64 day offsets from the project start (the schedule
+epoch) for the whole computation and are turned into datetimes only by
+``VectorSchedule.to_datetimes``.
+
+Link types and lags are folded into two static per-link arrays before the
+passes start (which side of the neighbour the link reads, and a constant
+shift), so each level still costs a single gather plus one ``reduceat``.
+
+The per-level NumPy overhead only pays off when levels are wide; long thin
+chains are faster on the plain loop in ``projects.schedule_engine``.
+"""
+import datetime
+
+import numpy as np
+
+from projects.schedule_engine import CycleError, FS, SS, FF, SF
+
+
+def csr_arrays(graph):
+    """Int64 views of the CSR buffers of a ScheduleGraph."""
+    return (
+        np.asarray(graph.pred_ptr, dtype=np.int64),
+        np.asarray(graph.pred_idx, dtype=np.int64),
+        np.asarray(graph.succ_ptr, dtype=np.int64),
+        np.asarray(graph.succ_idx, dtype=np.int64),
+    )
+
+
+def link_arrays(graph, dur):
+    """
+    Fold link types and lags into per-slot arrays for both CSR layouts.
+
+    Forward, slot k of the predecessor CSR bounds ES(v) by
+    ``(EF(u) if fwd_finish[k] else ES(u)) + fwd_shift[k]``.
+    Backward, slot k of the successor CSR bounds LF(v) by
+    ``(LF(w) if bwd_finish[k] else LS(w)) + bwd_shift[k]``.
+    """
+    pred_ptr, _, succ_ptr, _ = csr_arrays(graph)
+    n = len(graph)
+    nodes = np.arange(n, dtype=np.int64)
+
+    pred_type = np.asarray(graph.pred_type, dtype=np.int8)
+    pred_lag = np.asarray(graph.pred_lag, dtype=np.int64)
+    pred_owner = np.repeat(nodes, np.diff(pred_ptr))
+    fwd_finish = (pred_type == FS) | (pred_type == FF)
+    fwd_shift = pred_lag - np.where((pred_type == FF) | (pred_type == SF), dur[pred_owner], 0)
+
+    succ_type = np.asarray(graph.succ_type, dtype=np.int8)
+    succ_lag = np.asarray(graph.succ_lag, dtype=np.int64)
+    succ_owner = np.repeat(nodes, np.diff(succ_ptr))
+    bwd_finish = (succ_type == FF) | (succ_type == SF)
+    bwd_shift = np.where((succ_type == SS) | (succ_type == SF), dur[succ_owner], 0) - succ_lag
+
+    return fwd_finish, fwd_shift, bwd_finish, bwd_shift
+
+
+def edge_ranges(ptr, nodes):
+    """
+    Concatenated ``range(ptr[v], ptr[v + 1])`` for every v in ``nodes``.
+
+    Returns ``(positions, offsets, has_edges)`` where ``offsets`` are the
+    segment starts of the nodes that have at least one edge (the layout
+    ``reduceat`` expects) and ``has_edges`` masks those nodes.
+    """
+    starts = ptr[nodes]
+    lengths = ptr[nodes + 1] - starts
+    has_edges = lengths > 0
+    total = int(lengths.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, has_edges
+    seg_start = np.cumsum(lengths) - lengths
+    positions = np.arange(total, dtype=np.int64) + np.repeat(starts - seg_start, lengths)
+    return positions, seg_start[has_edges], has_edges
+
+
+def topological_levels(graph):
+    """List of int64 arrays, one per level, computed frontier by frontier."""
+    pred_ptr, _, succ_ptr, succ_idx = csr_arrays(graph)
+    n = len(graph)
+    indegree = np.diff(pred_ptr)
+    frontier = np.flatnonzero(indegree == 0)
+    levels = []
+    placed = 0
+    while frontier.size:
+        levels.append(frontier)
+        placed += frontier.size
+        positions, _, _ = edge_ranges(succ_ptr, frontier)
+        targets = succ_idx[positions]
+        if not targets.size:
+            break
+        indegree = indegree - np.bincount(targets, minlength=n)
+        targets = np.unique(targets)
+        frontier = targets[indegree[targets] == 0]
+    if placed != n:
+        stuck = int(np.flatnonzero(indegree > 0)[0])
+        raise CycleError(f"Cycle detected at activity: {graph.keys[stuck]}")
+    return levels
+
+
+class VectorSchedule:
+    """Vectorized counterpart of ``ScheduleResult``; all fields are int64 arrays."""
+    __slots__ = ('graph', 'es', 'ef', 'ls', 'lf', 'project_duration')
+
+    def __init__(self, graph, es, ef, ls, lf, project_duration):
+        self.graph = graph
+        self.es = es
+        self.ef = ef
+        self.ls = ls
+        self.lf = lf
+        self.project_duration = project_duration
+
+    def __len__(self):
+        return len(self.graph)
+
+    @property
+    def slack(self):
+        return self.ls - self.es
+
+    def critical(self):
+        return np.flatnonzero(self.ls == self.es)
+
+    def to_datetimes(self, project_start):
+        """Return ``{key: (es, ef, ls, lf)}`` as datetimes from ``project_start``."""
+        day = datetime.timedelta(days=1)
+        rows = zip(self.es.tolist(), self.ef.tolist(), self.ls.tolist(), self.lf.tolist())
+        return {
+            key: (
+                project_start + es * day,
+                project_start + ef * day,
+                project_start + ls * day,
+                project_start + lf * day,
+            )
+            for key, (es, ef, ls, lf) in zip(self.graph.keys, rows)
+        }
+
+
+def schedule_vectorized(graph, levels=None, release=None, project_finish=None):
+    """
+    Level-synchronous forward and backward passes over ``graph``.
+
+    ``release`` and ``project_finish`` behave as in ``schedule_engine.schedule``.
+    """
+    if levels is None:
+        levels = topological_levels(graph)
+    pred_ptr, pred_idx, succ_ptr, succ_idx = csr_arrays(graph)
+    n = len(graph)
+    dur = np.asarray(graph.durations, dtype=np.int64)
+    fwd_finish, fwd_shift, bwd_finish, bwd_shift = link_arrays(graph, dur)
+
+    es = np.zeros(n, dtype=np.int64) if release is None else np.array(release, dtype=np.int64)
+    ef = np.zeros(n, dtype=np.int64)
+
+    # Forward pass
+    for nodes in levels:
+        positions, offsets, has_preds = edge_ranges(pred_ptr, nodes)
+        if positions.size:
+            targets = nodes[has_preds]
+            src = pred_idx[positions]
+            bound = np.where(fwd_finish[positions], ef[src], es[src]) + fwd_shift[positions]
+            es[targets] = np.maximum(es[targets], np.maximum.reduceat(bound, offsets))
+        ef[nodes] = es[nodes] + dur[nodes]
+
+    project_duration = int(ef.max()) if n else 0
+    if project_finish is not None and project_finish > project_duration:
+        project_duration = int(project_finish)
+    lf = np.full(n, project_duration, dtype=np.int64)
+    ls = np.zeros(n, dtype=np.int64)
+
+    # Backward pass
+    for nodes in reversed(levels):
+        positions, offsets, has_succs = edge_ranges(succ_ptr, nodes)
+        if positions.size:
+            targets = nodes[has_succs]
+            dst = succ_idx[positions]
+            bound = np.where(bwd_finish[positions], lf[dst], ls[dst]) + bwd_shift[positions]
+            lf[targets] = np.minimum(lf[targets], np.minimum.reduceat(bound, offsets))
+        ls[nodes] = lf[nodes] - dur[nodes]
+
+    return VectorSchedule(graph, es, ef, ls, lf, project_duration)
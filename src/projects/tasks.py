@@ -25,3 +25,159 @@ def send_email(email, project):
         html_message=msg_html,
     )
     return 'Project with title {}  created with success!'.format(project.title)
+
+
+@shared_task
+def simulate_project_risk(cpmreport_id, iterations=1000, seed=None):
+    """
+    Simulate a report's schedule risk; large runs go as a chord of chunk
+    subtasks, stored by ``store_project_risk``.
+    """
+    from celery import chord
+    from projects.models import CPMReport
+    from projects.risk import PARALLEL_CELLS, chunks, project_inputs, simulate_inputs
+    from projects.utils import store_risk_simulation
+
+    inputs = project_inputs(CPMReport.objects.values_list('project_id', flat=True).get(id=cpmreport_id))
+    task_count = len(inputs['keys']) if inputs else 0
+    parts = chunks(task_count, iterations, seed)
+    if iterations * task_count <= PARALLEL_CELLS or len(parts) < 2:
+        result = store_risk_simulation(cpmreport_id, iterations, result=simulate_inputs(inputs, iterations, seed))
+        return 'Risk simulation for report {} finished: P80 {}'.format(cpmreport_id, result.p80)
+    summary = {'epoch': inputs['epoch'], 'keys': inputs['keys']}
+    chord(
+        simulate_risk_chunk.s(inputs, size, seed_state) for size, seed_state in parts
+    )(store_project_risk.s(cpmreport_id, summary, iterations))
+    return 'Risk simulation for report {} split into {} chunks'.format(cpmreport_id, len(parts))
+
+
+@shared_task
+def simulate_risk_chunk(inputs, iterations, seed_state):
+    from projects.risk import simulate_chunk
+
+    return simulate_chunk(inputs, iterations, seed_state)
+
+
+@shared_task
+def store_project_risk(results, cpmreport_id, summary, iterations):
+    import numpy as np
+    from projects.risk import risk_result
+    from projects.utils import store_risk_simulation
+
+    finishes = [finish for chunk_finishes, _ in results for finish in chunk_finishes]
+    counts = np.sum([chunk_counts for _, chunk_counts in results], axis=0)
+    result = store_risk_simulation(cpmreport_id, iterations, result=risk_result(summary, iterations, finishes, counts))
+    return 'Risk simulation for report {} finished: P80 {}'.format(cpmreport_id, result.p80)
+
+
+@shared_task
+def schedule_project_portfolio(root_project_id):
+    """
+    Schedule a portfolio; large ones are scheduled as a chord of bundles of
+    components, then stored by ``store_project_portfolio``.
+    """
+    from celery import chord
+    from projects.portfolio import (
+        BUNDLES, PARALLEL_TASKS, bundles, portfolio_components, schedule_bundle, store_portfolio_schedule,
+    )
+
+    tasks, components = portfolio_components(root_project_id)
+    if len(tasks) < PARALLEL_TASKS or len(components) < 2:
+        projects, count = store_portfolio_schedule(root_project_id, schedule_bundle(components))
+        return 'Portfolio {} scheduled: {} projects, {} tasks'.format(root_project_id, projects, count)
+    packed = bundles(components, BUNDLES)
+    chord(schedule_portfolio_bundle.s(bundle) for bundle in packed)(store_project_portfolio.s(root_project_id))
+    return 'Portfolio {} split into {} bundles'.format(root_project_id, len(packed))
+
+
+@shared_task
+def schedule_portfolio_bundle(bundle):
+    from projects.portfolio import schedule_bundle
+
+    return schedule_bundle(bundle)
+
+
+@shared_task
+def store_project_portfolio(results, root_project_id):
+    from projects.portfolio import store_portfolio_schedule
+
+    projects, tasks = store_portfolio_schedule(root_project_id, [item for chunk in results for item in chunk])
+    return 'Portfolio {} scheduled: {} projects, {} tasks'.format(root_project_id, projects, tasks)
+
+
+@shared_task
+def level_project_resources(project_id):
+    from projects.leveling import store_leveled_schedule
+
+    cpmreport = store_leveled_schedule(project_id)
+    return 'Project {} leveled into report {}'.format(project_id, cpmreport.id)
+
+
+@shared_task
+def refresh_task_schedule(project_id):
+    from django.core.cache import cache
+    from projects.models import persist_task_schedule
+
+    cache.delete(f"projects:task_schedule_refresh:{project_id}")
+    count = persist_task_schedule(project_id)
+    return 'Stored the schedule of {} tasks of project {}'.format(count, project_id)
+
+
+@shared_task
+def build_project_report(cpmreport_id):
+    """
+    Prepare a CPM report, then render the charts missing from the chart
+    cache in parallel and assemble it.
+    """
+    from celery import chord
+    from projects.models import CPMReport
+    from projects.reporting import prepare_report, missing_units, fail_report
+
+    CPMReport.objects.filter(id=cpmreport_id).update(status=CPMReport.RUNNING)
+    try:
+        units = prepare_report(cpmreport_id)
+        missing = missing_units(units)
+    except Exception as e:
+        fail_report(cpmreport_id, str(e))
+        raise
+    if not missing:
+        return assemble_project_report([], cpmreport_id, units)
+    chord(
+        render_report_chart.s(cpmreport_id, kind, page, key) for kind, page, key in missing
+    )(assemble_project_report.s(cpmreport_id, units))
+    return 'Report {} prepared: {} of {} charts queued'.format(cpmreport_id, len(missing), len(units))
+
+
+@shared_task
+def render_report_chart(cpmreport_id, kind, page, key):
+    from projects.reporting import render_chart
+
+    # Failures are handed to the assembly step instead of breaking the chord.
+    try:
+        return {'path': render_chart(cpmreport_id, kind, page, key)}
+    except Exception as e:
+        return {'error': '{} {}: {}'.format(kind, '' if page is None else page + 1, e)}
+
+
+@shared_task
+def assemble_project_report(results, cpmreport_id, units):
+    from projects.reporting import assemble_report, fail_report
+
+    errors = [result['error'] for result in results if 'error' in result]
+    if errors:
+        fail_report(cpmreport_id, '\n'.join(errors))
+        return 'Report {} failed'.format(cpmreport_id)
+    try:
+        assemble_report(cpmreport_id, units)
+    except Exception as e:
+        fail_report(cpmreport_id, str(e))
+        raise
+    return 'Report {} built'.format(cpmreport_id)
+
+
+@shared_task
+def evict_chart_cache():
+    from projects import chart_cache
+
+    removed = chart_cache.evict()
+    return 'Evicted {} cached charts'.format(removed)
@@ -1,3 +1,728 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import runpy
+import sys
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pypdf
+from celery import current_app
+from celery.signals import task_prerun
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from PIL import Image
+
+from companies.models import Company, CompanyProfile, Holiday, WorkCalendar
+from projects import calculate_critical_path, chart_cache, incremental
+from projects.calendars import from_workdays, to_workdays
+from projects.crashing import cheapest_cut, crash
+from projects.evm import metrics, project_evm
+from projects.incremental import IncrementalSchedule
+from projects.layout import count_crossings, layered_layout
+from projects.leveling import LevelingError, level
+from projects.forms import RiskSimulationForm
+from projects.models import Category, CPMReport, CPMReportData, Predecessor, Project, Task
+from projects.pdf_assembly import write_image_pdf
+from projects.reporting import get_progress
+from projects.schedule_engine import CycleError, ScheduleGraph, schedule, critical_chains, float_paths, free_float, FS, SS, FF, SF
+from projects.portfolio import schedule_portfolio
+from projects.risk import simulate_project
+from projects.schedule_vectorized import schedule_vectorized
+from projects.url_fetcher import FetchRefused, LocalURLFetcher
+from projects.tasks import build_project_report, schedule_project_portfolio, simulate_project_risk
+from projects.utils import generate_cpm_report
+from projects.whatif import OverrideError, _run, apply_overrides, what_if
+from users.models import User
+
+
+# URLs of the view tests, see ReportJobTestCase.
+urlpatterns = [path('projects/', include('projects.urls', namespace='projects'))]
+
+
+SAMPLE = [
+    ('h', 3, ['f', 'g']),
+    ('a', 3, []),
+    ('g', 4, ['d', 'e']),
+    ('b', 4, ['a']),
+    ('c', 2, ['a']),
+    ('d', 5, ['b']),
+    ('e', 1, ['c']),
+    ('f', 2, ['c']),
+]
+
+
+class ProjectFixtureMixin:
+    """Projects and tasks in the database; Celery tasks run in this process."""
+
+    def setUp(self):
+        super().setUp()
+        previous = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, 'task_always_eager', previous)
+        self.start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.category = Category.objects.create(company=Company.objects.create(name='company'), name='category')
+
+    def make_project(self, name, parent=None, **kwargs):
+        return Project.objects.create(category=self.category, name=name, parent=parent, **kwargs)
+
+    def make_task(self, project, name, days, offset=0):
+        start = self.start + datetime.timedelta(days=offset)
+        return Task.objects.create(project=project, name=name, start_date=start, end_date=start + datetime.timedelta(days=days))
+
+    def link(self, from_task, to_task, start_type=0, lag=0):
+        return Predecessor.objects.create(from_task=from_task, to_task=to_task, start_type=start_type, lag=lag)
+
+
+def build_graph(rows):
+    return ScheduleGraph(
+        [r[0] for r in rows],
+        [r[1] for r in rows],
+        [(p, r[0]) for r in rows for p in r[2]],
+    )
+
+
+class ScheduleEngineTestCase(SimpleTestCase):
+    def test_unordered_input_is_scheduled(self):
+        result = schedule(build_graph(SAMPLE))
+        self.assertEqual(result.project_duration, 19)
+        self.assertEqual(result.node('g').es, 12)
+        self.assertEqual(result.node('c').slack, 6)
+        critical = [result.graph.keys[v] for v in result.critical()]
+        self.assertEqual(critical, ['a', 'b', 'd', 'g', 'h'])
+
+    def test_cycle_raises(self):
+        rows = [('a', 1, ['c']), ('b', 1, ['a']), ('c', 1, ['b'])]
+        with self.assertRaises(CycleError):
+            schedule(build_graph(rows))
+
+    def test_vectorized_matches_loop(self):
+        graph = build_graph(SAMPLE)
+        loop = schedule(graph)
+        vector = schedule_vectorized(graph)
+        self.assertEqual(list(loop.es), vector.es.tolist())
+        self.assertEqual(list(loop.lf), vector.lf.tolist())
+        self.assertEqual(loop.project_duration, vector.project_duration)
+
+    def test_link_types_and_lag(self):
+        graph = ScheduleGraph(
+            ['a', 'b', 'c', 'd'],
+            [4, 2, 3, 6],
+            [('a', 'b', SS, 1), ('a', 'c', FF, 2), ('a', 'd', SF, -1)],
+        )
+        result = schedule(graph)
+        self.assertEqual(result.node('b').es, 1)
+        self.assertEqual(result.node('c').ef, 6)
+        self.assertEqual(result.node('d').es, 0)
+        vector = schedule_vectorized(graph)
+        self.assertEqual(list(result.ls), vector.ls.tolist())
+
+
+    def test_float_paths(self):
+        result = schedule(build_graph(SAMPLE))
+        keys = result.graph.keys
+        self.assertEqual([[keys[v] for v in chain] for chain in critical_chains(result)], [['a', 'b', 'd', 'g', 'h']])
+        paths = [(slack, ''.join(keys[v] for v in path)) for slack, path in float_paths(result, k=3)]
+        self.assertEqual(paths, [(0, 'abdgh'), (6, 'acegh'), (9, 'acfh')])
+        vector = schedule_vectorized(result.graph)
+        self.assertEqual(float_paths(vector, k=3), float_paths(result, k=3))
+
+    def test_layered_layout(self):
+        graph = build_graph(SAMPLE)
+        x, y = layered_layout(graph)
+        level = dict(zip(graph.keys, x.tolist()))
+        self.assertEqual(level, {'a': 0, 'b': 1, 'c': 1, 'd': 2, 'e': 2, 'f': 2, 'g': 3, 'h': 4})
+        src = np.repeat(np.arange(len(graph)), np.diff(np.asarray(graph.succ_ptr)))
+        dst = np.asarray(graph.succ_idx)
+        short = x[dst] - x[src] == 1
+        self.assertEqual(count_crossings(x, y, src[short], dst[short]), 0)
+        self.assertEqual(layered_layout(graph)[1].tolist(), y.tolist())
+
+    def test_free_float(self):
+        result = schedule(build_graph(SAMPLE))
+        free = dict(zip(result.graph.keys, free_float(result)))
+        self.assertEqual(free, {'a': 0, 'b': 0, 'c': 0, 'd': 0, 'e': 6, 'f': 9, 'g': 0, 'h': 0})
+
+class IncrementalScheduleTestCase(SimpleTestCase):
+    def setUp(self):
+        day = datetime.timedelta(days=1)
+        self.epoch = datetime.datetime(2024, 1, 1)
+        self.tasks = {name: (self.epoch, self.epoch + duration * day) for name, duration, _ in SAMPLE}
+        self.links = [(p, name, FS, 0) for name, _, preds in SAMPLE for p in preds]
+        self.state = IncrementalSchedule(
+            self.epoch, [(k, s, e) for k, (s, e) in self.tasks.items()], self.links)
+
+    def rebuilt(self):
+        return IncrementalSchedule(
+            self.epoch, [(k, s, e) for k, (s, e) in self.tasks.items()], self.links).as_dict()
+
+    def test_update_touches_only_the_cone(self):
+        start, end = self.tasks['f']
+        self.tasks['f'] = (start, end + datetime.timedelta(days=1))
+        stats = self.state.set_task('f', *self.tasks['f'])
+        self.assertEqual(stats.forward, 2)
+        self.assertEqual(self.state.as_dict(), self.rebuilt())
+
+    def test_crashing_cuts_the_cheapest_critical_tasks(self):
+        costs = {'a': 100, 'b': 50, 'c': 10, 'd': 30, 'e': 10, 'f': 10, 'g': 80, 'h': 60}
+        steps = crash(self.state, costs, {key: 1 for key in costs}, days=6)
+        self.assertEqual([step.finish for step in steps], [18, 17, 16, 15, 14, 13])
+        self.assertEqual([step.crashed for step in steps], [['d']] * 4 + [['b']] * 2)
+        self.assertEqual(steps[-1].cost, 220)
+
+    def test_crashing_follows_link_types(self):
+        day = datetime.timedelta(days=1)
+
+        def state(a, b, link, lag=0):
+            tasks = [('a', self.epoch, self.epoch + a * day), ('b', self.epoch, self.epoch + b * day)]
+            return IncrementalSchedule(self.epoch, tasks, [('a', 'b', link, lag)])
+
+        floor = {'a': 0, 'b': 0}
+
+        # The finish is b's: a only sets b's start.
+        self.assertEqual(cheapest_cut(state(5, 10, SS), {'a': None, 'b': 1}, floor), ['b'])
+        # b finishes with a, whatever its own duration.
+        self.assertEqual(cheapest_cut(state(10, 5, FF), {'a': 5, 'b': 1}, floor), ['a'])
+        # b finishes 8 days after a starts: no duration is on the path.
+        self.assertIsNone(cheapest_cut(state(4, 3, SF, 8), {'a': 1, 'b': 1}, floor))
+
+    def test_link_against_order(self):
+        self.links.append(('e', 'b', SS, 2))
+        self.state.set_link('e', 'b', SS, 2)
+        self.assertEqual(self.state.as_dict(), self.rebuilt())
+        with self.assertRaises(CycleError):
+            self.state.set_link('d', 'e', FS, 0)
+
+
+class IncrementalRegistryTestCase(SimpleTestCase):
+    def test_threads_share_the_registry(self):
+        self.addCleanup(incremental._registry.clear)
+        # Switch threads as often as possible, so the registry operations interleave.
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        errors = []
+
+        def worker(offset):
+            try:
+                for i in range(2000):
+                    project_id = (offset + i * 7) % (incremental.REGISTRY_SIZE * 3)
+                    state = incremental.get_incremental_schedule(project_id)
+                    self.assertEqual(state.keys, [project_id])
+            except Exception as exc:
+                errors.append(exc)
+
+        def from_project(project_id, version=0):
+            return IncrementalSchedule(self.epoch, [(project_id, self.epoch, self.epoch)], [], version=version)
+
+        self.epoch = datetime.datetime(2024, 1, 1)
+        with mock.patch('projects.incremental.current_version', return_value=0), \
+                mock.patch.object(IncrementalSchedule, 'from_project', side_effect=from_project):
+            threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(incremental._registry), incremental.REGISTRY_SIZE)
+
+
+class WhatIfTestCase(SimpleTestCase):
+    def setUp(self):
+        keys = list(range(len(SAMPLE)))
+        index = {name: i for i, (name, _, _) in enumerate(SAMPLE)}
+        durations = [duration for _, duration, _ in SAMPLE]
+        links = [(index[p], index[name], FS, 0) for name, _, preds in SAMPLE for p in preds]
+        release = [0] * len(keys)
+        self.index = index
+        self.baseline = {
+            'keys': keys, 'durations': durations, 'release': release, 'finish': 0, 'links': links,
+            'schedule': _run(keys, durations, release, 0, links),
+        }
+
+    def rerun(self, overrides):
+        durations, release, links = apply_overrides(self.baseline, overrides)
+        return _run(self.baseline['keys'], durations, release, 0, links)
+
+    def test_slip_and_drop_link(self):
+        es, _, _, _, finish = self.rerun([{'type': 'slip', 'task': self.index['c'], 'days': 7}])
+        self.assertEqual(es[self.index['c']], 10)
+        self.assertEqual(finish, 20)
+        *_, finish = self.rerun([{'type': 'remove_link', 'from_task': self.index['b'], 'to_task': self.index['d']}])
+        self.assertEqual(finish, 13)
+        self.assertEqual(self.baseline['schedule'][4], 19)
+
+    def test_bad_override(self):
+        with self.assertRaises(OverrideError):
+            apply_overrides(self.baseline, [{'type': 'slip', 'task': 99, 'days': 1}])
+        for overrides in (
+            [{'type': 'slip', 'task': self.index['c'], 'days': None}],
+            [{'type': 'extend', 'task': self.index['c'], 'days': 'soon'}],
+            [{'type': 'add_link', 'from_task': self.index['a'], 'to_task': self.index['h'], 'lag': [1]}],
+            [{'type': 'slip', 'task': None, 'days': 1}],
+            [7],
+            {'type': 'slip'},
+        ):
+            with self.assertRaises(OverrideError, msg=overrides):
+                apply_overrides(self.baseline, overrides)
+        with self.assertRaises(CycleError):
+            self.rerun([{'type': 'add_link', 'from_task': self.index['h'], 'to_task': self.index['a']}])
+
+    def test_vectorized_run_is_json_ready(self):
+        baseline = self.baseline
+        with mock.patch('projects.whatif.VECTORIZE_TASKS', 0):
+            run = _run(baseline['keys'], baseline['durations'], baseline['release'], 0, baseline['links'])
+        self.assertEqual(run, baseline['schedule'])
+        self.assertEqual(json.loads(json.dumps(run)), [list(values) for values in run[:4]] + [run[4]])
+
+
+class WorkCalendarTestCase(SimpleTestCase):
+    def test_round_trip_skips_weekends_and_holidays(self):
+        calendar = np.busdaycalendar(weekmask='1111100', holidays=['2024-01-03'])
+        monday = datetime.datetime(2024, 1, 1, 9)
+        release, durations, finish = to_workdays(
+            monday, [monday, monday + datetime.timedelta(days=4)], [monday + datetime.timedelta(days=7)] * 2, calendar)
+        self.assertEqual(release, [0, 3])
+        self.assertEqual(durations, [4, 1])
+        self.assertEqual(finish, 4)
+        self.assertEqual(
+            from_workdays(monday, [0, 2, 4], calendar),
+            [monday, monday + datetime.timedelta(days=3), monday + datetime.timedelta(days=7)],
+        )
+
+
+class LevelingTestCase(SimpleTestCase):
+    def test_shared_resource_serializes_parallel_work(self):
+        graph = build_graph(SAMPLE)
+        cpm = schedule(graph)
+        crew = [[(0, 1)] if key in 'bcde' else [] for key in graph.keys]
+        starts = level(graph, crew, [1], priority=list(zip(cpm.ls, cpm.es, range(len(graph)))))
+        start = dict(zip(graph.keys, starts))
+        self.assertEqual([start[key] for key in 'abdceg'], [0, 3, 7, 12, 14, 15])
+        self.assertEqual(level(graph, crew, [2]), list(cpm.es))
+        with self.assertRaises(LevelingError):
+            level(graph, [[(0, 3)]] * len(graph), [2])
+
+
+class EarnedValueTestCase(SimpleTestCase):
+    def test_metrics(self):
+        row = {'bac': Decimal('1000'), 'pv': 400.004, 'ev': Decimal('300'), 'ac': Decimal('250')}
+        result = metrics(row, datetime.date(2024, 1, 1))
+        self.assertEqual(result['pv'], Decimal('400.00'))
+        self.assertEqual(result['sv'], Decimal('-100.00'))
+        self.assertEqual(result['spi'], Decimal('0.7500'))
+        self.assertEqual(result['cpi'], Decimal('1.2000'))
+        self.assertEqual(result['eac'], Decimal('833.33'))
+
+    def test_metrics_without_costs(self):
+        result = metrics({'bac': None, 'pv': None, 'ev': None, 'ac': None}, datetime.date(2024, 1, 1))
+        self.assertIsNone(result['spi'])
+        self.assertIsNone(result['cpi'])
+        self.assertIsNone(result['eac'])
+
+
+class GanttChartTestCase(SimpleTestCase):
+    def setUp(self):
+        start = datetime.datetime(2024, 1, 1)
+        self.data = [
+            {'activity': 'a', 'es': start, 'duration': 3, 'slack': 0},
+            {'activity': 'b', 'es': start + datetime.timedelta(days=1), 'duration': 1, 'slack': 2},
+        ]
+
+    def test_saved(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'gantt.png')
+            calculate_critical_path.draw_gantt_chart(self.data, ['a'], save_path=path)
+            self.assertTrue(os.path.getsize(path))
+
+    def test_shown_without_save_path(self):
+        with mock.patch.object(calculate_critical_path.plt, 'show') as show:
+            calculate_critical_path.draw_gantt_chart(self.data, ['a'])
+        show.assert_called_once_with()
+
+
+class ChartCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def draw(self, content):
+        def draw(path):
+            self.draws += 1
+            with open(path, 'w') as handle:
+                handle.write(content)
+        return draw
+
+    def test_renders_once_per_input(self):
+        self.draws = 0
+        key = chart_cache.chart_key('gantt_page', [{'activity': 'A', 'es': '2024-01-01'}], {'page': 0})
+        self.assertEqual(key, chart_cache.chart_key('gantt_page', [{'es': '2024-01-01', 'activity': 'A'}], {'page': 0}))
+        self.assertNotEqual(key, chart_cache.chart_key('gantt_page', [{'activity': 'A', 'es': '2024-01-02'}], {'page': 0}))
+        path = chart_cache.render(key, self.draw('a'))
+        self.assertEqual(chart_cache.render(key, self.draw('b')), path)
+        self.assertEqual(self.draws, 1)
+        with open(path) as handle:
+            self.assertEqual(handle.read(), 'a')
+
+    def test_inline_svg(self):
+        self.draws = 0
+        key = chart_cache.chart_key('gantt_page', [], format='svg')
+        self.assertTrue(key.endswith('.svg'))
+        chart_cache.render(key, self.draw('<?xml version="1.0"?>\n<!DOCTYPE svg>\n<svg></svg>'))
+        self.assertEqual(chart_cache.inline_svg(key), '<svg></svg>')
+
+    def test_evict(self):
+        self.draws = 0
+        old, recent = chart_cache.chart_key('a', []), chart_cache.chart_key('b', [])
+        chart_cache.render(old, self.draw('x' * 10))
+        chart_cache.render(recent, self.draw('x' * 10))
+        os.utime(chart_cache.chart_path(old), (0, 0))
+        self.assertEqual(chart_cache.evict(), 1)
+        self.assertIsNone(chart_cache.lookup(old))
+        self.assertEqual(chart_cache.evict(max_bytes=0), 0)
+        self.assertIsNotNone(chart_cache.lookup(recent))
+        self.assertEqual(chart_cache.evict(max_bytes=0, min_age=0), 1)
+        self.assertIsNone(chart_cache.lookup(recent))
+
+
+class CeleryBeatScheduleTestCase(SimpleTestCase):
+    def test_chart_cache_eviction_is_scheduled(self):
+        environ = dict.fromkeys((
+            'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD', 'DB_HOST',
+            'EMAIL_HOST', 'EMAIL_HOST_USER', 'EMAIL_HOST_PASSWORD', 'SERVER_EMAIL',
+        ), 'test')
+        with mock.patch.dict(os.environ, environ):
+            project_settings = runpy.run_path(os.path.join(
+                os.path.dirname(os.path.dirname(__file__)), 'taskproject2', 'settings.py'))
+        tasks = [entry['task'] for entry in project_settings['CELERY_BEAT_SCHEDULE'].values()]
+        self.assertIn('projects.tasks.evict_chart_cache', tasks)
+
+
+class PdfAssemblyTestCase(SimpleTestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.pages = [os.path.join(self.folder, name) for name in ('a.png', 'b.png')]
+        Image.new('RGB', (100, 50), 'red').save(self.pages[0], dpi=(100, 100))
+        Image.new('RGBA', (400, 200), (0, 0, 255, 128)).save(self.pages[1], dpi=(200, 200))
+        self.output = os.path.join(self.folder, 'out.pdf')
+
+    def test_pages_in_order(self):
+        self.assertEqual(write_image_pdf(self.pages, self.output, dpi=100), 2)
+        pages = pypdf.PdfReader(self.output).pages
+        self.assertEqual([round(float(page.mediabox.width)) for page in pages], [72, 144])
+        self.assertEqual([page.images[0].image.size for page in pages], [(100, 50), (200, 100)])
+
+    def test_unreadable_page(self):
+        with self.assertRaises(OSError):
+            write_image_pdf(self.pages + [os.path.join(self.folder, 'missing.png')], self.output)
+        self.assertFalse(os.path.exists(self.output))
+
+
+class LocalURLFetcherTestCase(SimpleTestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        media = os.path.join(folder.name, 'media')
+        os.makedirs(os.path.join(media, 'charts'))
+        with open(os.path.join(media, 'charts', 'a b.svg'), 'w') as handle:
+            handle.write('<svg></svg>')
+        with open(os.path.join(folder.name, 'secret.txt'), 'w') as handle:
+            handle.write('secret')
+        self.settings = override_settings(MEDIA_ROOT=media, MEDIA_URL='/media/', STATIC_URL='/static/')
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.fetcher = LocalURLFetcher('testserver')
+
+    def test_media(self):
+        result = self.fetcher('http://testserver/media/charts/a%20b.svg')
+        with result['file_obj'] as handle:
+            self.assertEqual(handle.read(), b'<svg></svg>')
+        self.assertEqual(result['mime_type'], 'image/svg+xml')
+
+    def test_refused(self):
+        for url in (
+            'http://example.com/media/charts/a%20b.svg',
+            'file:///etc/passwd',
+            'http://testserver/media/../secret.txt',
+            'http://testserver/media/%2E%2E/secret.txt',
+            'http://testserver/media/charts/missing.png',
+            'http://testserver/projects/',
+        ):
+            with self.assertRaises(FetchRefused, msg=url):
+                self.fetcher(url)
+
+
+class PredecessorCycleTestCase(ProjectFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        project = self.make_project('project')
+        self.a = self.make_task(project, 'a', 1)
+        self.b = self.make_task(project, 'b', 1, offset=2)
+        self.c = self.make_task(project, 'c', 1, offset=4)
+        self.ab = self.link(self.a, self.b)
+        self.link(self.b, self.c)
+
+    def test_closing_link_rejected(self):
+        # The dates allow it: only the cycle check can reject it.
+        link = Predecessor(from_task=self.c, to_task=self.a, start_type=SS, lag=-4)
+        self.assertTrue(link.creates_cycle())
+        with self.assertRaisesMessage(ValidationError, 'would create a dependency cycle'):
+            link.save()
+        self.assertFalse(Predecessor.objects.filter(from_task=self.c, to_task=self.a).exists())
+
+    def test_update_is_not_its_own_cycle(self):
+        self.ab.start_type = SS
+        self.assertFalse(self.ab.creates_cycle())
+        self.ab.save()
+        self.assertEqual(Predecessor.objects.get(pk=self.ab.pk).start_type, SS)
+
+    def test_detect_cycle_on_long_chain(self):
+        data = [{'activity': 0, 'duration': 1, 'predecessors': []}] + [
+            {'activity': v, 'duration': 1, 'predecessors': [v - 1]} for v in range(1, 5000)
+        ]
+        calculate_critical_path.detect_cycle(data)
+        data[0]['predecessors'] = [4999]
+        with self.assertRaises(ValueError):
+            calculate_critical_path.detect_cycle(data)
+
+
+class PortfolioTestCase(ProjectFixtureMixin, TestCase):
+    def test_parallel_schedule(self):
+        root = self.make_project('root')
+        child = self.make_project('child', parent=root)
+        a, b = self.make_task(root, 'a', 3), self.make_task(child, 'b', 2, offset=4)
+        c, d = self.make_task(root, 'c', 4, offset=1), self.make_task(child, 'd', 1, offset=8)
+        self.link(a, b)
+        self.link(c, d, lag=2)
+        epoch, expected = schedule_portfolio(root.pk)
+
+        with mock.patch('projects.portfolio.PARALLEL_TASKS', 0), mock.patch('projects.portfolio.BUNDLES', 2):
+            self.assertIn('split into 2 bundles', schedule_project_portfolio.delay(root.pk).get())
+        day = datetime.timedelta(days=1)
+        stored = {
+            row.task_id: (row.cpmreport.project_id, row.es, row.ef, row.ls, row.lf)
+            for row in CPMReportData.objects.select_related('cpmreport')
+        }
+        self.assertEqual(stored, {
+            key: (project_id,) + tuple(epoch + value * day for value in values)
+            for key, (project_id, *values) in expected.items()
+        })
+        self.assertEqual(len(stored), 4)
+
+
+class ProjectScheduleTestCase(ProjectFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        incremental._registry.clear()
+        self.addCleanup(incremental._registry.clear)
+
+    def test_saved_task_updates_only_its_cone(self):
+        project = self.make_project('project')
+        with self.captureOnCommitCallbacks(execute=True):
+            a, b = self.make_task(project, 'a', 3), self.make_task(project, 'b', 2, offset=4)
+            c, d = self.make_task(project, 'c', 1, offset=7), self.make_task(project, 'd', 5)
+            self.link(a, b)
+            self.link(b, c)
+        project.compute_schedule(refresh=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            b.end_date += datetime.timedelta(days=2)
+            b.save()
+        values = project.compute_schedule()
+        self.assertEqual(incremental.last_update(project.pk).forward, 2)
+        self.assertEqual(values[c.pk]['early_start'], self.start + datetime.timedelta(days=8))
+        self.assertEqual(values, project.compute_schedule(refresh=True))
+        self.assertEqual(project.critical_chains(), [[b.pk, c.pk]])
+
+    def test_start_date_is_a_start_no_earlier_than(self):
+        project = self.make_project('project')
+        a, b = self.make_task(project, 'a', 3), self.make_task(project, 'b', 2, offset=5)
+        self.link(a, b)
+        values = project.compute_schedule()
+        day = datetime.timedelta(days=1)
+        self.assertEqual(values[b.pk]['early_start'], self.start + 5 * day)
+        self.assertEqual(values[a.pk]['late_finish'], self.start + 5 * day)
+        self.assertEqual(values[a.pk]['total_float'], 2)
+
+    def test_celery_task_drops_the_memo(self):
+        project = self.make_project('project')
+        a = self.make_task(project, 'a', 3)
+        project.compute_schedule()
+        Task.objects.filter(pk=a.pk).update(end_date=a.end_date + datetime.timedelta(days=1))
+        task_prerun.send(sender=None, task_id='task', task=None)
+        self.assertEqual(project.compute_schedule()[a.pk]['early_finish'], self.start + datetime.timedelta(days=4))
+
+
+class WhatIfProjectTestCase(ProjectFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_working_days(self):
+        self.start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)  # a Monday
+        WorkCalendar.objects.create(company=self.category.company, name='calendar', weekmask='1111100')
+        project = self.make_project('project', working_days=True)
+        a = self.make_task(project, 'a', 4)
+        result = what_if(project.pk, [{'type': 'extend', 'task': a.pk, 'days': 1}])
+        day = datetime.timedelta(days=1)
+        self.assertEqual(result['finish'], [(self.start + 4 * day).isoformat(), (self.start + 7 * day).isoformat()])
+        self.assertEqual(json.loads(json.dumps(result)), result)
+
+    def test_holiday_moves_the_schedule_version(self):
+        self.start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)  # a Monday
+        calendar = WorkCalendar.objects.create(company=self.category.company, name='calendar', weekmask='1111100')
+        project = self.make_project('project', working_days=True)
+        a = self.make_task(project, 'a', 4)
+        extend = [{'type': 'extend', 'task': a.pk, 'days': 1}]
+        day = datetime.timedelta(days=1)
+        self.assertEqual(what_if(project.pk, extend)['finish'][1], (self.start + 7 * day).isoformat())
+        self.assertEqual(project_evm(project.pk)['bac'], Decimal('0.00'))
+        # Bypasses the task receivers: only the calendar change can expire the cached figures.
+        Task.objects.filter(pk=a.pk).update(budget=100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Holiday.objects.create(calendar=calendar, date=datetime.date(2024, 1, 8))
+        self.assertEqual(what_if(project.pk, extend)['finish'][1], (self.start + 8 * day).isoformat())
+        self.assertEqual(project_evm(project.pk)['bac'], Decimal('100.00'))
+        a.refresh_from_db()
+        self.assertEqual(a.schedule_version, incremental.current_version(project.pk))
+
+        version = incremental.current_version(project.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            project.working_days = False
+            project.save()
+        self.assertEqual(incremental.current_version(project.pk), version + 1)
+        self.assertEqual(what_if(project.pk, extend)['finish'][1], (self.start + 5 * day).isoformat())
+
+
+class RiskSimulationTestCase(ProjectFixtureMixin, TestCase):
+    def test_parallel_matches_serial(self):
+        project = self.make_project('project')
+        a = self.make_task(project, 'a', 3)
+        b = self.make_task(project, 'b', 2, offset=4)
+        Task.objects.filter(pk=a.pk).update(optimistic_duration=1, likely_duration=3, pessimistic_duration=9)
+        self.link(a, b)
+        cpmreport = CPMReport.objects.create(name='report', project=project)
+
+        with mock.patch('projects.risk.CHUNK_CELLS', 20), mock.patch('projects.risk.PARALLEL_CELLS', 0):
+            expected = simulate_project(project.pk, iterations=50, seed=7)
+            self.assertIn('split into 5 chunks', simulate_project_risk.delay(cpmreport.pk, 50, 7).get())
+        cpmreport.refresh_from_db()
+        self.assertEqual(
+            (cpmreport.p50_finish, cpmreport.p80_finish, cpmreport.p95_finish),
+            (expected.p50, expected.p80, expected.p95),
+        )
+
+    def test_iterations(self):
+        form = RiskSimulationForm({})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['iterations'], 1000)
+        for value in ('abc', '0', '-5', '100001'):
+            self.assertFalse(RiskSimulationForm({'iterations': value}).is_valid(), value)
+
+
+@override_settings(ROOT_URLCONF='projects.tests', ALLOWED_ORIGINS=['testserver'])
+class ReportJobTestCase(ProjectFixtureMixin, TestCase):
+    """The report job, with the chart drawing replaced by blank images of known widths."""
+
+    WIDTHS = {('activity_graph', None): 10, ('gantt_chart', None): 20, ('critical_path', None): 30,
+              ('gantt_page', 0): 40, ('gantt_page', 1): 50}
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for target, value in (('projects.reporting.draw_chart', self.draw), ('projects.reporting.GANTT_PAGE_SIZE', 1)):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.project = self.make_project('project')
+        self.link(self.make_task(self.project, 'a', 3), self.make_task(self.project, 'b', 2, offset=4))
+        self.user = User.objects.create(email='user@example.com')
+        CompanyProfile.objects.create(company=self.category.company, profile=self.user.profile)
+        self.drawn, self.progress, self.broken = [], [], None
+
+    def draw(self, chart_input, activities, kind, page, path):
+        self.drawn.append((kind, page))
+        self.progress.append(get_progress(self.report_id))
+        if (kind, page) == self.broken:
+            raise RuntimeError('broken chart')
+        Image.new('RGB', (self.WIDTHS[kind, page], 10), 'white').save(path, format='PNG')
+
+    def request(self, view, ajax=True, **kwargs):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest', 'HTTP_ORIGIN': 'http://testserver'} if ajax else {}
+        request = RequestFactory().get('/', **headers)
+        request.user = self.user
+        return view(request, **kwargs)
+
+    def generate(self, ajax=True):
+        """Queue a report; the job runs when the view's transaction commits."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.request(generate_cpm_report, ajax=ajax, project_id=self.project.pk)
+            if ajax:
+                self.assertEqual(response.status_code, 202)
+                job = json.loads(response.content)
+                self.report_id = job['report']
+                self.assertEqual(job['job'], CPMReport.objects.get(pk=self.report_id).job_id)
+                self.assertEqual(self.status()['status'], CPMReport.PENDING)
+        return response
+
+    def status(self):
+        from projects.views import cpmreport_status
+
+        return json.loads(self.request(cpmreport_status, cpmreport_id=self.report_id).content)
+
+    def test_job_reports_progress(self):
+        self.generate()
+        self.assertEqual({progress['stage'] for progress in self.progress}, {'charts'})
+        self.assertEqual(sorted(progress['percent'] for progress in self.progress), [30, 42, 54, 66, 78])
+        self.assertEqual(self.status(), {
+            'report': self.report_id, 'job': CPMReport.objects.get(pk=self.report_id).job_id,
+            'status': CPMReport.DONE, 'stage': 'done', 'percent': 100,
+        })
+        self.assertEqual(CPMReport.objects.get(pk=self.report_id).cpmreportdata_set.count(), 2)
+
+    def test_charts_render_once_and_assemble_in_order(self):
+        self.generate()
+        self.assertEqual(sorted(self.drawn, key=str), sorted(self.WIDTHS, key=str))
+        with CPMReport.objects.get(pk=self.report_id).pdf.open('rb') as handle:
+            widths = [float(page.mediabox.width) for page in pypdf.PdfReader(handle).pages]
+        self.assertEqual(widths, [width * 72 / 100 for width in self.WIDTHS.values()])
+
+        # An unchanged project is assembled from the chart cache.
+        self.generate()
+        self.assertEqual(len(self.drawn), len(self.WIDTHS))
+        self.assertEqual(self.status()['status'], CPMReport.DONE)
+
+    def test_failed_chart_fails_the_report(self):
+        self.broken = ('gantt_page', 1)
+        self.generate()
+        status = self.status()
+        self.assertEqual((status['status'], status['stage']), (CPMReport.FAILED, 'failed'))
+        self.assertIn('gantt_page 2: broken chart', status['error'])
+        self.assertIsNone(get_progress(self.report_id))
+
+    def test_failed_preparation_fails_the_report(self):
+        with mock.patch('projects.reporting.schedule_data', side_effect=RuntimeError('no schedule')):
+            self.assertEqual(self.generate(ajax=False).status_code, 302)
+        report = CPMReport.objects.get()
+        self.assertEqual((report.status, report.error), (CPMReport.FAILED, 'no schedule'))
+        self.assertIsNone(get_progress(report.pk))
+        self.assertEqual(self.drawn, [])
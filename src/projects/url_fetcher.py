@@ -0,0 +1,87 @@
+"""
+WeasyPrint URL fetcher that reads media and static files from disk.
+
+Reports are rendered with the request's absolute URL as base, so the
+images and stylesheets they reference resolve to ``http://<host>/media/...``
+and ``http://<host>/static/...``.  WeasyPrint's default fetcher would
+request them over HTTP, back through the proxies to the application, and
+hold a worker for each one while the report request waits.
+
+``LocalURLFetcher`` serves those paths from ``MEDIA_ROOT`` and
+``STATIC_ROOT`` (or the staticfiles finders, before ``collectstatic``) and
+refuses every other fetch, ``data:`` URLs aside, so rendering a report makes
+no network request at all.
+"""
+import mimetypes
+import os
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+
+class FetchRefused(ValueError):
+    """A URL the report renderer may not fetch; WeasyPrint skips the resource."""
+
+
+def _local_file(root, relative):
+    """``relative`` under ``root``, or None if it is missing or escapes ``root``."""
+    if not root:
+        return None
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, relative))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def media_file(relative):
+    return _local_file(settings.MEDIA_ROOT, relative)
+
+
+def static_file(relative):
+    path = _local_file(settings.STATIC_ROOT, relative)
+    if path is None:
+        found = finders.find(relative)
+        path = found if isinstance(found, str) else None
+    return path
+
+
+class LocalURLFetcher:
+    """
+    ``url_fetcher`` for ``weasyprint.HTML``.  Only URLs on ``hosts`` (the
+    host the request was made to, see ``HttpRequest.get_host``) or without
+    a host are resolved.
+    """
+
+    def __init__(self, *hosts):
+        self.hosts = {host.lower() for host in hosts}
+        self.prefixes = (
+            (urlsplit(settings.MEDIA_URL).path, media_file),
+            (urlsplit(settings.STATIC_URL).path, static_file),
+        )
+
+    def resolve(self, url):
+        """The local file of ``url``; raises FetchRefused for anything else."""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https', '') or parts.netloc.lower() not in self.hosts | {''}:
+            raise FetchRefused(f"Refusing to fetch {url}")
+        for prefix, lookup in self.prefixes:
+            if prefix and parts.path.startswith(prefix):
+                path = lookup(unquote(parts.path[len(prefix):]))
+                if path is not None:
+                    return path
+        raise FetchRefused(f"No local file for {url}")
+
+    def __call__(self, url, timeout=10, ssl_context=None, **kwargs):
+        if url.startswith('data:'):
+            from weasyprint import default_url_fetcher
+
+            return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+        path = self.resolve(url)
+        return {
+            'file_obj': open(path, 'rb'),
+            'mime_type': mimetypes.guess_type(path)[0],
+            'filename': os.path.basename(path),
+            'redirected_url': url,
+        }
@@ -25,6 +25,14 @@ urlpatterns = get_patterns(app_name,'views') + [
 
     path('predecessor/delete/<int:task>/<int:id>/', views.delete_predecessor, name='predecessor_delete'),
     path('project/report/<int:project_id>/',views.download_full_project_report_pdf,name="project-report"),
+    path('cpmreport/risk/<int:cpmreport_id>/', views.cpmreport_risk_simulation, name="cpmreport-risk"),
+    path('cpmreport/status/<int:cpmreport_id>/', views.cpmreport_status, name="cpmreport-status"),
+    path('project/portfolio/schedule/<int:project_id>/', views.project_portfolio_schedule, name="project-portfolio-schedule"),
+    path('project/what-if/<int:project_id>/', views.project_what_if, name="project-what-if"),
+    path('project/leveling/<int:project_id>/', views.project_resource_leveling, name="project-resource-leveling"),
+    path('project/crashing/<int:project_id>/', views.project_crashing, name="project-crashing"),
+    path('project/earned-value/<int:project_id>/', views.project_earned_value, name="project-earned-value"),
+    path('company/earned-value/<int:company_id>/', views.company_earned_value, name="company-earned-value"),
     path('gantt-chart/<int:project_id>/', views.gantt_chart_view, name='gantt_chart'),
 
 ]
@@ -1,85 +1,61 @@
 import os
-from django.urls import reverse_lazy
+import uuid
+from django.urls import reverse, reverse_lazy
 from django.shortcuts import redirect
+from django.http import JsonResponse
 from django.conf import settings
+from django.db import transaction
 from django.core.files import File
 from django.core.mail import EmailMessage
+from core.functions import is_ajax
 from projects.models import *
 from projects.calculate_critical_path import *
+from projects.risk import simulate_project
 
 def generate_cpm_report(request,project_id):
-
-
+    """
+    Queue a CPM report of the project and return at once: JSON with the
+    job id and status URL for ajax calls, otherwise a redirect to the report.
+    """
     project = Project.objects.prefetch_related('category__company__profiles').get(category__company__profiles=request.user.profile.pk,id=project_id)
-    title = 'Cpm report'
-    tasks = Task.objects.prefetch_related('project__category__company__profiles','successor_tasks').filter(project__category__company__profiles=request.user.profile.pk,project_id=project.pk)
     cpmreport = CPMReport.objects.create(
-        name=title,
-        project=project
+        name='Cpm report',
+        project=project,
+        status=CPMReport.PENDING,
+        job_id=str(uuid.uuid4()),
     )
-    data = []
-    for task in tasks:
-        activity = {}
-        activity['activity'] = task.name
-        activity['early_start'] = activity['es'] = task.early_start
-        activity['late_start'] = activity['ls'] = task.late_start
-        activity['early_finish'] = activity['ef'] = task.early_finish
-        activity['duration'] = task.duration
-        activity['predecessors'] = []
-        for pr in task.successor_tasks.all():
-            activity['predecessors'].append(pr.from_task.name)
-        data.append(activity)
-    
-    temp_dir = os.path.join(settings.MEDIA_ROOT, 'tmp')
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    graph_path = os.path.join(temp_dir, f"cpm_graph_{cpmreport.id}.png")
-    gantt_path = os.path.join(temp_dir, f"gantt_chart_{cpmreport.id}.png")
-    critical_path_file = os.path.join(temp_dir, f"critical_path.png")
-    #paginated_path_file = os.path.join(temp_dir, f"paginated_gantt.png")
-    full_report = os.path.join(temp_dir, f"full_gantt_report.pdf")
-    
-    
-    
-    critical_path = calculate_cpm(data)
-    for item in critical_path:
-        print(item)
-        CPMReportData.objects.create(
-            cpmreport=cpmreport,
-            task=Task.objects.get(name=item['activity']),
-            slack=item['slack'],
-            es = item['es'],
-            ef = item['ef'],
-            ls = item['ls'],
-            lf = item['lf']
-        )
-    critical_path_data = []
-    
-    for item in CPMReportData.objects.filter(cpmreport_id=cpmreport.id,slack=0):
-        critical_path_data.append(item)
-    
-    critical_path = [activity['activity'] for activity in data if activity['slack'] == 0]
-    print(critical_path)
-    gantt_folder = os.path.join(settings.MEDIA_ROOT, 'gantt_pages', f'project_{project.id}')
-    os.makedirs(gantt_folder, exist_ok=True)
-    draw_activity_graph(data,critical_path, save_path=graph_path)
-    draw_gantt_chart(data, critical_path,save_path=gantt_path)
-    draw_critical_path_graph(data, critical_path, save_path=critical_path_file)
-    # Save paginated gantt charts
-    draw_paginated_gantt_chart(data,save_folder=gantt_folder, page_size=100)
-    merge_gantt_images_to_pdf(temp_dir, full_report)
-
-
-    with open(graph_path, 'rb') as graph_file:
-        cpmreport.cpm_graph.save(os.path.basename(graph_path), File(graph_file))
-
-    with open(gantt_path, 'rb') as gantt_file:
-        cpmreport.gantt_chart.save(os.path.basename(gantt_path), File(gantt_file))
-
-    cpmreport.save()
-    return redirect(reverse_lazy('projects:cpmreport_list'))
-    #return data
 
+    from projects.tasks import build_project_report
+    transaction.on_commit(lambda: build_project_report.apply_async((cpmreport.id,), task_id=cpmreport.job_id))
+    if is_ajax(request):
+        return JsonResponse({
+            'job': cpmreport.job_id,
+            'report': cpmreport.id,
+            'status_url': reverse('projects:cpmreport-status', kwargs={'cpmreport_id': cpmreport.id}),
+        }, status=202)
+    return redirect(reverse_lazy('projects:cpmreport_view', kwargs={'pk': cpmreport.id}))
+
+
+def store_risk_simulation(cpmreport_id, iterations=1000, seed=None, result=None):
+    """
+    Run a Monte Carlo PERT simulation for the report's project, unless its
+    ``result`` is given, and store the P50/P80/P95 finish on the report and
+    the criticality index on its rows.
+    """
+    cpmreport = CPMReport.objects.get(id=cpmreport_id)
+    if result is None:
+        result = simulate_project(cpmreport.project_id, iterations=iterations, seed=seed)
+    cpmreport.risk_iterations = result.iterations
+    cpmreport.p50_finish = result.p50
+    cpmreport.p80_finish = result.p80
+    cpmreport.p95_finish = result.p95
+    cpmreport.save(update_fields=['risk_iterations', 'p50_finish', 'p80_finish', 'p95_finish', 'updated'])
+
+    rows = list(CPMReportData.objects.filter(cpmreport_id=cpmreport.id))
+    for row in rows:
+        row.criticality = result.criticality.get(row.task_id)
+    CPMReportData.objects.bulk_update(rows, ['criticality'], batch_size=1000)
+    return result
 
 
 def send_report_email(request,report_id,emails):
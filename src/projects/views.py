@@ -1,4 +1,5 @@
 import datetime
+import json
 import plotly.express as px
 from django.core.files import File
 import os
@@ -16,9 +17,9 @@ import tempfile
 from django.conf import settings
 
 from django.http import HttpResponse
-from weasyprint import HTML
 
 
+from companies.models import Company
 from core.views import *
 
 from core.functions import is_ajax
@@ -26,6 +27,13 @@ from core.mixins import *
 from projects.models import *
 from projects.forms import *
 from projects.utils import *
+from projects.tasks import simulate_project_risk, schedule_project_portfolio, level_project_resources
+from projects.whatif import what_if
+from projects.crashing import crash_project
+from projects.evm import project_evm, company_evm
+from projects.url_fetcher import LocalURLFetcher
+from projects import chart_cache
+from projects.reporting import get_progress, chart_input, chart_unit, schedule_data, gantt_units, embedded_charts
 
 
 class CategoryListView(BaseListView,QueryMixin):
@@ -150,11 +158,28 @@ class TaskListView(BaseListView):
     model = Task
     paginate_by = 100  # if pagination is desired
     queryset = Task.objects.select_related('project__category__company').prefetch_related('project__category__company__profiles','predecessors')
+    # Sortable on the stored schedule columns, see persist_task_schedule.
+    orderings = ('name', 'start_date', 'end_date', 'es', 'lf', 'total_float', 'free_float')
 
     def get_queryset(self):
         queryset = super().get_queryset()
         queryset = queryset.filter(
                 project__category__company__profiles=self.request.user.profile.pk)
+        project = self.request.GET.get('project')
+        critical = self.request.GET.get('critical')
+        es_from = self.request.GET.get('es_from')
+        es_to = self.request.GET.get('es_to')
+        ordering = self.request.GET.get('ordering', '')
+        if project:
+            queryset = queryset.filter(project_id=project)
+        if critical:
+            queryset = queryset.filter(is_critical=True)
+        if es_from:
+            queryset = queryset.filter(es__date__gte=es_from)
+        if es_to:
+            queryset = queryset.filter(es__date__lte=es_to)
+        if ordering.lstrip('-') in self.orderings:
+            queryset = queryset.order_by(ordering, 'pk')
         return queryset
 
     def get_context_data(self, *args, **kwargs):
@@ -341,6 +366,108 @@ class CPMReportDetailView(BaseDetailView):
         return queryset
     
 
+def cpmreport_risk_simulation(request, cpmreport_id):
+    cpmreport = CPMReport.objects.get(
+        id=cpmreport_id, project__category__company__profiles=request.user.profile.pk)
+    form = RiskSimulationForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    simulate_project_risk.delay(cpmreport.id, form.cleaned_data['iterations'])
+    return redirect(reverse('projects:cpmreport_view', kwargs={"pk": cpmreport.id}))
+
+
+def cpmreport_status(request, cpmreport_id):
+    cpmreport = CPMReport.objects.get(
+        id=cpmreport_id, project__category__company__profiles=request.user.profile.pk)
+    status = {'report': cpmreport.id, 'job': cpmreport.job_id, 'status': cpmreport.status, 'stage': None, 'percent': 0}
+    if cpmreport.status == CPMReport.DONE:
+        status.update(stage='done', percent=100)
+    elif cpmreport.status == CPMReport.FAILED:
+        status.update(stage='failed', error=cpmreport.error)
+    else:
+        status.update(get_progress(cpmreport.id) or {})
+    return JsonResponse(status)
+
+
+def project_portfolio_schedule(request, project_id):
+    project = Project.objects.get(
+        id=project_id, category__company__profiles=request.user.profile.pk)
+    schedule_project_portfolio.delay(project.id)
+    return redirect(reverse('projects:cpmreport_list'))
+
+
+def project_resource_leveling(request, project_id):
+    project = Project.objects.get(
+        id=project_id, category__company__profiles=request.user.profile.pk)
+    level_project_resources.delay(project.id)
+    return redirect(reverse('projects:cpmreport_list'))
+
+
+def project_what_if(request, project_id):
+    project = Project.objects.get(
+        id=project_id, category__company__profiles=request.user.profile.pk)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a JSON body with an "overrides" list.'}, status=405)
+    try:
+        overrides = json.loads(request.body or b'{}').get('overrides', [])
+        return JsonResponse(what_if(project.id, overrides))
+    except (ValueError, TypeError, AttributeError) as exc:
+        # OverrideError, CycleError and malformed JSON are all ValueErrors.
+        return JsonResponse({'error': str(exc)}, status=400)
+
+
+def project_crashing(request, project_id):
+    project = Project.objects.get(
+        id=project_id, category__company__profiles=request.user.profile.pk)
+    try:
+        days = int(request.GET['days']) if request.GET.get('days') else None
+    except ValueError:
+        return JsonResponse({'error': '"days" must be an integer.'}, status=400)
+    state, normal_cost, steps = crash_project(project.id, days=days)
+    if state.epoch is None:
+        return JsonResponse({'normal': None, 'curve': []})
+    day = datetime.timedelta(days=1)
+    # Every step shortens the project by exactly one day.
+    finish = state.project_duration + len(steps)
+    return JsonResponse({
+        'normal': {'finish': (state.epoch + finish * day).isoformat(), 'cost': str(normal_cost)},
+        'curve': [
+            {
+                'finish': (state.epoch + step.finish * day).isoformat(),
+                'cost': str(normal_cost + step.cost),
+                'crash_cost': str(step.cost),
+                'crashed': step.crashed,
+            }
+            for step in steps
+        ],
+    })
+
+
+def _status_date(request):
+    value = request.GET.get('date')
+    return datetime.date.fromisoformat(value) if value else None
+
+
+def project_earned_value(request, project_id):
+    project = Project.objects.get(
+        id=project_id, category__company__profiles=request.user.profile.pk)
+    try:
+        status_date = _status_date(request)
+    except ValueError:
+        return JsonResponse({'error': '"date" must be YYYY-MM-DD.'}, status=400)
+    return JsonResponse(project_evm(project.id, status_date))
+
+
+def company_earned_value(request, company_id):
+    company = Company.objects.get(id=company_id, profiles=request.user.profile.pk)
+    try:
+        status_date = _status_date(request)
+        rows = company_evm(company.id, status_date, by=request.GET.get('by', 'project'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': rows})
+
+
 def gantt_chart_view(request, project_id):
     # Fetch the project
     project = Project.objects.get(id=project_id)
@@ -426,45 +553,23 @@ def delete_predecessor(request,task,id):
 
 
 def download_full_project_report_pdf(request, project_id):
-    project = Project.objects.prefetch_related('tasks').get(id=project_id)
+    project = Project.objects.get(id=project_id)
     tasks = project.tasks.all()
+    project.compute_schedule()
 
-    total_cost = sum(task.budget or 0 for task in tasks)
+    total_cost = project_evm(project.id)['bac']
     start_date = tasks.order_by('start_date').first().start_date
     end_date = tasks.order_by('-end_date').first().end_date
 
-    # Get latest CPM report
-    cpm_report = CPMReport.objects.filter(project=project).order_by('-created').first()
-    # If no CPMReport exists yet, generate it first
-    # if not cpm_report:
-    #     generate_cpm_report(request, project.id)
-    #     cpm_report = CPMReport.objects.filter(project=project).order_by('-created').first()
-
-    critical_path_image_url = cpm_report.cpm_graph.url if cpm_report and cpm_report.cpm_graph else None
-
-    # Generate Gantt images if missing
-    gantt_folder = os.path.join(settings.MEDIA_ROOT, 'gantt_pages', f'project_{project.id}')
-    if not os.path.exists(gantt_folder) or not os.listdir(gantt_folder):
-        os.makedirs(gantt_folder, exist_ok=True)
-        cpm_data = []
-        for task in tasks:
-            cpm_data.append({
-                "activity": task.name,
-                "predecessors": [pred.from_task.name for pred in task.predecessor_tasks.all()],
-                "duration": (task.end_date - task.start_date).days,
-                "es": task.early_start,
-                "ef": task.early_finish,
-                "ls": task.late_start,
-                "lf": task.late_finish,
-                "slack": task.slack,
-            })
-        draw_paginated_gantt_chart(cpm_data, save_folder=gantt_folder, page_size=100)
-
-    gantt_images = []
-    if os.path.exists(gantt_folder):
-        for filename in sorted(os.listdir(gantt_folder)):
-            if filename.endswith('.png'):
-                gantt_images.append(f'/media/gantt_pages/project_{project.id}/{filename}')
+    # Charts come from the chart cache, rendered when the schedule changed;
+    # SVG charts are inlined in the HTML, PNG ones are linked.
+    chart_format = request.GET.get('format', 'svg')
+    if chart_format not in chart_cache.FORMATS:
+        chart_format = 'svg'
+    report_input = chart_input(project, schedule_data(project))
+    network, *gantt_pages = embedded_charts(
+        report_input, [chart_unit(report_input, 'activity_graph', chart_format)] + gantt_units(report_input, chart_format),
+    )
 
     # Prepare context for HTML
     context = {
@@ -474,12 +579,17 @@ def download_full_project_report_pdf(request, project_id):
         'start_date': start_date,
         'end_date': end_date,
         'today': datetime.datetime.now().strftime('%Y-%m-%d'),
-        'critical_path_image_url': critical_path_image_url,
-        'gantt_images': gantt_images,
+        'network_chart': network,
+        'gantt_charts': gantt_pages,
     }
 
+    # Imported here: WeasyPrint loads Pango and friends, which only this view needs.
+    from weasyprint import HTML
+
     html_string = render_to_string('projects/full_project_report.html', context)
-    html = HTML(string=html_string, base_url=request.build_absolute_uri('/'))
+    html = HTML(
+        string=html_string, base_url=request.build_absolute_uri('/'), url_fetcher=LocalURLFetcher(request.get_host()),
+    )
     pdf_bytes = html.write_pdf()
 
     timestamp = datetime.datetime.now().strftime("%Y_%d_%m_%H_%M_%S")
@@ -0,0 +1,178 @@
+"""
+In-memory "what-if" scheduling.
+
+The project graph and its baseline schedule are loaded once and cached per
+schedule version (see ``projects.incremental.bump_version``), so repeated
+questions against an unchanged project never touch the database.  Overrides
+are applied to a copy of the cached inputs, the engine reruns, and only the
+tasks whose ES/EF/LS/LF/slack moved are returned.  Projects scheduled in
+working days are rerun in working days, so ``days`` and slack are working
+days there.
+
+Supported overrides (``task``/``from_task``/``to_task`` are Task ids):
+
+    {"type": "slip", "task": 12, "days": 5}          start at least N days later
+    {"type": "extend", "task": 12, "days": 3}        add N days to the duration
+    {"type": "duration", "task": 12, "days": 8}      set the duration
+    {"type": "remove_link", "from_task": 3, "to_task": 12}
+    {"type": "add_link", "from_task": 3, "to_task": 12, "start_type": 0, "lag": 0}
+"""
+import datetime
+
+import numpy as np
+from django.core.cache import cache
+
+from projects.calendars import from_workdays
+from projects.incremental import current_version
+from projects.schedule_engine import ScheduleGraph, schedule, FS
+from projects.schedule_vectorized import schedule_vectorized
+
+
+CACHE_TIMEOUT = 60 * 15
+VECTORIZE_TASKS = 5000
+
+
+class OverrideError(ValueError):
+    """An override refers to an unknown task or link, or is malformed."""
+
+
+def _run(keys, durations, release, finish, links):
+    graph = ScheduleGraph(keys, durations, links)
+    engine = schedule_vectorized if len(graph) >= VECTORIZE_TASKS else schedule
+    result = engine(graph, release=release, project_finish=finish)
+    # tolist() gives plain ints for the vectorized engine's numpy arrays too.
+    return (
+        result.es.tolist(), result.ef.tolist(), result.ls.tolist(), result.lf.tolist(),
+        int(result.project_duration),
+    )
+
+
+def load_baseline(project_id):
+    """Graph inputs and baseline schedule of a project, cached per version."""
+    from projects.models import Task, load_schedule_inputs
+
+    key = f"projects:whatif:{project_id}:{current_version(project_id)}"
+    baseline = cache.get(key)
+    if baseline is not None:
+        return baseline
+
+    inputs = load_schedule_inputs(project_id)
+    if inputs is None:
+        baseline = {'epoch': None, 'keys': []}
+        cache.set(key, baseline, CACHE_TIMEOUT)
+        return baseline
+    graph = inputs.graph
+    names = dict(Task.objects.filter(project_id=project_id).values_list('id', 'name'))
+    links = [
+        (graph.keys[u], graph.keys[graph.succ_idx[k]], graph.succ_type[k], graph.succ_lag[k])
+        for u in range(len(graph)) for k in range(graph.succ_ptr[u], graph.succ_ptr[u + 1])
+    ]
+    durations = graph.durations.tolist()
+    release = list(inputs.release)
+    baseline = {
+        'epoch': inputs.epoch,
+        # numpy.busdaycalendar does not pickle; keep what rebuilds it.
+        'calendar': None if inputs.calendar is None else (
+            inputs.calendar.weekmask.tolist(), inputs.calendar.holidays.tolist()),
+        'keys': graph.keys,
+        'names': [names.get(pk, '') for pk in graph.keys],
+        'durations': durations,
+        'release': release,
+        'finish': inputs.finish,
+        'links': links,
+        'schedule': _run(graph.keys, durations, release, inputs.finish, links),
+    }
+    cache.set(key, baseline, CACHE_TIMEOUT)
+    return baseline
+
+
+def apply_overrides(baseline, overrides):
+    """Return ``(durations, release, links)`` with ``overrides`` applied."""
+    index = {key: i for i, key in enumerate(baseline['keys'])}
+    durations = list(baseline['durations'])
+    release = list(baseline['release'])
+    links = {(link[0], link[1]): link for link in baseline['links']}
+    es = baseline['schedule'][0]
+
+    def position(value):
+        try:
+            return index[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise OverrideError(f"Unknown task: {value!r}")
+
+    if not isinstance(overrides, list) or not all(isinstance(override, dict) for override in overrides):
+        raise OverrideError("Overrides must be a list of objects.")
+    for override in overrides:
+        kind = override.get('type')
+        try:
+            if kind == 'slip':
+                v = position(override['task'])
+                release[v] = max(release[v], es[v] + int(override['days']))
+            elif kind == 'extend':
+                v = position(override['task'])
+                durations[v] = max(durations[v] + int(override['days']), 0)
+            elif kind == 'duration':
+                v = position(override['task'])
+                durations[v] = max(int(override['days']), 0)
+            elif kind == 'remove_link':
+                pair = (baseline['keys'][position(override['from_task'])], baseline['keys'][position(override['to_task'])])
+                if links.pop(pair, None) is None:
+                    raise OverrideError(f"Unknown link: {pair[0]} -> {pair[1]}")
+            elif kind == 'add_link':
+                pred = baseline['keys'][position(override['from_task'])]
+                succ = baseline['keys'][position(override['to_task'])]
+                links[(pred, succ)] = (pred, succ, int(override.get('start_type', FS)), int(override.get('lag', 0)))
+            else:
+                raise OverrideError(f"Unknown override type: {kind!r}")
+        except OverrideError:
+            raise
+        except KeyError as exc:
+            raise OverrideError(f"Override {kind!r} is missing {exc.args[0]!r}")
+        except (TypeError, ValueError):
+            raise OverrideError(f"Override {kind!r} has a field that is not an integer")
+    return durations, release, list(links.values())
+
+
+def what_if(project_id, overrides):
+    """
+    Rerun the schedule of a project with ``overrides`` applied in memory.
+
+    Returns a JSON-ready dict with the before/after project finish and the
+    tasks whose values changed.  Raises OverrideError or CycleError.
+    """
+    baseline = load_baseline(project_id)
+    if not baseline['keys']:
+        return {'finish': None, 'changes': []}
+    durations, release, links = apply_overrides(baseline, overrides)
+    after = _run(baseline['keys'], durations, release, baseline['finish'], links)
+    before = baseline['schedule']
+
+    epoch = baseline['epoch']
+    day = datetime.timedelta(days=1)
+    calendar = baseline['calendar'] and np.busdaycalendar(
+        weekmask=baseline['calendar'][0], holidays=np.array(baseline['calendar'][1], dtype='datetime64[D]'))
+
+    def date(offset):
+        if calendar:
+            return from_workdays(epoch, [offset], calendar)[0].isoformat()
+        return (epoch + offset * day).isoformat()
+
+    changes = []
+    fields = ('es', 'ef', 'ls', 'lf')
+    for v, key in enumerate(baseline['keys']):
+        old = [before[f][v] for f in range(4)]
+        new = [after[f][v] for f in range(4)]
+        if old == new:
+            continue
+        change = {'task': key, 'name': baseline['names'][v]}
+        for name, a, b in zip(fields, old, new):
+            if a != b:
+                change[name] = [date(a), date(b)]
+        if old[2] - old[0] != new[2] - new[0]:
+            change['slack'] = [old[2] - old[0], new[2] - new[0]]
+        changes.append(change)
+
+    return {
+        'finish': [date(before[4]), date(after[4])],
+        'changes': changes,
+    }
@@ -268,6 +268,15 @@ CELERY_RESULT_BACKEND = "redis://redis_task:6379/1"
 CELERY_TASK_SERIALIZER = CELERY_RESULT_SERIALIZER = "json"
 CELERY_ACCEPT_CONTENT = ["json"]
 
+from celery.schedules import crontab
+CELERY_BEAT_SCHEDULE = {
+    # Drops stale and least recently used rendered charts, see projects.chart_cache.
+    "evict-chart-cache": {
+        "task": "projects.tasks.evict_chart_cache",
+        "schedule": crontab(hour=3, minute=30),
+    },
+}
+
 # ─── Email ─────────────────────────────────────────────────────
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.environ["EMAIL_HOST"]       # example